@@ -0,0 +1,190 @@
+import numpy as np
+import soundfile as sf
+import soxr
+import librosa
+
+from perf_trace import span
+
+# Análisis de ritmo con memoria acotada: el audio se lee por bloques, se mezcla a mono,
+# se remuestrea a una frecuencia reducida y solo se conserva la envolvente de onsets
+# (unos pocos KB por minuto), sobre la que se calculan tempo y beats, y un resumen
+# tímbrico de un vector log-mel por segundo para detectar las secciones del tema.
+
+ANALYSIS_SR = 11025
+N_FFT = 1024
+HOP_LENGTH = 256
+N_MELS = 64
+BLOCK_SECONDS = 10.0
+# Resumen tímbrico (log-mel medio por ventana) para segmentar el track en secciones
+TIMBRE_SECONDS = 1.0
+
+
+class OnsetEnvelopeStream:
+    """Envolvente de onsets (flujo espectral en log-mel) calculada bloque a bloque.
+
+    Equivale a librosa.onset.onset_strength con center=True, pero sin necesitar la
+    señal completa: entre bloques solo se arrastran n_fft muestras y el último frame.
+    """
+
+    def __init__(self, sr=ANALYSIS_SR, n_fft=N_FFT, hop_length=HOP_LENGTH, n_mels=N_MELS):
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self._mel_basis = librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels).astype(np.float32)
+        self._window = np.hanning(n_fft + 1)[:-1].astype(np.float32)
+        # Relleno inicial de n_fft/2 ceros, como el centrado de librosa
+        self._tail = np.zeros(n_fft // 2, dtype=np.float32)
+        self._prev = None
+        # Mismo desfase que aplica librosa a la envolvente cuando center=True
+        self._chunks = [np.zeros(n_fft // (2 * hop_length), dtype=np.float32)]
+        self._samples = 0
+        self.timbre = TimbreSummary(sr, hop_length, n_mels)
+
+    def push(self, samples):
+        self._samples += len(samples)
+        buf = np.concatenate((self._tail, samples.astype(np.float32, copy=False)))
+        if len(buf) < self.n_fft:
+            self._tail = buf
+            return
+        n_frames = 1 + (len(buf) - self.n_fft) // self.hop_length
+        frames = np.lib.stride_tricks.sliding_window_view(buf, self.n_fft)[::self.hop_length][:n_frames]
+        spectrum = np.abs(np.fft.rfft(frames * self._window, axis=1)) ** 2
+        log_mel = librosa.power_to_db(spectrum @ self._mel_basis.T, top_db=None)
+        # El primer frame del track no tiene anterior: su flujo es 0
+        prev = self._prev if self._prev is not None else log_mel[:1]
+        flux = np.maximum(0.0, log_mel - np.vstack((prev, log_mel[:-1]))).mean(axis=1)
+        self._chunks.append(flux.astype(np.float32))
+        self.timbre.push(log_mel)
+        self._prev = log_mel[-1:]
+        self._tail = buf[n_frames * self.hop_length:]
+
+    def finish(self):
+        n_frames = 1 + self._samples // self.hop_length
+        self.push(np.zeros(self.n_fft // 2, dtype=np.float32))
+        return np.concatenate(self._chunks)[:n_frames]
+
+
+class TimbreSummary:
+    """Medias de los frames log-mel en ventanas de TIMBRE_SECONDS, acumuladas según llegan"""
+
+    def __init__(self, sr, hop_length, n_mels=N_MELS, seconds=TIMBRE_SECONDS):
+        self.group = max(1, int(round(seconds * sr / hop_length)))
+        self.hop = self.group * hop_length / sr
+        self._sum = np.zeros(n_mels, dtype=np.float64)
+        self._count = 0
+        self._rows = []
+
+    def push(self, log_mel):
+        while len(log_mel):
+            take = self.group - self._count
+            self._sum += log_mel[:take].sum(axis=0)
+            self._count += len(log_mel[:take])
+            log_mel = log_mel[take:]
+            if self._count == self.group:
+                self._rows.append(self._sum / self.group)
+                self._sum[:] = 0.0
+                self._count = 0
+
+    def finish(self):
+        """Matriz (ventanas x n_mels) en float32; la última ventana puede ser parcial"""
+        rows = self._rows + ([self._sum / self._count] if self._count else [])
+        return np.array(rows, dtype=np.float32).reshape(len(rows), len(self._sum))
+
+
+def estimate_tempo(onset_env, sr, hop_length, chunk_frames=8192, ac_size=8.0):
+    """Tempo global con el tempograma acumulado por bloques.
+
+    librosa.feature.tempo promedia el tempograma completo (ventana x frames), que crece
+    con la duración; aquí solo se guarda la suma por lag, así que la memoria es fija.
+    """
+    win_length = int(librosa.time_to_frames(ac_size, sr=sr, hop_length=hop_length))
+    if len(onset_env) <= chunk_frames:
+        return float(librosa.feature.tempo(onset_envelope=onset_env, sr=sr, hop_length=hop_length, ac_size=ac_size)[0])
+    total = np.zeros(win_length, dtype=np.float64)
+    count = 0
+    for start in range(0, len(onset_env) - win_length + 1, chunk_frames):
+        segment = onset_env[start:start + chunk_frames + win_length - 1]
+        tg = librosa.feature.tempogram(onset_envelope=segment, sr=sr, hop_length=hop_length,
+                                       win_length=win_length, center=False)
+        total += tg.sum(axis=1)
+        count += tg.shape[1]
+    tg_mean = (total / count)[:, np.newaxis]
+    return float(librosa.feature.tempo(tg=tg_mean, sr=sr, hop_length=hop_length, ac_size=ac_size)[0])
+
+
+def _features(onset_env, sr, hop_length, duration, timbre, streaming=True):
+    if streaming:
+        with span("audio.tempo", frames=len(onset_env)):
+            bpm = estimate_tempo(onset_env, sr, hop_length)
+        with span("audio.beat_track", frames=len(onset_env)) as stage:
+            _, beat_frames = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop_length, bpm=bpm)
+            stage["beats"] = len(beat_frames)
+    else:
+        with span("audio.beat_track", frames=len(onset_env)) as stage:
+            tempo, beat_frames = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop_length)
+            stage["beats"] = len(beat_frames)
+        bpm = float(np.mean(tempo))
+    return {
+        'duration': float(duration),
+        'bpm': bpm,
+        'beat_times': librosa.frames_to_time(beat_frames, sr=sr, hop_length=hop_length),
+        'onset_env': onset_env,
+        'sr': sr,
+        'hop_length': hop_length,
+        'timbre': timbre.finish(),
+        'timbre_hop': timbre.hop,
+    }
+
+
+def analyze_audio_stream(source, sr=ANALYSIS_SR, block_seconds=BLOCK_SECONDS):
+    """Duración, tempo y beats leyendo `source` (ruta o archivo) por bloques.
+
+    La memoria pico es independiente de la duración del track.
+    """
+    with span("audio.onset_envelope") as stage, sf.SoundFile(source) as f:
+        native_sr = f.samplerate
+        block_size = int(block_seconds * native_sr)
+        resampler = soxr.ResampleStream(native_sr, sr, 1, dtype='float32') if native_sr != sr else None
+        envelope = OnsetEnvelopeStream(sr=sr)
+        total = 0
+        while True:
+            block = f.read(block_size, dtype='float32', always_2d=True)
+            last = len(block) < block_size
+            total += len(block)
+            mono = block.mean(axis=1)
+            if resampler is not None:
+                mono = resampler.resample_chunk(mono, last=last)
+            if len(mono):
+                envelope.push(mono)
+            if last:
+                break
+        onset_env = envelope.finish()
+        stage.update(samples=total, sample_rate=native_sr)
+    return _features(onset_env, sr, envelope.hop_length, total / native_sr, envelope.timbre)
+
+
+def analyze_audio_full(source):
+    """Ruta original: carga completa a 22.05 kHz y beat_track sobre toda la señal"""
+    with span("audio.load_full") as stage:
+        y, sr = librosa.load(source)
+        stage["samples"] = len(y)
+    duration = librosa.get_duration(y=y, sr=sr)
+    with span("audio.onset_envelope", samples=len(y)):
+        onset_env = librosa.onset.onset_strength(y=y, sr=sr)
+    with span("audio.timbre", samples=len(y)):
+        timbre = TimbreSummary(sr, 512)
+        timbre.push(librosa.power_to_db(librosa.feature.melspectrogram(y=y, sr=sr, n_mels=N_MELS), top_db=None).T)
+    return _features(onset_env, sr, 512, duration, timbre, streaming=False)
+
+
+def analyze_audio(source):
+    """Rasgos de ritmo desde una ruta o un buffer en memoria (BytesIO), decodificando una sola vez"""
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    # Formatos que libsndfile no decodifica (p. ej. mp3 con libsndfile < 1.1) usan la ruta completa
+    try:
+        return analyze_audio_stream(source)
+    except (sf.LibsndfileError, RuntimeError):
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        return analyze_audio_full(source)
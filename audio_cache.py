@@ -0,0 +1,200 @@
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from perf_trace import span
+
+# Caché por hash del contenido del audio: rasgos de ritmo (BPM, duración, beats,
+# envolvente de onsets, resumen tímbrico) y el archivo ya subido a Gemini mientras no caduque.
+# Repetir el storyboard de la misma canción evita decodificar y volver a subirla.
+
+DEFAULT_AUDIO_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "audio_features.sqlite3")
+DEFAULT_MAX_TRACKS = 500
+
+# Margen antes de la caducidad real del archivo en Gemini (48 h por defecto)
+UPLOAD_EXPIRY_MARGIN = 600
+DEFAULT_UPLOAD_TTL = 48 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS features (
+    digest TEXT PRIMARY KEY,
+    duration REAL NOT NULL,
+    bpm REAL NOT NULL,
+    sr INTEGER NOT NULL,
+    hop_length INTEGER NOT NULL,
+    beat_times BLOB NOT NULL,
+    onset_env BLOB NOT NULL,
+    timbre BLOB,
+    timbre_hop REAL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_features_last_access ON features(last_access);
+CREATE TABLE IF NOT EXISTS uploads (
+    digest TEXT NOT NULL,
+    account TEXT NOT NULL,
+    name TEXT,
+    uri TEXT NOT NULL,
+    mime_type TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (digest, account)
+);
+"""
+
+
+def audio_digest(data):
+    """SHA-256 de los bytes del audio (bytes, bytearray o memoryview)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _account(api_key):
+    # Los archivos subidos pertenecen al proyecto de la API key; no se guarda en claro
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+class AudioFeatureStore:
+    def __init__(self, path=DEFAULT_AUDIO_CACHE_PATH, max_tracks=DEFAULT_MAX_TRACKS):
+        self.path = path
+        self.max_tracks = max_tracks
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        # Cachés creadas antes del resumen tímbrico: esas filas se leen sin él
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(features)")}
+        if "timbre" not in columns:
+            with self._conn:
+                self._conn.execute("ALTER TABLE features ADD COLUMN timbre BLOB")
+                self._conn.execute("ALTER TABLE features ADD COLUMN timbre_hop REAL")
+
+    def get_features(self, digest):
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT duration, bpm, sr, hop_length, beat_times, onset_env, timbre, timbre_hop "
+                "FROM features WHERE digest = ?",
+                (digest,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE features SET last_access = ? WHERE digest = ?", (time.time(), digest))
+        duration, bpm, sr, hop_length, beat_times, onset_env, timbre, timbre_hop = row
+        features = {
+            'duration': duration,
+            'bpm': bpm,
+            'beat_times': np.frombuffer(beat_times, dtype=np.float64),
+            'onset_env': np.frombuffer(onset_env, dtype=np.float32),
+            'sr': sr,
+            'hop_length': hop_length,
+        }
+        if timbre is not None:
+            features['timbre'] = np.load(io.BytesIO(timbre))
+            features['timbre_hop'] = timbre_hop
+        return features
+
+    def put_features(self, digest, features):
+        timbre = None
+        if features.get('timbre') is not None:
+            # np.save conserva la forma (ventanas x bandas) junto a los datos
+            buffer = io.BytesIO()
+            np.save(buffer, np.asarray(features['timbre'], dtype=np.float32))
+            timbre = buffer.getvalue()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO features(digest, duration, bpm, sr, hop_length, beat_times, onset_env, "
+                "timbre, timbre_hop, last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    digest,
+                    float(features['duration']),
+                    float(features['bpm']),
+                    int(features['sr']),
+                    int(features['hop_length']),
+                    np.asarray(features['beat_times'], dtype=np.float64).tobytes(),
+                    np.asarray(features['onset_env'], dtype=np.float32).tobytes(),
+                    timbre,
+                    features.get('timbre_hop'),
+                    time.time(),
+                ),
+            )
+            # LRU por número de tracks
+            self._conn.execute(
+                "DELETE FROM features WHERE digest IN (SELECT digest FROM features "
+                "ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_tracks,),
+            )
+
+    def get_upload(self, digest, api_key):
+        """Referencia (uri, mime_type) al archivo subido, o None si no existe o va a caducar"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT uri, mime_type, expires FROM uploads WHERE digest = ? AND account = ?",
+                (digest, _account(api_key)),
+            ).fetchone()
+        if row is None or row[2] - UPLOAD_EXPIRY_MARGIN <= time.time():
+            return None
+        return row[0], row[1]
+
+    def put_upload(self, digest, api_key, uploaded_file):
+        expiration = getattr(uploaded_file, "expiration_time", None)
+        expires = expiration.timestamp() if expiration else time.time() + DEFAULT_UPLOAD_TTL
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO uploads(digest, account, name, uri, mime_type, expires) VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, _account(api_key), uploaded_file.name, uploaded_file.uri, uploaded_file.mime_type, expires),
+            )
+            self._conn.execute("DELETE FROM uploads WHERE expires < ?", (time.time(),))
+
+    def forget_upload(self, digest, api_key):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM uploads WHERE digest = ? AND account = ?", (digest, _account(api_key)))
+
+
+def gemini_audio_file(client, api_key, audio_source, mime_type, digest=None, refresh=False):
+    """Archivo de audio listo para generate_content, reutilizando una subida vigente.
+
+    `audio_source` puede ser una ruta o un objeto tipo archivo (se sube desde memoria).
+    """
+    from google.genai import types
+
+    store = get_audio_store()
+    if digest and not refresh:
+        cached = store.get_upload(digest, api_key)
+        if cached is not None:
+            uri, cached_mime = cached
+            return types.Part.from_uri(file_uri=uri, mime_type=cached_mime), True
+    # Subir archivo usando el nuevo SDK (Google Gen AI)
+    with span("gemini.upload", mime_type=mime_type) as stage:
+        if hasattr(audio_source, "seek"):
+            audio_source.seek(0, os.SEEK_END)
+            stage["bytes"] = audio_source.tell()
+            audio_source.seek(0)
+            audio_file = client.files.upload(file=audio_source, config={'mime_type': mime_type})
+        else:
+            stage["bytes"] = os.path.getsize(audio_source)
+            with open(audio_source, "rb") as f:
+                audio_file = client.files.upload(file=f, config={'mime_type': mime_type})
+    if digest:
+        store.put_upload(digest, api_key, audio_file)
+    return audio_file, False
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_audio_store():
+    """Instancia compartida del proceso (ruta configurable con AUDIO_CACHE_PATH)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = AudioFeatureStore(
+                    os.environ.get("AUDIO_CACHE_PATH", DEFAULT_AUDIO_CACHE_PATH),
+                    int(os.environ.get("AUDIO_CACHE_MAX_TRACKS", DEFAULT_MAX_TRACKS)),
+                )
+    return _store
@@ -0,0 +1,246 @@
+import io
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from perf_trace import span, trace
+
+# Cola de trabajos de audio para lotes de pistas (un álbum completo): la decodificación y
+# el análisis de ritmo, que son CPU puro, se reparten en un pool de procesos (uno por
+# núcleo) y el storyboard de Gemini de cada pista se lanza en hilos con un límite de
+# concurrencia. La interfaz solo encola y consulta el estado: no se bloquea mientras tanto.
+
+# Procesos de análisis (AUDIO_JOB_WORKERS) y storyboards simultáneos (AUDIO_JOB_STORYBOARDS)
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_STORYBOARD_CONCURRENCY = 4
+
+# Trabajos terminados que se conservan para consultar su resultado
+MAX_FINISHED_JOBS = 200
+
+QUEUED, ANALYZING, STORYBOARDING, DONE, FAILED, CANCELLED = (
+    "queued", "analyzing", "storyboarding", "done", "failed", "cancelled")
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+def _analyze_track(data):
+    # Se ejecuta en el proceso hijo: librosa/numpy se importan allí, no en la app
+    from audio_analysis import analyze_audio
+
+    started = time.perf_counter()
+    features = analyze_audio(io.BytesIO(data))
+    return features, time.perf_counter() - started
+
+
+class AudioJob:
+    __slots__ = ("id", "batch", "name", "mime_type", "digest", "status", "error", "features", "slots",
+                 "sections", "storyboard", "submitted", "analysis_s", "storyboard_s", "finished", "future", "_data")
+
+    def __init__(self, job_id, batch, name, mime_type, digest, data):
+        self.id = job_id
+        self.batch = batch
+        self.name = name
+        self.mime_type = mime_type
+        self.digest = digest
+        self.status = QUEUED
+        self.error = None
+        self.features = None
+        self.slots = None
+        self.sections = None
+        self.storyboard = None
+        self.submitted = time.time()
+        self.analysis_s = None
+        self.storyboard_s = None
+        self.finished = None
+        self.future = None
+        self._data = data
+
+    def snapshot(self):
+        """Vista del trabajo para la interfaz (sin el audio ni los arrays de rasgos)"""
+        features = self.features or {}
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "error": self.error,
+            "bpm": features.get("bpm"),
+            "duration": features.get("duration"),
+            "slots": self.slots,
+            "sections": self.sections,
+            "storyboard": self.storyboard,
+            "analysis_s": self.analysis_s,
+            "storyboard_s": self.storyboard_s,
+            "elapsed_s": (self.finished or time.time()) - self.submitted,
+        }
+
+
+class AudioJobQueue:
+    def __init__(self, workers=DEFAULT_WORKERS, storyboard_concurrency=DEFAULT_STORYBOARD_CONCURRENCY):
+        self.workers = workers
+        self.storyboard_concurrency = storyboard_concurrency
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._process_pool = None
+        self._thread_pool = None
+
+    def _pools(self):
+        # Pools perezosos y persistentes: cada proceso paga la importación de librosa una vez.
+        # spawn en lugar de fork: el servidor de Streamlit tiene muchos hilos y un fork
+        # podría heredar locks tomados.
+        with self._lock:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+                self._thread_pool = ThreadPoolExecutor(
+                    max_workers=self.storyboard_concurrency, thread_name_prefix="audio-storyboard")
+            return self._process_pool, self._thread_pool
+
+    def submit(self, batch, name, data, mime_type, api_key=None):
+        """Encola una pista (bytes); con `api_key` se genera también su storyboard"""
+        from audio_cache import audio_digest, get_audio_store
+
+        digest = audio_digest(data)
+        with self._lock:
+            job = AudioJob(next(self._ids), batch, name, mime_type, digest, data)
+            self._jobs[job.id] = job
+            self._trim()
+        features = get_audio_store().get_features(digest)
+        if features is not None:
+            # Pista ya analizada (mismo contenido): se salta el pool de procesos
+            self._analyzed(job, api_key, features, 0.0)
+            return job.id
+        process_pool, _ = self._pools()
+        job.status = ANALYZING
+        job.future = process_pool.submit(_analyze_track, data)
+        job.future.add_done_callback(lambda future: self._on_analysis(job, api_key, future))
+        return job.id
+
+    def _on_analysis(self, job, api_key, future):
+        # Corre en el hilo de gestión del pool de procesos: solo se traspasa el resultado,
+        # el trabajo posterior (caché, planificación de tomas) va al pool de hilos
+        if future.cancelled():
+            self._finish(job, CANCELLED)
+            return
+        try:
+            _, thread_pool = self._pools()
+            thread_pool.submit(self._after_analysis, job, api_key, future)
+        except Exception as e:
+            self._finish(job, FAILED, f"Análisis de audio: {e}")
+
+    def _after_analysis(self, job, api_key, future):
+        from audio_cache import get_audio_store
+
+        try:
+            features, seconds = future.result()
+        except Exception as e:
+            self._finish(job, FAILED, f"Análisis de audio: {e}")
+            return
+        try:
+            get_audio_store().put_features(job.digest, features)
+        except Exception as e:
+            self._finish(job, FAILED, f"Caché de audio: {e}")
+            return
+        self._analyzed(job, api_key, features, seconds)
+
+    def _analyzed(self, job, api_key, features, seconds):
+        from shot_scheduler import detect_sections, schedule_shots
+
+        job.features = features
+        job.analysis_s = round(seconds, 3)
+        # Un fallo aquí debe cerrar el trabajo: si no, quedaría en curso para siempre
+        try:
+            job.slots = schedule_shots(features)
+            job.sections = detect_sections(features, job.slots)
+        except Exception as e:
+            self._finish(job, FAILED, f"Planificación de tomas: {e}")
+            return
+        if not api_key:
+            self._finish(job, DONE)
+            return
+        if job.status == CANCELLED:
+            return
+        try:
+            _, thread_pool = self._pools()
+            job.status = STORYBOARDING
+            job.future = thread_pool.submit(self._storyboard, job, api_key)
+        except Exception as e:
+            self._finish(job, FAILED, f"Storyboard: {e}")
+
+    def _storyboard(self, job, api_key):
+        from audio_storyboard import generate_storyboard
+
+        if job.status == CANCELLED:
+            return
+        started = time.perf_counter()
+        try:
+            with trace("audio_job"), span("audio_job.storyboard", track=job.name, slots=len(job.slots)):
+                job.storyboard = generate_storyboard(api_key, io.BytesIO(job._data), job.mime_type,
+                                                     job.features["duration"], audio_hash=job.digest,
+                                                     slots=job.slots, sections=job.sections)
+        except Exception as e:
+            self._finish(job, FAILED, f"Storyboard: {e}")
+            return
+        finally:
+            job.storyboard_s = round(time.perf_counter() - started, 3)
+        self._finish(job, DONE)
+
+    def _finish(self, job, status, error=None):
+        job.status = status
+        job.error = error
+        job.finished = time.time()
+        # El audio ya no hace falta: solo se conserva el resultado
+        job._data = None
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def jobs(self, batch):
+        """Estado de los trabajos del lote, en orden de envío"""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.batch == batch]
+        return [job.snapshot() for job in jobs]
+
+    def features(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job.features if job is not None else None
+
+    def cancel(self, batch):
+        """Cancela las pistas del lote que aún no han empezado (las que están en curso terminan)"""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.batch == batch and job.status not in FINISHED]
+        for job in jobs:
+            if job.future is not None and job.future.cancel() and job.status == STORYBOARDING:
+                self._finish(job, CANCELLED)
+            elif job.status == QUEUED:
+                self._finish(job, CANCELLED)
+
+    def shutdown(self):
+        with self._lock:
+            pools, self._process_pool, self._thread_pool = (self._process_pool, self._thread_pool), None, None
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Cola compartida del proceso (la usan todas las sesiones)"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = AudioJobQueue(
+                    int(os.environ.get("AUDIO_JOB_WORKERS", DEFAULT_WORKERS)),
+                    int(os.environ.get("AUDIO_JOB_STORYBOARDS", DEFAULT_STORYBOARD_CONCURRENCY)),
+                )
+    return _queue
@@ -0,0 +1,403 @@
+import json
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from gemini_models import GEMINI_MODELS, is_model_not_found
+from llm_clients import get_gemini_client
+from llm_engines import gemini_config, schema_rejected
+from llm_usage import USAGE, gemini_usage
+from perf_trace import run_in_context, span
+from resilience import PROVIDER_GUARD, backoff_delay, status_code
+from shot_schema import BIBLE_ONLY_SCHEMA, SECTION_SHOTS_SCHEMA, STORYBOARD_SCHEMA, JsonStreamParser, parse_json_response
+
+# Storyboard por audio con Gemini (sin dependencias de Streamlit): prompt, subida
+# reutilizable del audio y generación en streaming con sus reintentos. La app lo envuelve
+# con la gestión de secretos y errores de la interfaz.
+#
+# Los temas largos partidos en secciones (shot_scheduler.detect_sections) se generan en
+# dos pasadas: primero solo la biblia de producción y después una llamada por sección en
+# paralelo, todas sobre el mismo archivo subido, que se cosen en una única línea de tiempo.
+
+# Llamadas de sección simultáneas (AUDIO_SECTION_CONCURRENCY); el cupo de Gemini sigue
+# mandando a través de PROVIDER_GUARD
+DEFAULT_SECTION_CONCURRENCY = 8
+
+BIBLE_STEP = """
+        MANDATORY STEP 1: PRODUCTION BIBLE
+        Based on the lyrics, rhythm, and vibe, detect and define:
+        - LOCATION: Where is this taking place?
+        - CHARACTER: Who is the protagonist? (Physical traits)
+        - WARDROBE: What are they wearing?
+        - EPOCH: When is this happening? (Past, Present, Future, Specific Year)
+        """
+
+
+def storyboard_prompt(duration_seconds, slots=None, structured=True):
+    """(instrucciones fijas, petición variable) del storyboard por audio.
+
+    Las instrucciones solo dependen del modo (slots o secuencia libre, JSON o texto):
+    van en system_instruction y, seguidas del audio, forman un prefijo estable que
+    Gemini puede servir desde su caché al repetir el análisis.
+    """
+    if slots:
+        # Los cortes ya están calculados sobre la rejilla de beats: Gemini solo rellena cada slot
+        output_rule = ("Return exactly one entry in `shots` per slot, in order, using its slot number."
+                       if structured else
+                       "Output exactly one line per slot, in order, with this format and nothing else:\n"
+                       "        slot | Scene Action (English) | IMAGE PROMPT (no camera movement) | MOVEMENT PROMPT | Mood")
+        storyboard_step = f"""
+        MANDATORY STEP 2: STORYBOARD SLOTS
+        The cuts are already fixed on the beat grid. Fill in EVERY slot of the SLOTS table
+        given with the audio (slot | time | energy | suggested shot size).
+        {output_rule}
+        """
+    else:
+        storyboard_step = """
+        MANDATORY STEP 2: STORYBOARD SEQUENCE
+        Create a sequence of shots covering the entire duration of the audio.
+        For each shot, provide exactly:
+        1. Timestamp (e.g., 0:05)
+        2. Scene Action (English)
+        3. IMAGE PROMPT: Detailed visual description (No camera movement here)
+        4. MOVEMENT PROMPT: Specific technical camera movement instruction
+        5. Mood/Atmosphere
+        """
+
+    if structured:
+        formatting_rule = """
+        FORMATTING RULE:
+        Respond with a JSON object following the response schema: `bible` is the PRODUCTION BIBLE
+        and `shots` lists the storyboard shots in order.
+        """
+    else:
+        formatting_rule = """
+        FORMATTING RULE:
+        Start your response with a JSON-like block for the PRODUCTION BIBLE so I can parse it, then follow with the Markdown Storyboard.
+        Example:
+        ---PRODUCTION_BIBLE---
+        LOCATION: [Value]
+        CHARACTER: [Value]
+        WARDROBE: [Value]
+        EPOCH: [Value]
+        ---END_BIBLE---
+        """
+
+    instructions = f"""
+        Analyze the audio and create a COMPREHENSIVE cinematographic storyboard.
+        {BIBLE_STEP}{storyboard_step}{formatting_rule}
+        Maintain absolute visual consistency across all shots based on the PRODUCTION BIBLE.
+        """
+
+    # Duración legible para el prompt
+    request = f"Duration: {round(duration_seconds, 1)} seconds." if duration_seconds > 0 else ""
+    if slots:
+        from shot_scheduler import slot_table
+
+        request += f"\nSLOTS:\n{slot_table(slots)}"
+    return instructions, request
+
+
+def bible_prompt(duration_seconds):
+    """(instrucciones, petición) de la primera pasada por secciones: solo la biblia"""
+    instructions = f"""
+        Analyze the whole audio and define the PRODUCTION BIBLE of its music video.
+        {BIBLE_STEP}
+        Respond with a JSON object following the response schema: `bible` is the PRODUCTION BIBLE.
+        """
+    request = f"Duration: {round(duration_seconds, 1)} seconds." if duration_seconds > 0 else ""
+    return instructions, request
+
+
+def section_prompt(duration_seconds, bible, sections, section, slots=None):
+    """(instrucciones fijas, petición variable) del storyboard de una sección.
+
+    Las instrucciones solo dependen del modo (slots o secuencia libre), así que todas las
+    secciones comparten el prefijo instrucciones + audio; la biblia, la estructura del
+    tema y la ventana de la sección van en la petición.
+    """
+    from shot_scheduler import format_time, slot_table
+
+    if slots:
+        storyboard_step = """
+        The cuts are already fixed on the beat grid. Fill in EVERY slot of the SLOTS table
+        given with the request (slot | time | energy | suggested shot size).
+        Return exactly one entry in `shots` per slot, in order, using its slot number.
+        """
+    else:
+        storyboard_step = """
+        Create a sequence of shots covering the entire window of the section. For each shot
+        give its timestamp from the start of the track (e.g., 2:05), the scene action (English),
+        the IMAGE PROMPT (no camera movement), the MOVEMENT PROMPT and the mood.
+        """
+    instructions = f"""
+        Analyze the audio and create the cinematographic storyboard of ONE SECTION of the track:
+        only the time window given in the request. The other sections are storyboarded
+        separately and joined into a single timeline, so do not cover audio outside the window
+        and keep the narrative coherent with the position of the section in the song structure.
+        {storyboard_step}
+        Maintain absolute visual consistency with the PRODUCTION BIBLE given in the request.
+        Respond with a JSON object following the response schema: `shots` lists the storyboard
+        shots of the section in order.
+        """
+
+    structure = " | ".join(f"{s['index']}:{s['label']} {format_time(s['start'])}-{format_time(s['end'])}"
+                           for s in sections)
+    bible_lines = "\n".join(f"{key.upper()}: {value}" for key, value in bible.items())
+    request = (f"Duration: {round(duration_seconds, 1)} seconds.\n"
+               f"PRODUCTION BIBLE:\n{bible_lines}\n"
+               f"SONG STRUCTURE: {structure}\n"
+               f"SECTION {section['index']} of {len(sections)} ({section['label']}, {section['level']} energy): "
+               f"{format_time(section['start'])}-{format_time(section['end'])}")
+    if slots:
+        request += f"\nSLOTS:\n{slot_table(slots)}"
+    return instructions, request
+
+
+class _SharedUpload:
+    """Audio subido una sola vez para todas las llamadas de un storyboard.
+
+    Si Gemini borró el archivo antes de tiempo se vuelve a subir una vez, aunque lo
+    detecten a la vez varias secciones.
+    """
+
+    def __init__(self, client, api_key, audio_source, mime_type, audio_hash):
+        from audio_cache import gemini_audio_file
+
+        self._args = (client, api_key, audio_source, mime_type, audio_hash)
+        self._lock = threading.Lock()
+        # Se reutiliza la subida previa del mismo audio (mismo hash) mientras no caduque
+        self.file, _ = gemini_audio_file(*self._args)
+
+    def refresh(self, stale):
+        from audio_cache import gemini_audio_file, get_audio_store
+
+        with self._lock:
+            if self.file is stale:
+                _, api_key, _, _, audio_hash = self._args
+                get_audio_store().forget_upload(audio_hash, api_key)
+                self.file, _ = gemini_audio_file(*self._args, refresh=True)
+            return self.file
+
+
+def _file_missing(error, audio_file):
+    """403/404 que nombra al archivo subido: Gemini lo borró o caducó antes de tiempo"""
+    if status_code(error) not in (403, 404):
+        return False
+    # Subida nueva (File: name/uri) o reutilizada desde la caché (Part con file_data.file_uri)
+    file_data = getattr(audio_file, "file_data", None)
+    resource = " ".join(str(value) for value in (getattr(audio_file, "name", None), getattr(audio_file, "uri", None),
+                                                   getattr(file_data, "file_uri", None)) if value)
+    match = re.search(r"files/([\w-]+)", resource)
+    return match is not None and match.group(1) in str(error)
+
+
+def _stream_generate(client, api_key, upload, prompt, schema, on_text=None, text_fallback=True, **attrs):
+    """(texto, estructurado) de una llamada en streaming sobre el audio subido.
+
+    `prompt(structured)` da (instrucciones, petición). Si el modelo no acepta el esquema
+    se repite en texto con `text_fallback`; si no, el error se propaga.
+    """
+    structured = True
+
+    # Modelo ya resuelto para audio (sondeado en segundo plano al arrancar): sin 404 por petición
+    model_id = GEMINI_MODELS.resolve(api_key, "audio", client)
+    attempt = 0
+    reuploaded = False
+    while True:
+        parts = []
+        usage = None
+        instructions, request = prompt(structured)
+        audio_file = upload.file
+        # Cupo compartido de Gemini (CircuitOpen si el proveedor está degradado)
+        PROVIDER_GUARD.acquire("gemini", model_id)
+        started = time.perf_counter()
+        try:
+            # Cada intento es una etapa propia (reintentos por 404, esquema o subida caducada)
+            with span("gemini.generate", model=model_id, structured=structured, **attrs) as stage:
+                # Streaming: cada fragmento se entrega a on_text para pintar el storyboard progresivamente.
+                # Orden estable: instrucciones fijas, audio y, al final, lo que cambia (duración y slots)
+                for chunk in client.models.generate_content_stream(
+                    model=model_id,
+                    contents=[audio_file, request] if request else [audio_file],
+                    config=gemini_config(schema if structured else None, instructions)
+                ):
+                    if chunk.text:
+                        if not parts:
+                            stage["first_chunk_s"] = round(time.perf_counter() - started, 3)
+                        parts.append(chunk.text)
+                        if on_text:
+                            on_text(chunk.text)
+                    if chunk.usage_metadata is not None:
+                        usage = gemini_usage(chunk.usage_metadata)
+                stage["chars"] = sum(len(p) for p in parts)
+            PROVIDER_GUARD.settle("gemini", model_id)
+            USAGE.record("Gemini Audio", model_id, usage, time.perf_counter() - started)
+            return "".join(parts), structured
+        except Exception as e_model:
+            transient = PROVIDER_GUARD.settle("gemini", model_id, e_model)
+            # Archivo borrado o caducado en Gemini (venga o no de la caché): se vuelve a subir
+            # una vez y se reintenta el mismo modelo, antes de sospechar del modelo
+            if not parts and not reuploaded and _file_missing(e_model, audio_file):
+                upload.refresh(audio_file)
+                reuploaded = True
+                continue
+            # El modelo resuelto dejó de existir: se descarta y se pasa al siguiente candidato
+            if not parts and is_model_not_found(e_model, model_id):
+                model_id = GEMINI_MODELS.unavailable(api_key, "audio", model_id)
+                continue
+            # Modelo sin salida estructurada: mismo modelo con el formato de texto
+            if text_fallback and structured and not parts and schema_rejected(e_model):
+                structured = False
+                continue
+            # 429 / 5xx / timeout antes del primer fragmento: backoff y mismo intento
+            if transient and not parts and attempt < PROVIDER_GUARD.max_attempts - 1:
+                time.sleep(backoff_delay(attempt, e_model))
+                attempt += 1
+                continue
+            raise
+        except BaseException:
+            # Interrupción sin veredicto (p. ej. rerun de Streamlit desde on_text)
+            PROVIDER_GUARD.breaker("gemini").release()
+            raise
+
+
+def _generate_sections(client, api_key, upload, duration_seconds, sections, slots, on_text):
+    """Storyboard por secciones: biblia primero y secciones en paralelo, cosidas en orden.
+
+    Devuelve el mismo JSON que STORYBOARD_SCHEMA ({bible, shots}). Las tomas llegan a
+    `on_text` en orden de línea de tiempo, desde este hilo: las de una sección que acaba
+    antes que las anteriores esperan en memoria. Si falla alguna sección (no todas) el
+    JSON añade "section_errors" con su ventana y el error. None si el modelo no admite
+    el esquema.
+    """
+    from shot_scheduler import section_slots
+
+    try:
+        with span("storyboard.bible", sections=len(sections)):
+            text, _ = _stream_generate(client, api_key, upload, lambda structured: bible_prompt(duration_seconds),
+                                       BIBLE_ONLY_SCHEMA, text_fallback=False, section=0)
+    except Exception as e:
+        if schema_rejected(e):
+            return None
+        raise
+    bible = (parse_json_response(text) or {}).get("bible")
+    if not isinstance(bible, dict):
+        raise ValueError("Gemini no devolvió la biblia de producción.")
+
+    slots_by_section = section_slots(sections, slots) if slots else [None] * len(sections)
+    # Con slots, una sección sin ninguno no tiene nada que rellenar: no se pide
+    work = [(section, own) for section, own in zip(sections, slots_by_section) if not slots or own]
+    events = queue.Queue()
+
+    def _section(section, own_slots):
+        parser = JsonStreamParser()
+        numbers = {s['index'] for s in own_slots} if slots else None
+
+        def _take(delta):
+            for key, shot in parser.feed(delta):
+                # Con slots solo valen los de la sección: nada se solapa con las vecinas
+                if key == "shots" and isinstance(shot, dict) and (numbers is None or shot.get("slot") in numbers):
+                    events.put((section['index'], shot))
+
+        with span("storyboard.section", section=section['index'], label=section['label'],
+                  start=round(section['start'], 1), end=round(section['end'], 1)):
+            _stream_generate(client, api_key, upload,
+                             lambda structured: section_prompt(duration_seconds, bible, sections, section, own_slots),
+                             SECTION_SHOTS_SCHEMA, on_text=_take, text_fallback=False, section=section['index'])
+
+    # El prefijo y cada toma se emiten como fragmentos de un único objeto JSON
+    parts = []
+
+    def _emit(fragment):
+        parts.append(fragment)
+        if on_text:
+            on_text(fragment)
+
+    _emit('{"bible": ' + json.dumps(bible, ensure_ascii=False) + ', "shots": [')
+    buffered = {section['index']: [] for section in sections}
+    finished, errors = {section['index'] for section in sections} - {section['index'] for section, _ in work}, {}
+    current = 0
+    emitted = 0
+
+    def _flush():
+        nonlocal current, emitted
+        while current < len(sections):
+            index = sections[current]['index']
+            for shot in buffered[index]:
+                if not slots:
+                    # Secuencia libre: numeración global a lo largo de todo el tema
+                    shot["slot"] = emitted + 1
+                _emit((", " if emitted else "") + json.dumps(shot, ensure_ascii=False))
+                emitted += 1
+            buffered[index] = []
+            if index not in finished:
+                return
+            current += 1
+
+    def _drain():
+        while True:
+            try:
+                index, shot = events.get_nowait()
+            except queue.Empty:
+                return
+            buffered[index].append(shot)
+
+    concurrency = int(os.environ.get("AUDIO_SECTION_CONCURRENCY", DEFAULT_SECTION_CONCURRENCY))
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(sections))),
+                            thread_name_prefix="audio-section") as pool:
+        # Cada hilo hereda la traza activa (las etapas de cada sección cuelgan de la ejecución)
+        futures = {pool.submit(run_in_context(_section), section, own): section for section, own in work}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+            _drain()
+            for future in done:
+                section = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    # Una sección fallida deja sus slots vacíos; el resto del tema sigue
+                    errors[section['index']] = e
+                finished.add(section['index'])
+            _flush()
+    # Sin ninguna sección que pedir el storyboard queda vacío (solo la biblia), no es un error
+    if work and len(errors) == len(work):
+        raise next(iter(errors.values()))
+    if errors:
+        # Fallo parcial: el storyboard sale con huecos y se dice qué secciones faltan
+        section_errors = [{"section": s['index'], "label": s['label'], "start": round(s['start'], 1),
+                           "end": round(s['end'], 1), "error": str(errors[s['index']])}
+                          for s in sections if s['index'] in errors]
+        _emit('], "section_errors": ' + json.dumps(section_errors, ensure_ascii=False) + "}")
+    else:
+        _emit("]}")
+    return "".join(parts)
+
+
+def generate_storyboard(api_key, audio_source, mime_type, duration_seconds=0, on_text=None, audio_hash=None, slots=None,
+                        sections=None):
+    """Texto del storyboard (JSON de STORYBOARD_SCHEMA o formato de texto) para el audio.
+
+    Con dos o más `sections` (shot_scheduler.detect_sections) se genera por secciones en
+    paralelo. Lanza GeminiModelUnavailable si ningún modelo de audio está disponible y deja
+    pasar el resto de errores del proveedor. Cada fragmento se entrega a `on_text` según llega.
+    """
+    # Usando la nueva librería google-genai (cliente compartido del pool)
+    client = get_gemini_client(api_key)
+    upload = _SharedUpload(client, api_key, audio_source, mime_type, audio_hash)
+
+    if sections and len(sections) > 1:
+        with span("storyboard.sectioned", sections=len(sections)):
+            text = _generate_sections(client, api_key, upload, duration_seconds, sections, slots, on_text)
+        if text is not None:
+            return text
+
+    # JSON con esquema (biblia + tomas); si el modelo no acepta el esquema se repite en texto
+    text, _ = _stream_generate(client, api_key, upload,
+                               lambda structured: storyboard_prompt(duration_seconds, slots, structured),
+                               STORYBOARD_SCHEMA, on_text=on_text)
+    return text
@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from perf_trace import span, trace
+from prompt_engine import TARGET_ENGINES, generate_prompt
+from template_registry import get_templates
+
+# Ejes del producto cartesiano, en el orden en que se enumeran
+AXES = ("director", "lens", "stock", "movement", "angle", "engine")
+
+DEFAULT_SCENE = "Una estación espacial abandonada orbitando un sol moribundo"
+DEFAULT_CHARACTER = "Un veterano curtido con brazo mecánico"
+DEFAULT_WARDROBE = "Traje de vuelo desgastado"
+DEFAULT_COLOR = "Clásico Teal & Orange"
+
+
+def axis_values(templates=None):
+    """Valores completos de cada eje según las plantillas"""
+    templates = templates or get_templates()
+    return {
+        "director": list(templates["director_styles"].keys()),
+        "lens": list(templates["lens_presets"].keys()),
+        "stock": list(templates["film_stocks"]),
+        "movement": list(templates["camera_movements"].keys()),
+        "angle": list(templates["shot_angles"].keys()),
+        "engine": list(TARGET_ENGINES),
+    }
+
+
+def resolve_axes(filters=None, templates=None):
+    """Aplica filtros {eje: [claves]} sobre los ejes; valida claves desconocidas"""
+    axes = axis_values(templates)
+    for axis, wanted in (filters or {}).items():
+        if axis not in axes:
+            raise ValueError(f"Eje desconocido: {axis}")
+        if not wanted:
+            continue
+        unknown = [w for w in wanted if w not in axes[axis]]
+        if unknown:
+            raise ValueError(f"Valores desconocidos para {axis}: {unknown}")
+        axes[axis] = [v for v in axes[axis] if v in wanted]
+    return axes
+
+
+def count_combinations(axes):
+    total = 1
+    for axis in AXES:
+        total *= len(axes[axis])
+    return total
+
+
+def combination_at(axes, index):
+    """Combinación número `index` del producto (radix mixto, sin materializar el producto)"""
+    combo = {}
+    for axis in reversed(AXES):
+        values = axes[axis]
+        index, pos = divmod(index, len(values))
+        combo[axis] = values[pos]
+    return {axis: combo[axis] for axis in AXES}
+
+
+def iter_combinations(axes, start=0, stop=None):
+    stop = count_combinations(axes) if stop is None else stop
+    for index in range(start, stop):
+        yield combination_at(axes, index)
+
+
+def render_combination(combo, scene, character, wardrobe, color, templates=None):
+    templates = templates or get_templates()
+    json_output, _, _, _ = generate_prompt(
+        scene,
+        character,
+        wardrobe,
+        templates['color_palettes'][color],
+        templates['director_styles'][combo["director"]],
+        combo["lens"],
+        combo["stock"],
+        templates['camera_movements'][combo["movement"]],
+        combo["angle"],
+        templates['shot_angles'][combo["angle"]],
+        combo["engine"]
+    )
+    return {"preset": combo, **json_output}
+
+
+def _render_chunk(axes, start, stop, scene, character, wardrobe, color):
+    # Se ejecuta en el proceso hijo: devuelve el bloque ya serializado para no re-picklear dicts
+    lines = []
+    for combo in iter_combinations(axes, start, stop):
+        record = render_combination(combo, scene, character, wardrobe, color)
+        lines.append(json.dumps(record, ensure_ascii=False))
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def generate_batch(output, filters=None, scene=DEFAULT_SCENE, character=DEFAULT_CHARACTER,
+                   wardrobe=DEFAULT_WARDROBE, color=DEFAULT_COLOR, workers=None,
+                   chunk_size=2000, limit=None, progress=None):
+    """Escribe en `output` (archivo de texto abierto) una línea JSONL por combinación.
+
+    La memoria queda acotada a `workers * 2` bloques en vuelo; el orden de salida
+    es determinista. Devuelve estadísticas con el throughput (prompts/seg).
+    """
+    if color not in get_templates()["color_palettes"]:
+        raise ValueError(f"Paleta desconocida: {color}")
+    axes = resolve_axes(filters)
+    total = count_combinations(axes)
+    if limit is not None:
+        total = min(total, limit)
+    workers = workers or os.cpu_count() or 1
+    chunks = ((start, min(start + chunk_size, total)) for start in range(0, total, chunk_size))
+
+    started = time.perf_counter()
+    written = 0
+
+    def _emit(block, count):
+        nonlocal written
+        with span("batch.write", prompts=count, bytes=len(block)):
+            output.write(block)
+        written += count
+        if progress:
+            progress(written, total, time.perf_counter() - started)
+
+    if workers <= 1:
+        for start, stop in chunks:
+            _emit(_render_chunk(axes, start, stop, scene, character, wardrobe, color), stop - start)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = deque()
+            for start, stop in chunks:
+                in_flight.append((pool.submit(_render_chunk, axes, start, stop, scene, character, wardrobe, color), stop - start))
+                if len(in_flight) >= workers * 2:
+                    future, count = in_flight.popleft()
+                    _emit(future.result(), count)
+            while in_flight:
+                future, count = in_flight.popleft()
+                _emit(future.result(), count)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "prompts": written,
+        "seconds": round(elapsed, 3),
+        "prompts_per_sec": round(written / elapsed, 1) if elapsed > 0 else 0.0,
+        "workers": workers,
+    }
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generador de librerías de prompts (JSONL) sin Streamlit.")
+    parser.add_argument("output", nargs="?", default="-", help="Ruta del archivo JSONL de salida ('-' para stdout)")
+    parser.add_argument("--director", action="append", help="Filtra por firma de director (repetible)")
+    parser.add_argument("--lens", action="append", help="Filtra por lente (repetible)")
+    parser.add_argument("--stock", action="append", help="Filtra por película (repetible)")
+    parser.add_argument("--movement", action="append", help="Filtra por movimiento de cámara (repetible)")
+    parser.add_argument("--angle", action="append", help="Filtra por ángulo (repetible)")
+    parser.add_argument("--engine", action="append", help="Filtra por motor destino (repetible)")
+    parser.add_argument("--scene", default=DEFAULT_SCENE)
+    parser.add_argument("--character", default=DEFAULT_CHARACTER)
+    parser.add_argument("--wardrobe", default=DEFAULT_WARDROBE)
+    parser.add_argument("--color", default=DEFAULT_COLOR)
+    parser.add_argument("--workers", type=int, default=None, help="Procesos (por defecto: núcleos disponibles)")
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=None, help="Máximo de combinaciones a generar")
+    parser.add_argument("--count", action="store_true", help="Solo muestra el número de combinaciones")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    filters = {axis: getattr(args, axis) for axis in AXES}
+
+    if args.count:
+        print(count_combinations(resolve_axes(filters)))
+        return
+
+    def _progress(done, total, elapsed):
+        rate = done / elapsed if elapsed > 0 else 0.0
+        print(f"\r{done}/{total} prompts | {rate:,.0f} prompts/s", end="", file=sys.stderr)
+
+    # Traza de la ejecución en PERF_TRACE_LOG (etapa batch.generate + escrituras por bloque)
+    with trace("batch"), span("batch.generate") as stage:
+        if args.output == "-":
+            stats = generate_batch(sys.stdout, filters, args.scene, args.character, args.wardrobe,
+                                   args.color, args.workers, args.chunk_size, args.limit)
+        else:
+            with open(args.output, "w", encoding="utf-8") as out:
+                stats = generate_batch(out, filters, args.scene, args.character, args.wardrobe,
+                                       args.color, args.workers, args.chunk_size, args.limit, _progress)
+            print(file=sys.stderr)
+        stage.update(prompts=stats["prompts"], workers=stats["workers"])
+    print(json.dumps(stats), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Benchmark de análisis de ritmo: ruta completa (librosa.load + beat_track) frente a la
+# ruta por bloques, sobre click tracks sintéticos. Cada medición corre en un subproceso
+# para que el pico de RSS sea el de esa ruta y no el acumulado.
+
+DEFAULT_MINUTES = (1, 10, 60)
+
+
+def write_click_track(path, minutes, bpm=120.0, sr=22050, block_seconds=30.0):
+    """Escribe un click track a disco por bloques (sin tener el track entero en memoria)"""
+    click_len = int(0.03 * sr)
+    t = np.arange(click_len) / sr
+    click = (np.sin(2 * np.pi * 1000 * t) * np.exp(-t * 100)).astype(np.float32)
+    period = 60.0 / bpm
+    total = int(minutes * 60 * sr)
+    block = int(block_seconds * sr)
+    rng = np.random.default_rng(0)
+    with sf.SoundFile(path, "w", samplerate=sr, channels=1, subtype="PCM_16") as f:
+        for start in range(0, total, block):
+            n = min(block, total - start)
+            y = 0.01 * rng.standard_normal(n).astype(np.float32)
+            first_beat = int(np.ceil(start / sr / period))
+            for beat_time in np.arange(first_beat * period, (start + n) / sr, period):
+                i = int(round(beat_time * sr)) - start
+                end = min(n, i + click_len)
+                if 0 <= i < n:
+                    y[i:end] += click[:end - i]
+            f.write(y)
+    return path
+
+
+def _child(mode, path):
+    import audio_analysis
+
+    started = time.perf_counter()
+    if mode == "full":
+        features = audio_analysis.analyze_audio_full(path)
+    elif mode == "stream":
+        features = audio_analysis.analyze_audio_stream(path)
+    else:
+        features = None
+    elapsed = time.perf_counter() - started
+    # ru_maxrss está en KB en Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({
+        "wall_s": round(elapsed, 3),
+        "peak_rss_mb": round(peak_mb, 1),
+        "bpm": round(features["bpm"], 2) if features else None,
+        "beats": len(features["beat_times"]) if features else None,
+    }))
+
+
+def _measure(mode, path):
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode, path],
+                         check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def run(minutes=DEFAULT_MINUTES, workdir=None):
+    results = {"baseline": None, "tracks": []}
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for m in minutes:
+            path = write_click_track(os.path.join(tmp, f"click_{m}min.wav"), m)
+            if results["baseline"] is None:
+                # Primera pasada descartada: deja compilada la caché JIT (numba) de librosa
+                _measure("stream", path)
+                # Coste fijo de las importaciones, sin analizar nada
+                results["baseline"] = _measure("noop", path)
+            results["tracks"].append({
+                "minutes": m,
+                "full": _measure("full", path),
+                "stream": _measure("stream", path),
+            })
+            os.remove(path)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de análisis de audio: completo vs por bloques")
+    parser.add_argument("--minutes", type=float, nargs="+", default=list(DEFAULT_MINUTES))
+    parser.add_argument("--workdir", default=None, help="Directorio para los WAV temporales")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(*args.child)
+    else:
+        print(json.dumps(run(args.minutes, args.workdir), indent=2))
@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_clients import close_clients, get_openai_client  # noqa: E402
+
+# Latencia cliente frío (OpenAI(...) por llamada, como antes) frente al pool compartido,
+# contra un servidor local que imita /v1/chat/completions. --handshake-ms simula el
+# coste de establecer una conexión nueva (TLS) que el keep-alive del pool evita.
+
+CHAT_RESPONSE = {
+    "id": "chatcmpl-local",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4o-mini",
+    "choices": [{
+        "index": 0,
+        "message": {"role": "assistant", "content": "Max mira el abismo | Veterano curtido | Traje de vuelo"},
+        "finish_reason": "stop",
+    }],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+}
+
+
+def make_handler(handshake_s, latency_s):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            # Una vez por conexión TCP: simula el handshake TLS del proveedor
+            if handshake_s:
+                time.sleep(handshake_s)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(length)
+            if latency_s:
+                time.sleep(latency_s)
+            body = json.dumps(CHAT_RESPONSE).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def _call(client):
+    client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[{"role": "system", "content": "DP"}, {"role": "user", "content": "Guion"}],
+    )
+
+
+def _measure(make_client, requests):
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        _call(make_client())
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "mean_ms": round(statistics.mean(samples), 2),
+        "p50_ms": round(samples[len(samples) // 2], 2),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+    }
+
+
+def run(requests=50, handshake_ms=30.0, latency_ms=5.0):
+    from openai import OpenAI
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(handshake_ms / 1000, latency_ms / 1000))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    try:
+        cold = _measure(lambda: OpenAI(api_key="local", base_url=base_url), requests)
+        close_clients("openai")
+        _call(get_openai_client("local", base_url))  # calentamiento: abre la conexión
+        pooled = _measure(lambda: get_openai_client("local", base_url), requests)
+    finally:
+        close_clients("openai")
+        server.shutdown()
+    return {
+        "requests": requests,
+        "handshake_ms": handshake_ms,
+        "server_latency_ms": latency_ms,
+        "cold": cold,
+        "pooled": pooled,
+        "speedup_p50": round(cold["p50_ms"] / pooled["p50_ms"], 2) if pooled["p50_ms"] else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de clientes LLM: frío vs pool")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--handshake-ms", type=float, default=30.0)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    print(json.dumps(run(args.requests, args.handshake_ms, args.latency_ms), indent=2))
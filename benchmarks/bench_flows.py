@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Sin logs de consumo ni de trazas durante las mediciones
+os.environ.setdefault("LLM_USAGE_LOG", "")
+os.environ.setdefault("PERF_TRACE_LOG", "")
+
+from fake_llm import FAKE_SECRETS, FakeBehavior, fake_providers  # noqa: E402
+from fixtures import AUDIO_FIXTURES, sample_script  # noqa: E402
+from llm_engines import FASTEST_ENGINE  # noqa: E402
+from perf_trace import span, trace  # noqa: E402
+from script_analysis import analyze_scenes, split_scenes  # noqa: E402
+from shot_parsers import StoryboardStreamParser, parse_bible, storyboard_display_text  # noqa: E402
+from shot_schema import MOMENTS_SCHEMA  # noqa: E402
+
+# Tiempos de extremo a extremo de los flujos de guion y de audio contra proveedores
+# falsos (fake_llm) con latencia y tasa de fallos configurables. Cada ejecución se mide
+# con perf_trace, así que el resultado incluye el desglose por etapa.
+
+SCRIPT_ENGINES = ("GPT-5.2", "GPT-4o-mini (Fast)", "Gemini Flash (Free)", FASTEST_ENGINE)
+DEFAULT_AUDIO_SECONDS = (15, 60, 240)
+
+
+def _stages(trace_):
+    totals = {}
+    for s in trace_.spans:
+        totals[s["name"]] = round(totals.get(s["name"], 0.0) + s["duration_s"] * 1000, 3)
+    return totals
+
+
+def script_flow(engine, scenes, structured, behavior):
+    script = sample_script(scenes)
+    with fake_providers(behavior, behavior) as _, trace("script_analysis") as run:
+        scene_list = split_scenes(script)
+        moments, errors = analyze_scenes(scene_list, "Director de fotografía", engine, FAKE_SECRETS,
+                                         "Max", "Traje de vuelo", use_cache=False,
+                                         race_pool=["GPT-4o-mini (Fast)", "Gemini Flash (Free)"], hedge_delay=0.0,
+                                         schema=MOMENTS_SCHEMA if structured else None)
+    return {
+        "engine": engine,
+        "structured": structured,
+        "scenes": len(scene_list),
+        "wall_ms": round(run.duration * 1000, 2),
+        "moments": len(moments),
+        "limiter_wait_ms": _stages(run).get("provider.wait", 0.0),
+        "slot_wait_ms": _stages(run).get("provider.slot", 0.0),
+        "scene_errors": len(errors),
+        "provider_calls": behavior.calls,
+        "provider_failures": behavior.failures,
+        "stages_ms": _stages(run),
+    }
+
+
+def audio_flow(fixture, seconds, behavior):
+    from audio_analysis import analyze_audio
+    from audio_storyboard import generate_storyboard
+    from shot_scheduler import detect_sections, merge_storyboard, schedule_shots
+
+    audio = AUDIO_FIXTURES[fixture](seconds)
+    with fake_providers(behavior, behavior), trace("storyboard") as run:
+        features = analyze_audio(audio)
+        with span("audio.schedule") as stage:
+            slots = schedule_shots(features)
+            stage["slots"] = len(slots)
+        with span("audio.sections") as stage:
+            sections = detect_sections(features, slots)
+            stage["sections"] = len(sections)
+        parser = StoryboardStreamParser()
+        # Mismo camino que la app: subida, reintentos, cambio de modelo y secciones en
+        # paralelo. Sin hash: siempre se sube (la caché de subidas se mide aparte en la app)
+        full_text = generate_storyboard(FAKE_SECRETS["GOOGLE_API_KEY"], audio, "audio/wav", features["duration"],
+                                        on_text=parser.feed, slots=slots, sections=sections)
+        with span("storyboard.parse", chars=len(full_text)):
+            bible = parse_bible(full_text)
+            merged = merge_storyboard(slots, storyboard_display_text(full_text))
+    return {
+        "fixture": fixture,
+        "seconds": seconds,
+        "wall_ms": round(run.duration * 1000, 2),
+        "bpm": round(features["bpm"], 2),
+        "slots": len(slots),
+        "sections": len(sections),
+        "provider_calls": behavior.calls,
+        "limiter_wait_ms": _stages(run).get("provider.wait", 0.0),
+        "slot_wait_ms": _stages(run).get("provider.slot", 0.0),
+        "bible_fields": len(bible),
+        "merged_chars": len(merged or ""),
+        "stages_ms": _stages(run),
+    }
+
+
+def run(scenes=6, audio_seconds=DEFAULT_AUDIO_SECONDS, latency_ms=50.0, failure_rate=0.0, seed=0,
+        skip_audio=False):
+    def behavior():
+        return FakeBehavior(latency_s=latency_ms / 1000, failure_rate=failure_rate, seed=seed)
+
+    results = {"latency_ms": latency_ms, "failure_rate": failure_rate, "script": [], "audio": []}
+    for engine in SCRIPT_ENGINES:
+        for structured in (True, False):
+            results["script"].append(script_flow(engine, scenes, structured, behavior()))
+    if not skip_audio:
+        # Primera pasada descartada: compila la caché JIT (numba) de librosa
+        audio_flow("click", 5, FakeBehavior(latency_s=0.0))
+        for fixture in AUDIO_FIXTURES:
+            for seconds in audio_seconds:
+                results["audio"].append(audio_flow(fixture, seconds, behavior()))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flujos de guion y audio contra proveedores falsos")
+    parser.add_argument("--scenes", type=int, default=6)
+    parser.add_argument("--audio-seconds", type=float, nargs="+", default=list(DEFAULT_AUDIO_SECONDS))
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-audio", action="store_true")
+    args = parser.parse_args()
+    print(json.dumps(run(args.scenes, args.audio_seconds, args.latency_ms, args.failure_rate, args.seed,
+                         args.skip_audio), indent=2))
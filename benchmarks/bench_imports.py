@@ -0,0 +1,69 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Presupuesto de arranque en frío de la app: tiempo de importación (python -X importtime)
+# de cinematography_assistant descontando el de streamlit, y comprobación de que las
+# dependencias pesadas no se cargan hasta que se usa la pestaña o el proveedor que las necesita.
+
+APP_MODULE = "cinematography_assistant"
+BASELINE_MODULE = "streamlit"
+
+# Paquetes que no deben importarse al arrancar la app
+HEAVY_MODULES = ("librosa", "numpy", "soundfile", "soxr", "scipy", "numba",
+                 "openai", "httpx", "google.genai", "google.generativeai")
+
+# Presupuesto por defecto (ms) del coste propio de la app sobre streamlit
+DEFAULT_BUDGET_MS = 200.0
+
+
+def import_time_ms(module):
+    """Tiempo acumulado de importación de `module` en un intérprete nuevo (ms)"""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         cwd=ROOT, check=True, capture_output=True, text=True)
+    for line in out.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if line.startswith("import time:") and line.rsplit("|", 1)[-1].strip() == module:
+            return int(line.split("|")[1]) / 1000
+    raise RuntimeError(f"{module} no aparece en la salida de -X importtime")
+
+
+def loaded_heavy_modules(module=APP_MODULE):
+    code = (f"import sys, json, {module}; "
+            f"print(json.dumps(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def run(repeat=5, budget_ms=DEFAULT_BUDGET_MS):
+    # Primera pasada descartada: calienta la caché de bytecode y la del sistema de archivos
+    import_time_ms(APP_MODULE)
+    app = statistics.median(import_time_ms(APP_MODULE) for _ in range(repeat))
+    baseline = statistics.median(import_time_ms(BASELINE_MODULE) for _ in range(repeat))
+    heavy = loaded_heavy_modules()
+    overhead = app - baseline
+    return {
+        "app_ms": round(app, 1),
+        "streamlit_ms": round(baseline, 1),
+        "overhead_ms": round(overhead, 1),
+        "budget_ms": budget_ms,
+        "heavy_modules_loaded": heavy,
+        "ok": overhead <= budget_ms and not heavy,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tiempo de importación de la app frente a un presupuesto")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="Máximo coste de importación propio de la app (sin streamlit)")
+    args = parser.parse_args()
+    result = run(args.repeat, args.budget_ms)
+    print(json.dumps(result, indent=2))
+    # Código de salida distinto de 0 ante una regresión, para usarlo en CI
+    sys.exit(0 if result["ok"] else 1)
@@ -0,0 +1,82 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+# Benchmark de la cola de audio (audio_jobs): throughput del análisis de ritmo de un lote
+# de pistas según el número de procesos del pool. Sin storyboard (no hay red); cada
+# configuración usa una caché de rasgos vacía y pistas distintas.
+
+DEFAULT_TRACKS = 8
+DEFAULT_SECONDS = 60.0
+
+
+def _wait(queue, batch):
+    from audio_jobs import FINISHED
+
+    while True:
+        jobs = queue.jobs(batch)
+        if all(job["status"] in FINISHED for job in jobs):
+            return jobs
+        time.sleep(0.05)
+
+
+def measure(workers, tracks, seconds):
+    from audio_jobs import AudioJobQueue
+    from fixtures import click_track
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ["AUDIO_CACHE_PATH"] = os.path.join(cache_dir, "audio_cache.sqlite3")
+        import audio_cache
+
+        audio_cache._store = None
+        queue = AudioJobQueue(workers=workers)
+        try:
+            # Calentamiento fuera de la medición: importación de librosa y JIT en cada proceso
+            for n in range(workers):
+                queue.submit("warmup", f"warmup-{n}", click_track(2, seed=1000 + n).getvalue(), "audio/wav")
+            _wait(queue, "warmup")
+
+            data = [click_track(seconds, seed=n).getvalue() for n in range(tracks)]
+            started = time.perf_counter()
+            for n, track in enumerate(data):
+                queue.submit("bench", f"track-{n}", track, "audio/wav")
+            jobs = _wait(queue, "bench")
+            wall_s = time.perf_counter() - started
+        finally:
+            queue.shutdown()
+            audio_cache._store = None
+    return {
+        "workers": workers,
+        "tracks": tracks,
+        "track_seconds": seconds,
+        "wall_s": round(wall_s, 3),
+        "tracks_per_s": round(tracks / wall_s, 3),
+        "failed": sum(job["status"] != "done" for job in jobs),
+    }
+
+
+def run(workers=None, tracks=DEFAULT_TRACKS, seconds=DEFAULT_SECONDS):
+    cpus = os.cpu_count() or 1
+    workers = workers or sorted({1, 2, 4, cpus} & set(range(1, cpus + 1)))
+    results = [measure(w, tracks, seconds) for w in workers]
+    base = results[0]["tracks_per_s"]
+    for result in results:
+        result["speedup"] = round(result["tracks_per_s"] / base, 2) if base else None
+    return {"cpus": cpus, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput del análisis de lotes de pistas por número de procesos")
+    parser.add_argument("--workers", type=int, nargs="+", help="Tamaños de pool a medir (por defecto 1, 2, 4 y núcleos)")
+    parser.add_argument("--tracks", type=int, default=DEFAULT_TRACKS)
+    parser.add_argument("--seconds", type=float, default=DEFAULT_SECONDS, help="Duración de cada pista")
+    args = parser.parse_args()
+    print(json.dumps(run(args.workers, args.tracks, args.seconds), indent=2))
@@ -0,0 +1,67 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_llm import moments_text, storyboard_text  # noqa: E402
+from shot_parsers import (MomentStreamParser, StoryboardStreamParser, parse_bible,  # noqa: E402
+                          parse_moments, storyboard_display_text)
+
+# Micro-benchmarks de los parsers de respuestas: filas '|' y JSON, completos y en
+# streaming (fragmentos del tamaño típico de un delta de los SDK).
+
+
+def _best_us(fn, arg, repeat, number):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn(arg)
+        best = min(best, time.perf_counter() - started)
+    return round(best / number * 1e6, 2)
+
+
+def _chunks(text, size=24):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _stream_moments(chunks):
+    parser = MomentStreamParser()
+    for delta in chunks:
+        parser.feed(delta)
+    parser.close()
+
+
+def _stream_storyboard(chunks):
+    parser = StoryboardStreamParser()
+    for delta in chunks:
+        parser.feed(delta)
+
+
+def run(repeat=5, number=200, shots=48):
+    cases = {}
+    for structured in (False, True):
+        fmt = "json" if structured else "rows"
+        moments = moments_text(5, structured)
+        storyboard = storyboard_text(shots, structured)
+        cases[f"parse_moments.{fmt}"] = (lambda t: parse_moments(t), moments)
+        cases[f"stream_moments.{fmt}"] = (_stream_moments, _chunks(moments))
+        cases[f"parse_bible.{fmt}"] = (parse_bible, storyboard)
+        cases[f"storyboard_display.{fmt}"] = (storyboard_display_text, storyboard)
+        cases[f"stream_storyboard.{fmt}"] = (_stream_storyboard, _chunks(storyboard))
+    return {
+        "shots": shots,
+        "us_per_call": {name: _best_us(fn, arg, repeat, number) for name, (fn, arg) in cases.items()},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de los parsers de respuestas")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument("--shots", type=int, default=48)
+    args = parser.parse_args()
+    print(json.dumps(run(args.repeat, args.number, args.shots), indent=2))
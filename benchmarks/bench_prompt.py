@@ -0,0 +1,144 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompt_engine import generate_prompt  # noqa: E402
+from template_registry import get_templates  # noqa: E402
+
+# Micro-benchmark: generate_prompt compilado (registro + join) frente a la versión
+# original con comprobaciones por subcadena y f-strings reconstruidos en cada llamada.
+
+
+# Copia literal de la implementación anterior, solo como línea base
+def legacy_generate_prompt(scene, character, wardrobe, color, director, lens, stock, movement, angle_name, angle_desc, engine):
+    # Mapping técnico
+    is_anamorphic = "Anamórfico" in lens or "Anamorphic" in lens
+    aspect_ratio = "2.76:1 (Ultra Panavision)" if is_anamorphic else "1.43:1 (IMAX Full)"
+    
+    technical_details = f"Shot on IMAX MSM 9802 15/70mm film, {lens} lenses, {stock} film stock. Aspect ratio {aspect_ratio}."
+    
+    # Anclas de Consistencia Blindada (EN)
+    # Forced visual consistency for image generators
+    consistency_block = (
+        f"CHARACTER CONTINUITY: {character}. "
+        f"WARDROBE CONSISTENCY: {wardrobe}. "
+        f"COLOR SCHEME: {color}. "
+        "Maintain identical facial features and identical clothing textures across shots."
+    )
+    
+    # Optimización del Motor
+    engine_suffix = ""
+    if engine == "Midjourney":
+        ratio = "2.76:1" if is_anamorphic else "1.43:1"
+        engine_suffix = f" --ar {ratio} --v 6 --stylize 250"
+    elif engine == "DALL-E 3":
+        engine_suffix = " Wide-screen cinematic mode, hyper-photorealistic, maintain exact visual continuity with previous frames."
+
+    # Prompt final de Imagen (Sin movimiento)
+    image_prompt = (
+        f"{angle_name}: {scene}. {angle_desc}. "
+        f"{consistency_block} {director}. {technical_details}. "
+        f"Key visual traits: {'oval bokeh, horizontal lens flares, ' if is_anamorphic else ''}"
+        f"extreme detail, naturalistic grain, high dynamic range, 12k resolution texture, visceral atmosphere.{engine_suffix}"
+    )
+
+    # Prompt de Movimiento de Cámara (Específico)
+    movement_prompt = f"CAMERA MOVEMENT: {movement}. Technical execution: {angle_name} logic. Ensure smooth cinematic flow."
+    
+    # Lógica de Iluminación para Mermaid
+    diagram = f"graph TD\n    CAM[Cámara IMAX] --- SUB[({character})]\n"
+    if "Natural" in director or "Deakins" in director or "Naturalista" in director:
+        diagram += "    SUN[Fuente de Luz Natural] --> SUB\n    BOUNCE[Rebotador Muslin] --> SUB"
+    elif "Richardson" in director:
+        diagram += "    HALO[Luz Halo Cenital] --> SUB\n    BACK[Contraluz de Recorte] --> SUB"
+    elif "Spielberg" in director:
+        diagram += "    BLOOM[Luz Sobreexpuesta (Haze)] --> SUB\n    BACK[Contraluz Fuerte] --> SUB"
+    elif "Ridley Scott" in director:
+        diagram += "    FIRE[Luz de Fuego/Velas] --> SUB\n    SIDE[Luz Lateral Natural] --> SUB"
+    else:
+        diagram += "    KEY[Luz Principal] --> SUB\n    FILL[Luz de Relleno] --> SUB\n    RIM[Luz de Recorte] --> SUB"
+
+    json_output = {
+        "cinematógrafo": "Asistente IMAX Antigravity V2",
+        "tipo_de_toma": angle_name,
+        "movimiento": movement,
+        "motor_optimizado": engine,
+        "descripcion": scene,
+        "datos_de_consistencia": {
+            "rasgos_personaje": character,
+            "vestuario": wardrobe,
+            "paleta_color": color
+        },
+        "stack_tecnico": {
+            "formato": "IMAX 70mm (15-perf)",
+            "lente": lens,
+            "pelicula": stock,
+            "relacion_aspecto": aspect_ratio
+        },
+        "intencion_director": director,
+        "esquema_iluminacion": diagram,
+        "prompt_imagen": image_prompt,
+        "prompt_movimiento": movement_prompt
+    }
+    return json_output, image_prompt, movement_prompt, diagram
+
+
+def _sample_calls(templates):
+    calls = []
+    for director in templates["director_styles"].values():
+        for lens in templates["lens_presets"]:
+            for angle, angle_desc in templates["shot_angles"].items():
+                for engine in ("Meta AI / Grok", "Midjourney", "DALL-E 3"):
+                    calls.append((
+                        "Una estación espacial abandonada orbitando un sol moribundo",
+                        "Un veterano curtido con brazo mecánico",
+                        "Traje de vuelo desgastado",
+                        templates["color_palettes"]["Clásico Teal & Orange"],
+                        director,
+                        lens,
+                        templates["film_stocks"][0],
+                        templates["camera_movements"]["Dolly In (Acercamiento)"],
+                        angle,
+                        angle_desc,
+                        engine,
+                    ))
+    return calls
+
+
+def _time_per_call(fn, calls, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for args in calls:
+            fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best / len(calls)
+
+
+def run(repeat=5):
+    calls = _sample_calls(get_templates())
+    # Las salidas de texto deben coincidir (el diagrama puede diferir: el rig ahora se
+    # resuelve por preset de director y no solo por la descripción)
+    mismatches = sum(
+        1 for args in calls
+        if legacy_generate_prompt(*args)[1:3] != generate_prompt(*args)[1:3]
+    )
+    legacy = _time_per_call(legacy_generate_prompt, calls, repeat)
+    compiled = _time_per_call(generate_prompt, calls, repeat)
+    return {
+        "calls": len(calls),
+        "legacy_us_per_prompt": round(legacy * 1e6, 3),
+        "compiled_us_per_prompt": round(compiled * 1e6, 3),
+        "speedup": round(legacy / compiled, 2) if compiled else None,
+        "prompt_mismatches": mismatches,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de generate_prompt (legacy vs compilado)")
+    parser.add_argument("--repeat", type=int, default=5)
+    print(json.dumps(run(parser.parse_args().repeat), indent=2))
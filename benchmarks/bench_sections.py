@@ -0,0 +1,92 @@
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+# Sin logs de consumo ni de trazas durante la medición
+os.environ.setdefault("LLM_USAGE_LOG", "")
+os.environ.setdefault("PERF_TRACE_LOG", "")
+
+from fixtures import click_track  # noqa: E402
+from standin_server import StandInSettings, start_server  # noqa: E402
+
+# Storyboard de un tema largo en una sola llamada frente a por secciones en paralelo
+# (biblia primero y una llamada por sección), contra el servidor local con el SDK real.
+# El stand-in genera a un ritmo fijo por fragmento, así que el tiempo de la llamada única
+# crece con el número de slots y el de la versión por secciones con la sección más larga.
+# El cupo de Gemini se abre (nivel de pago) para medir el paralelismo y no el límite.
+
+DEFAULT_SECONDS = 600.0
+SECRETS = {"GOOGLE_API_KEY": "standin-google"}
+
+
+def measure(features, audio, sectioned):
+    from audio_storyboard import generate_storyboard
+    from shot_parsers import StoryboardStreamParser
+    from shot_scheduler import detect_sections, schedule_shots
+
+    slots = schedule_shots(features)
+    sections = detect_sections(features, slots) if sectioned else None
+    parser = StoryboardStreamParser()
+    first = []
+    started = time.perf_counter()
+
+    def on_text(delta):
+        parser.feed(delta)
+        if parser.story_lines and not first:
+            first.append(time.perf_counter() - started)
+
+    text = generate_storyboard(SECRETS["GOOGLE_API_KEY"], audio, "audio/wav", features["duration"],
+                               on_text=on_text, audio_hash="bench-sections", slots=slots, sections=sections)
+    wall_s = time.perf_counter() - started
+    filled = {int(line.split(" | ", 1)[0]) for line in parser.story_lines if line.split(" | ", 1)[0].isdigit()}
+    return {
+        "mode": "sections" if sectioned else "single",
+        "sections": len(sections or [None]),
+        "slots": len(slots),
+        "filled_slots": len(filled & {s["index"] for s in slots}),
+        "first_shot_s": round(first[0], 3) if first else None,
+        "wall_s": round(wall_s, 3),
+        "chars": len(text),
+    }
+
+
+def run(seconds=DEFAULT_SECONDS, latency_ms=800.0, chunk_ms=60.0):
+    server, _, base_url = start_server(StandInSettings(latency_ms=latency_ms, jitter_ms=0.0, chunk_ms=chunk_ms))
+    os.environ["GEMINI_BASE_URL"] = base_url
+    os.environ.setdefault("LLM_GEMINI_RPM", "2000")
+    os.environ.setdefault("LLM_GEMINI_BURST", "50")
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            os.environ["AUDIO_CACHE_PATH"] = os.path.join(cache_dir, "audio_cache.sqlite3")
+            from audio_analysis import analyze_audio
+
+            audio = io.BytesIO(click_track(seconds).getvalue())
+            features = analyze_audio(audio)
+            # La subida queda en caché tras la primera medición: ambas la reutilizan
+            results = [measure(features, audio, sectioned) for sectioned in (False, True, False, True)][2:]
+    finally:
+        server.shutdown()
+    single, sectioned = results
+    return {
+        "track_seconds": seconds,
+        "results": results,
+        "speedup": round(single["wall_s"] / sectioned["wall_s"], 2) if sectioned["wall_s"] else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Storyboard de un tema largo: llamada única frente a secciones en paralelo")
+    parser.add_argument("--seconds", type=float, default=DEFAULT_SECONDS, help="Duración del tema")
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="Espera hasta el primer byte")
+    parser.add_argument("--chunk-ms", type=float, default=60.0, help="Pausa entre fragmentos del stream")
+    args = parser.parse_args()
+    print(json.dumps(run(args.seconds, args.latency_ms, args.chunk_ms), indent=2))
@@ -0,0 +1,299 @@
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+# Clientes falsos de OpenAI y Gemini para medir los flujos sin red: imitan la forma de
+# las respuestas de los SDK (responses / chat.completions / models / files), con latencia
+# hasta el primer fragmento, tiempo por fragmento y tasa de fallos configurables.
+
+
+class FakeProviderError(RuntimeError):
+    """Error transitorio simulado (p. ej. 503 del proveedor)"""
+
+    def __init__(self, message="fake provider overloaded", status_code=503):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = status_code
+
+
+class FakeBehavior:
+    """Latencia, fallos y tamaño de respuesta de un proveedor falso (reproducible por semilla)"""
+
+    def __init__(self, latency_s=0.05, jitter_s=0.0, chunk_delay_s=0.002, chunk_chars=24,
+                 failure_rate=0.0, moments=5, shots=12, seed=0, fail_after_chunks=None, fail_sections=()):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.chunk_delay_s = chunk_delay_s
+        self.chunk_chars = chunk_chars
+        self.failure_rate = failure_rate
+        self.moments = moments
+        self.shots = shots
+        # Corta el stream con un 503 tras ese número de fragmentos (fallo a mitad de respuesta)
+        self.fail_after_chunks = fail_after_chunks
+        # Secciones de storyboard ('SECTION n of ...') cuyas peticiones fallan siempre
+        self.fail_sections = set(fail_sections)
+        self.section_requests = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.chunks_sent = 0
+
+    def start(self):
+        """Espera del primer byte; lanza FakeProviderError según failure_rate"""
+        with self._lock:
+            self.calls += 1
+            delay = self.latency_s + (self._rng.uniform(0, self.jitter_s) if self.jitter_s else 0.0)
+            failed = self._rng.random() < self.failure_rate
+            self.failures += int(failed)
+        if delay:
+            time.sleep(delay)
+        if failed:
+            raise FakeProviderError()
+
+    def chunks(self, text):
+        for i in range(0, len(text), self.chunk_chars):
+            if i and self.chunk_delay_s:
+                time.sleep(self.chunk_delay_s)
+            if self.fail_after_chunks is not None and i >= self.fail_after_chunks * self.chunk_chars:
+                raise FakeProviderError()
+            with self._lock:
+                self.chunks_sent += 1
+            yield text[i:i + self.chunk_chars]
+
+
+def moments_text(n, structured):
+    rows = [("Max cruza la esclusa y mira al abismo número %d" % (i + 1),
+             "Veterano curtido con brazo mecánico", "Traje de vuelo desgastado") for i in range(n)]
+    if structured:
+        return json.dumps({"moments": [{"action": a, "char": c, "wardrobe": w} for a, c, w in rows]},
+                          ensure_ascii=False)
+    return "\n".join(" | ".join(row) for row in rows)
+
+
+def request_slots(request):
+    """Números de slot de la tabla SLOTS de una petición de storyboard ('n | m:ss-m:ss | ...')"""
+    return [int(n) for n in re.findall(r"^(\d+) \| \d+:\d", request, re.MULTILINE)]
+
+
+def request_section(request):
+    """Número de sección de una petición de storyboard por secciones, o None"""
+    match = re.search(r"^SECTION (\d+) of", request, re.MULTILINE)
+    return int(match.group(1)) if match else None
+
+
+def storyboard_keys(schema):
+    """Claves que pide el esquema de storyboard (biblia sola, tomas de una sección o ambas)"""
+    properties = (schema or {}).get("properties") or {}
+    return [key for key in ("bible", "shots") if key in properties] or ("bible", "shots")
+
+
+def storyboard_text(n, structured, slot_numbers=None, keys=("bible", "shots")):
+    """Storyboard de ejemplo: una toma por slot pedido (o `n`); en JSON solo las claves del esquema"""
+    bible = {"location": "Estación orbital abandonada", "character": "Veterano curtido con brazo mecánico",
+             "wardrobe": "Traje de vuelo desgastado", "epoch": "2140"}
+    shots = [{
+        "slot": number,
+        "timestamp": f"{(number * 4) // 60}:{(number * 4) % 60:02d}",
+        "action": f"Max advances through the corridor, beat {number}",
+        "image_prompt": "Wide anamorphic frame of a derelict station corridor, sodium light, haze",
+        "movement_prompt": "Slow dolly in, 50mm, locked horizon",
+        "mood": "Tense",
+    } for number in (slot_numbers or range(1, n + 1))]
+    if structured:
+        payload = {"bible": bible, "shots": shots}
+        return json.dumps({key: payload[key] for key in keys}, ensure_ascii=False)
+    lines = ["---PRODUCTION_BIBLE---"] + [f"{k.upper()}: {v}" for k, v in bible.items()] + ["---END_BIBLE---"]
+    lines += [" | ".join(str(s[k]) for k in ("slot", "action", "image_prompt", "movement_prompt", "mood", "timestamp"))
+              for s in shots]
+    return "\n".join(lines)
+
+
+def _openai_text(behavior, kwargs):
+    structured = "text" in kwargs or "response_format" in kwargs
+    return moments_text(behavior.moments, structured)
+
+
+def _openai_usage(text, cached=0):
+    return SimpleNamespace(prompt_tokens=400, completion_tokens=len(text) // 4,
+                           prompt_tokens_details=SimpleNamespace(cached_tokens=cached),
+                           input_tokens=400, output_tokens=len(text) // 4,
+                           input_tokens_details=SimpleNamespace(cached_tokens=cached))
+
+
+class _FakeStream:
+    """Como openai.Stream: iterable, con close() y gestor de contexto"""
+
+    def __init__(self, events):
+        self._events = events
+
+    def __iter__(self):
+        return self._events
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._events.close()
+
+
+class _Responses:
+    def __init__(self, behavior):
+        self._behavior = behavior
+
+    def create(self, stream=False, **kwargs):
+        self._behavior.start()
+        text = _openai_text(self._behavior, kwargs)
+        if not stream:
+            return SimpleNamespace(output_text=text, usage=_openai_usage(text))
+        return _FakeStream(self._stream(text))
+
+    def _stream(self, text):
+        for delta in self._behavior.chunks(text):
+            yield SimpleNamespace(type="response.output_text.delta", delta=delta)
+        yield SimpleNamespace(type="response.completed", response=SimpleNamespace(usage=_openai_usage(text)))
+
+
+class _ChatCompletions:
+    def __init__(self, behavior):
+        self._behavior = behavior
+
+    def create(self, stream=False, stream_options=None, **kwargs):
+        self._behavior.start()
+        text = _openai_text(self._behavior, kwargs)
+        if not stream:
+            message = SimpleNamespace(content=text)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=_openai_usage(text))
+        return _FakeStream(self._stream(text, stream_options))
+
+    def _stream(self, text, stream_options):
+        for delta in self._behavior.chunks(text):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))], usage=None)
+        if stream_options and stream_options.get("include_usage"):
+            yield SimpleNamespace(choices=[], usage=_openai_usage(text))
+
+
+class FakeOpenAI:
+    def __init__(self, behavior=None):
+        self.behavior = behavior or FakeBehavior()
+        self.responses = _Responses(self.behavior)
+        self.chat = SimpleNamespace(completions=_ChatCompletions(self.behavior))
+
+
+def _gemini_usage(text):
+    return SimpleNamespace(prompt_token_count=400, cached_content_token_count=0,
+                           candidates_token_count=len(text) // 4)
+
+
+class _GeminiModels:
+    MODELS = ("gemini-2.0-flash", "gemini-1.5-flash", "gemini-1.5-flash-latest")
+
+    def __init__(self, behavior):
+        self._behavior = behavior
+
+    def list(self):
+        return [SimpleNamespace(name=f"models/{m}") for m in self.MODELS]
+
+    def get(self, model):
+        return SimpleNamespace(name=f"models/{model}")
+
+    def _text(self, contents, config):
+        schema = (config or {}).get("response_json_schema")
+        structured = schema is not None
+        # El storyboard lleva el audio (un Part / archivo) entre los contenidos
+        if isinstance(contents, list) or (structured and "shots" in schema.get("properties", {})):
+            request = "\n".join(c for c in contents if isinstance(c, str)) if isinstance(contents, list) else ""
+            section = request_section(request)
+            if section is not None:
+                with self._behavior._lock:
+                    self._behavior.section_requests.append(section)
+                if section in self._behavior.fail_sections:
+                    raise FakeProviderError()
+            return storyboard_text(self._behavior.shots, structured, request_slots(request), storyboard_keys(schema))
+        return moments_text(self._behavior.moments, structured)
+
+    def generate_content(self, model, contents, config=None):
+        self._behavior.start()
+        text = self._text(contents, config)
+        return SimpleNamespace(text=text, usage_metadata=_gemini_usage(text), model_version=model)
+
+    def generate_content_stream(self, model, contents, config=None):
+        self._behavior.start()
+        text = self._text(contents, config)
+        for delta in self._behavior.chunks(text):
+            yield SimpleNamespace(text=delta, usage_metadata=None, model_version=model)
+        yield SimpleNamespace(text="", usage_metadata=_gemini_usage(text), model_version=model)
+
+
+class _GeminiFiles:
+    def __init__(self, behavior):
+        self._behavior = behavior
+        self.uploaded_bytes = 0
+
+    def upload(self, file, config=None):
+        data = file.read()
+        self.uploaded_bytes += len(data)
+        # Subida: latencia base más ~1 ms por 100 KB
+        time.sleep(self._behavior.latency_s + len(data) / 100e6)
+        mime_type = (config or {}).get("mime_type", "application/octet-stream")
+        return SimpleNamespace(name="files/fake", uri="https://fake.invalid/files/fake",
+                               mime_type=mime_type, expiration_time=None)
+
+
+class FakeGemini:
+    def __init__(self, behavior=None):
+        self.behavior = behavior or FakeBehavior()
+        self.models = _GeminiModels(self.behavior)
+        self.files = _GeminiFiles(self.behavior)
+
+
+FAKE_SECRETS = {"OPENAI_API_KEY": "fake-openai", "GOOGLE_API_KEY": "fake-google"}
+
+
+# Cupo holgado para los proveedores falsos: los benchmarks miden el flujo, no el límite
+# (con resilience.RATE_LIMITS se mide con los límites reales)
+FAKE_RATE_LIMITS = {"openai": {"rpm": 60000, "burst": 1000}, "gemini": {"rpm": 60000, "burst": 1000}}
+
+
+@contextmanager
+def fake_providers(openai_behavior=None, gemini_behavior=None, rate_limits=FAKE_RATE_LIMITS):
+    """Sustituye los clientes del pool por los falsos mientras dura el bloque.
+
+    Entrega (FakeOpenAI, FakeGemini); los secretos a usar son FAKE_SECRETS. PROVIDER_GUARD
+    arranca y termina limpio (sin cupo gastado ni breakers abiertos de otras ejecuciones)
+    y usa `rate_limits`; las variables LLM_<PROVEEDOR>_RPM/BURST siguen teniendo prioridad.
+    """
+    import audio_storyboard
+    import gemini_models
+    import llm_engines
+    from resilience import PROVIDER_GUARD
+
+    openai_client = FakeOpenAI(openai_behavior)
+    gemini_client = FakeGemini(gemini_behavior)
+    patched = [
+        (llm_engines, "get_openai_client", lambda api_key, base_url=None: openai_client),
+        (llm_engines, "get_gemini_client", lambda api_key, base_url=None: gemini_client),
+        (gemini_models, "get_gemini_client", lambda api_key, base_url=None: gemini_client),
+        (audio_storyboard, "get_gemini_client", lambda api_key, base_url=None: gemini_client),
+    ]
+    originals = [(module, name, getattr(module, name)) for module, name, _ in patched]
+    for module, name, fake in patched:
+        setattr(module, name, fake)
+    gemini_models.GEMINI_MODELS.clear()
+    limits, PROVIDER_GUARD.limits = PROVIDER_GUARD.limits, rate_limits
+    PROVIDER_GUARD.clear()
+    try:
+        yield openai_client, gemini_client
+    finally:
+        for module, name, original in originals:
+            setattr(module, name, original)
+        gemini_models.GEMINI_MODELS.clear()
+        PROVIDER_GUARD.limits = limits
+        PROVIDER_GUARD.clear()
@@ -0,0 +1,54 @@
+import io
+
+import numpy as np
+import soundfile as sf
+
+# Datos sintéticos para los benchmarks: audio en memoria (clicks a tempo fijo o tonos con
+# envolvente rítmica) de duración variable, guiones de N escenas y respuestas de ejemplo.
+
+SR = 22050
+
+
+def click_track(seconds, bpm=120.0, sr=SR, noise=0.01, seed=0):
+    """WAV en memoria (BytesIO) con un click por beat sobre ruido de fondo"""
+    n = int(seconds * sr)
+    y = noise * np.random.default_rng(seed).standard_normal(n).astype(np.float32)
+    click_len = int(0.03 * sr)
+    t = np.arange(click_len) / sr
+    click = (np.sin(2 * np.pi * 1000 * t) * np.exp(-t * 100)).astype(np.float32)
+    for beat_time in np.arange(0.0, seconds, 60.0 / bpm):
+        i = int(round(beat_time * sr))
+        end = min(n, i + click_len)
+        y[i:end] += click[:end - i]
+    return _wav(y, sr)
+
+
+def sine_track(seconds, freq=220.0, bpm=96.0, sr=SR):
+    """WAV en memoria con un tono cuya amplitud pulsa a `bpm` (ataques suaves)"""
+    t = np.arange(int(seconds * sr)) / sr
+    envelope = 0.5 * (1 + np.cos(2 * np.pi * (bpm / 60.0) * t)) ** 4 / 16
+    return _wav((0.8 * envelope * np.sin(2 * np.pi * freq * t)).astype(np.float32), sr)
+
+
+def _wav(y, sr):
+    buf = io.BytesIO()
+    sf.write(buf, y, sr, format="WAV", subtype="PCM_16")
+    buf.seek(0)
+    return buf
+
+
+AUDIO_FIXTURES = {
+    "click": click_track,
+    "sine": sine_track,
+}
+
+
+def sample_script(scenes=4, beats_per_scene=6):
+    """Guion con `scenes` encabezados INT./EXT. y varias frases de acción por escena"""
+    blocks = []
+    for i in range(scenes):
+        place = "EXT. ESTACIÓN ESPACIAL" if i % 2 else "INT. HANGAR DE CARGA"
+        actions = " ".join(f"Max avanza hacia la compuerta {i + 1}.{j + 1} mientras la alarma parpadea."
+                           for j in range(beats_per_scene))
+        blocks.append(f"{place} - NOCHE\n{actions}")
+    return "\n\n".join(blocks)
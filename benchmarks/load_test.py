@@ -0,0 +1,254 @@
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+# Sin logs de consumo ni de trazas durante la prueba
+os.environ.setdefault("LLM_USAGE_LOG", "")
+os.environ.setdefault("PERF_TRACE_LOG", "")
+
+from fixtures import click_track, sample_script  # noqa: E402
+from standin_server import add_arguments, settings_from_args, start_server  # noqa: E402
+
+# Prueba de carga de una instancia de la app: N sesiones concurrentes (hilos del mismo
+# proceso, como las sesiones de Streamlit) recorren el panel de control, el analizador de
+# guion y el storyboard de audio con los mismos módulos que usa la interfaz y los SDK
+# reales apuntando al servidor local (standin_server). Se comparten pools de clientes,
+# cachés y límites por proveedor, igual que en producción.
+#
+# AppTest no admite sesiones concurrentes (cada instancia crea y destruye el Runtime de
+# Streamlit), así que el coste de ejecutar el script de la interfaz se mide aparte con
+# --ui-probe: una sesión de AppTest por flujo, en serie, contra el mismo servidor.
+
+FLOWS = ("panel", "script", "audio")
+SECRETS = {"OPENAI_API_KEY": "standin-openai", "GOOGLE_API_KEY": "standin-google"}
+PANEL_SHOTS = 4
+SCRIPT_SYSTEM_PROMPT = "Eres un Director de Fotografía experto y Jefe de Continuidad. Formato: Acción | Personaje | Vestuario"
+
+
+def _percentile(samples, q):
+    return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else None
+
+
+def _render_shots(templates, moments, engine="Midjourney"):
+    from prompt_engine import generate_shot_cached
+
+    angles = list(templates["shot_angles"])
+    return [generate_shot_cached(
+        m["action"], m["char"], m["wardrobe"],
+        templates["color_palettes"]["Clásico Teal & Orange"],
+        templates["director_styles"]["Épico / Escala Masiva (Nolan)"],
+        "Panavision Ultra 70 (Anamórfico)", templates["film_stocks"][0],
+        templates["camera_movements"]["Dolly In (Acercamiento)"],
+        angles[i % len(angles)], templates["shot_angles"][angles[i % len(angles)]], engine,
+    ) for i, m in enumerate(moments)]
+
+
+def panel_flow(user, iteration, options):
+    from template_registry import get_templates
+
+    moments = [{"action": f"Sesión {user}: estación orbital {iteration}, toma {n}",
+                "char": "Un veterano curtido con brazo mecánico", "wardrobe": "Traje de vuelo desgastado"}
+               for n in range(PANEL_SHOTS)]
+    return len(_render_shots(get_templates(), moments))
+
+
+def script_flow(user, iteration, options):
+    from script_analysis import analyze_scenes, split_scenes
+    from template_registry import get_templates
+
+    # Texto distinto por sesión e iteración: la caché de respuestas no oculta la carga
+    script = sample_script(options.scenes).replace("Max", f"Max-{user}-{iteration}")
+    scenes = split_scenes(script)
+    moments, errors = analyze_scenes(scenes, SCRIPT_SYSTEM_PROMPT, options.engine, SECRETS,
+                                     "Max", "Traje de vuelo", use_cache=True)
+    if errors:
+        raise next(iter(errors.values()))
+    return len(_render_shots(get_templates(), moments))
+
+
+def audio_flow(user, iteration, options):
+    from audio_analysis import analyze_audio
+    from audio_cache import audio_digest, get_audio_store
+    from audio_storyboard import generate_storyboard
+    from shot_parsers import parse_bible, storyboard_display_text
+    from shot_scheduler import merge_storyboard, schedule_shots
+
+    audio = options.audio_tracks[(user + iteration) % len(options.audio_tracks)]
+    upload = io.BytesIO(audio)
+    store = get_audio_store()
+    audio_hash = audio_digest(upload.getbuffer())
+    features = store.get_features(audio_hash)
+    if features is None:
+        features = analyze_audio(upload)
+        store.put_features(audio_hash, features)
+    slots = schedule_shots(features)
+    text = generate_storyboard(SECRETS["GOOGLE_API_KEY"], upload, "audio/wav", features["duration"],
+                               audio_hash=audio_hash, slots=slots)
+    if not parse_bible(text):
+        raise ValueError("Storyboard sin biblia")
+    merge_storyboard(slots, storyboard_display_text(text))
+    return len(slots)
+
+
+FLOW_FUNCTIONS = {"panel": panel_flow, "script": script_flow, "audio": audio_flow}
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {flow: [] for flow in FLOWS}
+        self.errors = {flow: Counter() for flow in FLOWS}
+
+    def record(self, flow, seconds, error=None):
+        with self._lock:
+            if error is None:
+                self.samples[flow].append(seconds)
+            else:
+                self.errors[flow][f"{type(error).__name__}: {str(error)[:80]}"] += 1
+
+    def report(self, wall_s):
+        report = {}
+        for flow in FLOWS:
+            samples = sorted(s * 1000 for s in self.samples[flow])
+            errors = sum(self.errors[flow].values())
+            if not samples and not errors:
+                continue
+            report[flow] = {
+                "completed": len(samples),
+                "errors": errors,
+                "error_kinds": dict(self.errors[flow].most_common(3)),
+                "throughput_per_s": round(len(samples) / wall_s, 3) if wall_s else None,
+                **{f"p{int(q * 100)}_ms": round(_percentile(samples, q), 1) if samples else None
+                   for q in (0.50, 0.90, 0.95, 0.99)},
+                "max_ms": round(samples[-1], 1) if samples else None,
+            }
+        return report
+
+
+def _virtual_user(user, flows, options, deadline, recorder):
+    # Cada sesión empieza por un flujo distinto para mezclar la carga desde el principio
+    for iteration in range(options.iterations or sys.maxsize):
+        if time.monotonic() >= deadline:
+            return
+        flow = flows[(user + iteration) % len(flows)]
+        started = time.perf_counter()
+        try:
+            FLOW_FUNCTIONS[flow](user, iteration, options)
+        except Exception as e:
+            recorder.record(flow, time.perf_counter() - started, e)
+        else:
+            recorder.record(flow, time.perf_counter() - started)
+        if options.think_time:
+            time.sleep(options.think_time)
+
+
+def ui_probe(options):
+    """Tiempo de rerun del script de Streamlit por flujo (una sesión AppTest, en serie)"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, "cinematography_assistant.py"), default_timeout=300)
+    for name, value in SECRETS.items():
+        at.secrets[name] = value
+    at.run()
+    timings = {}
+
+    def _click(label):
+        button = next(b for b in at.button if label in b.label)
+        started = time.perf_counter()
+        button.click().run()
+        return round((time.perf_counter() - started) * 1000, 1)
+
+    at.text_area(key="scene_creator").input("Estación orbital abandonada").run()
+    timings["panel"] = _click("Generar Lista de Tomas")
+    next(t for t in at.text_area if "Guion" in t.label).input(sample_script(options.scenes)).run()
+    next(t for t in at.text_input if "Identidad" in t.label).input("Max").run()
+    timings["script"] = _click("ANALIZAR GUION")
+    at.file_uploader[0].set_value(("track.wav", options.audio_tracks[0], "audio/wav")).run()
+    timings["audio"] = _click("GENERAR STORYBOARD")
+    timings["exceptions"] = [e.value for e in at.exception]
+    timings["errors"] = [e.value for e in at.error]
+    return timings
+
+
+def run(options):
+    server, state, base_url = (None, None, options.server)
+    if not base_url:
+        server, state, base_url = start_server(settings_from_args(options))
+    os.environ["OPENAI_BASE_URL"] = f"{base_url}/v1"
+    os.environ["GEMINI_BASE_URL"] = base_url
+    flows = [f for f in options.flows if f in FLOWS]
+    # Audios distintos (semilla del ruido) para que cada sesión decodifique y suba el suyo
+    options.audio_tracks = [click_track(options.audio_seconds, seed=n).getvalue() for n in range(options.audio_variants)]
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Cachés de respuestas y de audio vacías en cada prueba
+        os.environ["LLM_CACHE_PATH"] = os.path.join(cache_dir, "llm_cache.sqlite")
+        os.environ["AUDIO_CACHE_PATH"] = os.path.join(cache_dir, "audio_cache.sqlite")
+        if "audio" in flows:
+            # Calentamiento fuera de la medición: caché JIT (numba) de librosa
+            from audio_analysis import analyze_audio
+
+            analyze_audio(io.BytesIO(click_track(2).getvalue()))
+
+        recorder = Recorder()
+        started = time.monotonic()
+        deadline = started + options.duration
+        threads = []
+        for user in range(options.users):
+            thread = threading.Thread(target=_virtual_user, name=f"session-{user}",
+                                      args=(user, flows, options, deadline, recorder), daemon=True)
+            threads.append(thread)
+            thread.start()
+            if options.ramp_up:
+                time.sleep(options.ramp_up / options.users)
+        for thread in threads:
+            thread.join()
+        wall_s = time.monotonic() - started
+
+        result = {
+            "users": options.users,
+            "flows": flows,
+            "wall_s": round(wall_s, 2),
+            "results": recorder.report(wall_s),
+            "server": state.snapshot() if state else None,
+        }
+        if options.ui_probe:
+            result["ui_rerun_ms"] = ui_probe(options)
+    if server is not None:
+        server.shutdown()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga de sesiones concurrentes contra proveedores locales")
+    parser.add_argument("--users", type=int, default=10, help="Sesiones concurrentes")
+    parser.add_argument("--duration", type=float, default=60.0, help="Segundos de prueba")
+    parser.add_argument("--iterations", type=int, default=0, help="Máximo de flujos por sesión (0 = hasta --duration)")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="Segundos para arrancar todas las sesiones")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Pausa entre flujos de una sesión")
+    parser.add_argument("--flows", nargs="+", default=list(FLOWS), choices=FLOWS)
+    parser.add_argument("--engine", default="GPT-4o-mini (Fast)", help="Motor del analizador de guion")
+    parser.add_argument("--scenes", type=int, default=3, help="Escenas por guion")
+    parser.add_argument("--audio-seconds", type=float, default=30.0)
+    parser.add_argument("--audio-variants", type=int, default=8, help="Audios distintos que se reparten las sesiones")
+    parser.add_argument("--server", help="URL de un standin_server ya arrancado (por defecto se arranca uno)")
+    parser.add_argument("--ui-probe", action="store_true", help="Mide además el rerun de la interfaz con AppTest")
+    parser.add_argument("--output", help="Guarda el resultado en este JSON")
+    add_arguments(parser)
+    args = parser.parse_args()
+    result = run(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
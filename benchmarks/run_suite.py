@@ -0,0 +1,107 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import bench_flows  # noqa: E402
+import bench_imports  # noqa: E402
+import bench_parsers  # noqa: E402
+import bench_prompt  # noqa: E402
+
+# Suite completa sin red: micro-benchmarks (prompts y parsers), flujos de guion y audio
+# con proveedores falsos y presupuesto de importación. El resultado se guarda en
+# benchmarks/results/<fecha>-<commit>.json; --compare muestra la variación frente a otro.
+
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             check=True, capture_output=True, text=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return out.stdout.strip() + ("-dirty" if dirty else "")
+
+
+def run(quick=False):
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": quick,
+        },
+        "prompt": bench_prompt.run(repeat=2 if quick else 5),
+        "parsers": bench_parsers.run(repeat=2 if quick else 5, number=50 if quick else 200),
+        "flows": bench_flows.run(audio_seconds=(15,) if quick else bench_flows.DEFAULT_AUDIO_SECONDS),
+        "imports": bench_imports.run(repeat=2 if quick else 5),
+    }
+
+
+def _flatten(value, prefix=""):
+    """Métricas numéricas hoja -> {ruta: valor}; las listas de casos se indexan por su etiqueta"""
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = ((_case_label(item, i), item) for i, item in enumerate(value))
+    else:
+        return {prefix: value} if isinstance(value, (int, float)) and not isinstance(value, bool) else {}
+    flat = {}
+    for key, item in items:
+        flat.update(_flatten(item, f"{prefix}.{key}" if prefix else str(key)))
+    return flat
+
+
+def _case_label(item, index):
+    if not isinstance(item, dict):
+        return str(index)
+    keys = ("engine", "fixture", "seconds", "structured")
+    return "[" + ",".join(str(item[k]) for k in keys if k in item) + "]" if any(k in item for k in keys) else str(index)
+
+
+def compare(base, current, threshold=0.10):
+    """Filas (métrica, antes, ahora, ratio) de las métricas que varían más de `threshold`"""
+    before, after = _flatten(base), _flatten(current)
+    rows = []
+    for name in sorted(before.keys() & after.keys()):
+        if name.startswith("meta.") or not before[name]:
+            continue
+        ratio = after[name] / before[name]
+        if abs(ratio - 1) > threshold:
+            rows.append((name, before[name], after[name], round(ratio, 3)))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Suite de benchmarks sin red con resultados en JSON")
+    parser.add_argument("--quick", action="store_true", help="Menos repeticiones y un solo audio corto")
+    parser.add_argument("--output", help="Ruta del JSON (por defecto benchmarks/results/<fecha>-<commit>.json)")
+    parser.add_argument("--compare", metavar="BASE_JSON", help="Resultado anterior con el que comparar")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Variación mínima a mostrar (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    result = run(args.quick)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}-{result['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f"Resultados: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)
+        print(f"Comparación con {base['meta']['commit']} (variaciones > {args.threshold:.0%}):")
+        for name, old, new, ratio in compare(base, result, args.threshold):
+            print(f"  {name}: {old} -> {new} (x{ratio})")
@@ -0,0 +1,354 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_llm import moments_text, request_slots, storyboard_keys, storyboard_text  # noqa: E402
+
+# Servidor local que imita el subconjunto de las APIs HTTP de OpenAI y Gemini que usa la
+# app (Responses, Chat Completions, generateContent, streamGenerateContent, listado de
+# modelos y subida reanudable de archivos), con latencia, streaming por fragmentos,
+# límite de peticiones (429) y fallos (503) simulados. La app se apunta a él con
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 GEMINI_BASE_URL=http://127.0.0.1:8765
+
+GEMINI_MODELS = ("gemini-2.0-flash", "gemini-1.5-flash", "gemini-1.5-flash-latest")
+
+
+class StandInSettings:
+    def __init__(self, latency_ms=300.0, jitter_ms=100.0, chunk_ms=15.0, chunk_chars=48,
+                 upload_mb_per_s=50.0, rpm=0, max_concurrency=0, failure_rate=0.0,
+                 moments=5, shots=12, seed=0):
+        self.latency_s = latency_ms / 1000
+        self.jitter_s = jitter_ms / 1000
+        self.chunk_s = chunk_ms / 1000
+        self.chunk_chars = chunk_chars
+        self.upload_bytes_per_s = upload_mb_per_s * 1e6
+        self.rpm = rpm
+        self.max_concurrency = max_concurrency
+        self.failure_rate = failure_rate
+        self.moments = moments
+        self.shots = shots
+        self.seed = seed
+
+
+class StandInState:
+    """Contadores y límites compartidos por todas las conexiones del servidor"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._rng = random.Random(settings.seed)
+        self._lock = threading.Lock()
+        self._window = []
+        self._in_flight = 0
+        self._upload_ids = itertools.count(1)
+        self.uploads = {}
+        self.counts = {"requests": 0, "rate_limited": 0, "failed": 0, "uploaded_bytes": 0}
+
+    def admit(self):
+        """None si la petición entra; (código, mensaje) si se rechaza por límite o fallo simulado"""
+        now = time.monotonic()
+        with self._lock:
+            self.counts["requests"] += 1
+            self._window = [t for t in self._window if now - t < 60.0]
+            if (self.settings.rpm and len(self._window) >= self.settings.rpm) or \
+                    (self.settings.max_concurrency and self._in_flight >= self.settings.max_concurrency):
+                self.counts["rate_limited"] += 1
+                return 429, "Rate limit exceeded (stand-in)"
+            if self._rng.random() < self.settings.failure_rate:
+                self.counts["failed"] += 1
+                return 503, "The model is overloaded (stand-in)"
+            self._window.append(now)
+            self._in_flight += 1
+            delay = self.settings.latency_s + self._rng.uniform(0, self.settings.jitter_s)
+        time.sleep(delay)
+        return None
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def new_upload(self, meta):
+        with self._lock:
+            upload_id = str(next(self._upload_ids))
+            self.uploads[upload_id] = {"meta": meta, "received": 0}
+        return upload_id
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts, in_flight=self._in_flight)
+
+
+def _usage_tokens(text):
+    return 400, max(1, len(text) // 4)
+
+
+def _openai_structured(body):
+    return "response_format" in body or "format" in (body.get("text") or {})
+
+
+def _gemini_text(body, shots, moments):
+    config = body.get("generationConfig") or {}
+    schema = config.get("responseJsonSchema") or config.get("responseSchema")
+    structured = schema is not None
+    parts = [part for content in body.get("contents", []) for part in content.get("parts", [])]
+    # El storyboard lleva el audio como fileData entre las partes
+    has_file = any("fileData" in part for part in parts)
+    if has_file or (structured and "shots" in (schema.get("properties") or {})):
+        # Una toma por slot de la tabla SLOTS de la petición; en JSON solo las claves del esquema
+        request = "\n".join(part.get("text", "") for part in parts)
+        return storyboard_text(shots, structured, request_slots(request), storyboard_keys(schema))
+    return moments_text(moments, structured)
+
+
+def make_handler(state):
+    settings = state.settings
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        # --- utilidades de respuesta ---
+
+        def _json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _error(self, status, message, gemini):
+            if gemini:
+                statuses = {429: "RESOURCE_EXHAUSTED", 503: "UNAVAILABLE", 404: "NOT_FOUND"}
+                payload = {"error": {"code": status, "message": message, "status": statuses.get(status, "UNKNOWN")}}
+            else:
+                payload = {"error": {"message": message, "type": "stand_in_error", "code": str(status)}}
+            self._json(status, payload, {"Retry-After": "1"} if status == 429 else None)
+
+        def _sse(self, events, done=False):
+            """Stream SSE con Transfer-Encoding chunked; `events` es una lista de (evento o None, dict)
+            y entre evento y evento se espera chunk_ms"""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, (event, payload) in enumerate(events):
+                if i and settings.chunk_s:
+                    time.sleep(settings.chunk_s)
+                data = (f"event: {event}\n" if event else "") + f"data: {json.dumps(payload)}\n\n"
+                self._chunk(data.encode("utf-8"))
+            if done:
+                self._chunk(b"data: [DONE]\n\n")
+            self._chunk(b"")
+
+        def _chunk(self, data):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def _pieces(self, text):
+            return [text[i:i + settings.chunk_chars] for i in range(0, len(text), settings.chunk_chars)]
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        # --- enrutado ---
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path.endswith("/models"):
+                return self._json(200, {"models": [{"name": f"models/{m}", "supportedGenerationMethods":
+                                                    ["generateContent"]} for m in GEMINI_MODELS]})
+            if "/models/" in path:
+                model = path.rsplit("/", 1)[-1]
+                if model in GEMINI_MODELS:
+                    return self._json(200, {"name": f"models/{model}"})
+                return self._error(404, f"models/{model} is not found", gemini=True)
+            if path == "/stats":
+                return self._json(200, state.snapshot())
+            self._error(404, f"Unknown path {path}", gemini=False)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            raw = self._body()
+            if url.path.startswith("/upload/"):
+                return self._upload(url, raw)
+            body = json.loads(raw or b"{}")
+            gemini = ":generateContent" in url.path or ":streamGenerateContent" in url.path
+            rejected = state.admit()
+            if rejected is not None:
+                return self._error(*rejected, gemini=gemini)
+            try:
+                if url.path.endswith("/chat/completions"):
+                    return self._chat(body)
+                if url.path.endswith("/responses"):
+                    return self._responses(body)
+                if gemini:
+                    return self._gemini(url, body)
+                self._error(404, f"Unknown path {url.path}", gemini=False)
+            finally:
+                state.release()
+
+        # --- OpenAI ---
+
+        def _chat(self, body):
+            text = moments_text(settings.moments, _openai_structured(body))
+            prompt_tokens, completion_tokens = _usage_tokens(text)
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens,
+                     "prompt_tokens_details": {"cached_tokens": 0}}
+            base = {"id": "chatcmpl-standin", "created": int(time.time()), "model": body.get("model", "")}
+            if not body.get("stream"):
+                return self._json(200, dict(base, object="chat.completion", usage=usage, choices=[{
+                    "index": 0, "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": text}}]))
+
+            events = [(None, dict(base, object="chat.completion.chunk", choices=[{
+                "index": 0, "delta": {"content": piece}, "finish_reason": None}])) for piece in self._pieces(text)]
+            if (body.get("stream_options") or {}).get("include_usage"):
+                events.append((None, dict(base, object="chat.completion.chunk", choices=[], usage=usage)))
+            self._sse(events, done=True)
+
+        def _responses(self, body):
+            text = moments_text(settings.moments, _openai_structured(body))
+            input_tokens, output_tokens = _usage_tokens(text)
+            response = {
+                "id": "resp_standin", "object": "response", "created_at": int(time.time()),
+                "model": body.get("model", ""), "status": "completed",
+                "output": [{"type": "message", "id": "msg_standin", "status": "completed", "role": "assistant",
+                            "content": [{"type": "output_text", "text": text, "annotations": []}]}],
+                "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                          "total_tokens": input_tokens + output_tokens,
+                          "input_tokens_details": {"cached_tokens": 0},
+                          "output_tokens_details": {"reasoning_tokens": 0}},
+                "parallel_tool_calls": True, "tool_choice": "auto", "tools": [],
+            }
+            if not body.get("stream"):
+                return self._json(200, response)
+
+            events = [("response.output_text.delta", {
+                "type": "response.output_text.delta", "item_id": "msg_standin", "output_index": 0,
+                "content_index": 0, "delta": piece, "sequence_number": n, "logprobs": []})
+                for n, piece in enumerate(self._pieces(text))]
+            events.append(("response.completed", {"type": "response.completed", "response": response,
+                                                  "sequence_number": len(events)}))
+            self._sse(events)
+
+        # --- Gemini ---
+
+        def _gemini(self, url, body):
+            model = url.path.rsplit("/", 1)[-1].split(":", 1)[0]
+            if model not in GEMINI_MODELS:
+                return self._error(404, f"models/{model} is not found", gemini=True)
+            text = _gemini_text(body, settings.shots, settings.moments)
+            prompt_tokens, output_tokens = _usage_tokens(text)
+
+            def chunk(piece, usage=False):
+                payload = {"candidates": [{"content": {"role": "model", "parts": [{"text": piece}]}, "index": 0}],
+                           "modelVersion": model}
+                if usage:
+                    payload["candidates"][0]["finishReason"] = "STOP"
+                    payload["usageMetadata"] = {"promptTokenCount": prompt_tokens,
+                                                "candidatesTokenCount": output_tokens,
+                                                "totalTokenCount": prompt_tokens + output_tokens}
+                return payload
+
+            if ":streamGenerateContent" not in url.path:
+                return self._json(200, chunk(text, usage=True))
+            pieces = self._pieces(text)
+            self._sse([(None, chunk(piece, usage=i == len(pieces) - 1)) for i, piece in enumerate(pieces)])
+
+        def _upload(self, url, raw):
+            command = self.headers.get("X-Goog-Upload-Command", "")
+            if "start" in command:
+                meta = json.loads(raw or b"{}").get("file") or {}
+                meta.setdefault("mimeType", self.headers.get("X-Goog-Upload-Header-Content-Type"))
+                upload_id = state.new_upload(meta)
+                host = self.headers.get("Host")
+                return self._json(200, {}, {
+                    "X-Goog-Upload-URL": f"http://{host}/upload/v1beta/files?upload_id={upload_id}",
+                    "X-Goog-Upload-Status": "active"})
+            upload_id = parse_qs(url.query).get("upload_id", [""])[0]
+            upload = state.uploads.get(upload_id)
+            if upload is None:
+                return self._error(404, "Unknown upload", gemini=True)
+            upload["received"] += len(raw)
+            if settings.upload_bytes_per_s:
+                time.sleep(len(raw) / settings.upload_bytes_per_s)
+            if "finalize" not in command:
+                return self._json(200, {}, {"X-Goog-Upload-Status": "active"})
+            state.uploads.pop(upload_id, None)
+            with state._lock:
+                state.counts["uploaded_bytes"] += upload["received"]
+            name = f"files/standin-{upload_id}"
+            self._json(200, {"file": {
+                "name": name, "uri": f"http://{self.headers.get('Host')}/v1beta/{name}",
+                "mimeType": upload["meta"].get("mimeType", "application/octet-stream"),
+                "sizeBytes": str(upload["received"]), "state": "ACTIVE",
+                "expirationTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 48 * 3600)),
+            }}, {"X-Goog-Upload-Status": "final"})
+
+    return Handler
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Los clientes cortan conexiones al reintentar o al abandonar un stream: no es un fallo
+        if isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            return
+        super().handle_error(request, client_address)
+
+
+def start_server(settings=None, host="127.0.0.1", port=0):
+    """Arranca el servidor en un hilo; devuelve (servidor, estado, URL base)"""
+    state = StandInState(settings or StandInSettings())
+    server = StandInServer((host, port), make_handler(state))
+    threading.Thread(target=server.serve_forever, name="standin-server", daemon=True).start()
+    return server, state, f"http://{host}:{server.server_address[1]}"
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Espera hasta el primer byte")
+    parser.add_argument("--jitter-ms", type=float, default=100.0)
+    parser.add_argument("--chunk-ms", type=float, default=15.0, help="Pausa entre fragmentos del stream")
+    parser.add_argument("--upload-mb-per-s", type=float, default=50.0)
+    parser.add_argument("--rpm", type=int, default=0, help="Peticiones por minuto antes de responder 429 (0 = sin límite)")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="Peticiones simultáneas antes de 429 (0 = sin límite)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fracción de peticiones con 503")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def settings_from_args(args):
+    return StandInSettings(args.latency_ms, args.jitter_ms, args.chunk_ms, upload_mb_per_s=args.upload_mb_per_s,
+                           rpm=args.rpm, max_concurrency=args.max_concurrency, failure_rate=args.failure_rate,
+                           seed=args.seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local que imita las APIs de OpenAI y Gemini")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server, state, base_url = start_server(settings_from_args(args), args.host, args.port)
+    print(f"OPENAI_BASE_URL={base_url}/v1 GEMINI_BASE_URL={base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
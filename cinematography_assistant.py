@@ -1,12 +1,19 @@
 import streamlit as st
 import json
-import os
-from openai import OpenAI
-import google.generativeai as st_genai 
-from google import genai 
-import librosa
-import numpy as np
-import tempfile
+import time
+import uuid
+from prompt_engine import TARGET_ENGINES, generate_shot_cached
+from template_registry import get_templates
+from llm_cache import get_response_cache
+from gemini_models import GEMINI_MODELS, GeminiModelUnavailable
+from llm_engines import INTEL_MODELS, FASTEST_ENGINE, EngineUnavailable, LATENCIES, complete
+from script_analysis import analyze_scenes, split_scenes
+from audio_storyboard import generate_storyboard
+from shot_parsers import StoryboardStreamParser, parse_bible, storyboard_display_text, storyboard_section_errors
+from llm_usage import USAGE
+from perf_trace import STAGES, span, trace
+from resilience import PROVIDER_GUARD, CircuitOpen, RateLimitTimeout
+from project_store import get_project_store
 
 # Set page config for a premium look
 st.set_page_config(
@@ -52,267 +59,287 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Prompt templates embedded directly to remove external JSON dependency
-TEMPLATES = {
-  "director_styles": {
-    "Épico / Escala Masiva (Nolan)": "Grand scale architectures, visceral realism, physical practical effects, vast landscapes, 1.43:1 full IMAX height.",
-    "Atmosférico / Ciencia Ficción (Villeneuve)": "Atmospheric fog, silhouette lighting, brutalist architecture, monochromatic or bi-color palettes, 1.90:1 digital IMAX.",
-    "Roger Deakins (Naturalista)": "Motivated naturalistic lighting, muslin bounce, mid-wide 35mm focal lengths, extreme contrast precision, sharp clean textures.",
-    "Emmanuel Lubezki (Inmersivo)": "Natural light only (magic hour), ultra-wide 12-24mm, immersive long takes, zero grain, visceral proximity to subject.",
-    "Robert Richardson (Gótico/Halo)": "Strong rim lighting, HALO top-down effect, blooming highlights, high color contrast, Panavision anamorphic texture.",
-    "Greig Fraser (Táctil/LED)": "Chiaroscuro (shadow play), digital-native textures, LED-screen ambient light, shallow depth of field, epic scope.",
-    "Steven Spielberg (Bypass/Haze)": "Janusz Kaminski style, bleach bypass ENR process, desaturated color, heavy grain, overlit blooming highlights, hazy diffuse lighting.",
-    "Ridley Scott (Épico Desaturado)": "Dariusz Wolski style, huge epic scale, painterly desaturated tones, natural available light emphasis, realistic documentary-style immersion.",
-    "Estilo Documental Rudo": "Handheld 65mm feel, natural lighting, sweat and dirt detail, muted colors, high texture."
-  },
-  "lens_presets": {
-    "Panavision Ultra 70 (Anamórfico)": "2x squeeze, intense oval bokeh, horizontal blue lens flares, sharp center with edge falloff.",
-    "IMAX Hasselblad (Esférico)": "Tack sharp from corner to corner, zero distortion, deep depth of field, 15/70mm resolution.",
-    "Cooke Anamórfico Vintage": "Warm tones, subtle lens flares, painterly bokeh, organic texture.",
-    "Arri Alexa 65 (Digital Gran Formato)": "Ultra clean, massive dynamic range, modern glass characteristics."
-  },
-  "camera_movements": {
-    "Estático (Fixed)": "Stable static camera, no movement, focus on composition.",
-    "Dolly In (Acercamiento)": "Slow dolly-in movement towards the subject, increasing tension.",
-    "Dolly Out (Alejamiento)": "Slow dolly-out movement away from the subject, revealing the environment.",
-    "Panorámica (Panning)": "Horizontal pan movement, scanning the horizon.",
-    "Tilt Up (Inclinación Arriba)": "Vertical tilt up movement, looking towards the sky or heights.",
-    "Tilt Down (Inclinación Abajo)": "Vertical tilt down movement, looking towards the ground.",
-    "Tracking Shot (Seguimiento)": "Lateral tracking shot following the character's movement.",
-    "Grúa (Crane Shot)": "High-angle crane shot, sweeping vertical and horizontal movement.",
-    "Handheld (Cámara en Mano)": "Visceral handheld camera, organic shaky movement, documentary feel.",
-    "Zoom In (Digital/Óptico)": "Intense zoom-in on details or emotions.",
-    "Orbit (Circular)": "Circular tracking shot orbiting the subject 360 degrees."
-  },
-  "film_stocks": [
-    "Kodak Vision3 500T (Poca luz, tonos fríos)",
-    "Kodak Vision3 250D (Luz día, natural)",
-    "Kodak Eastman Double-X (Blanco y Negro)",
-    "Fuji Eterna (Alta saturación, verdes/azules profundos)"
-  ],
-  "shot_angles": {
-    "Plano Gran General (EWS)": "Establishing the vast environment, character is small in frame, 1.43:1 ratio.",
-    "Plano General (WS)": "Full body visible, clear relationship with environment.",
-    "Plano Americano (Cowboy)": "Waist up to mid-thigh, traditional western style shot.",
-    "Plano Medio (MS)": "Waist up, focusing on interaction and wardrobe detail.",
-    "Plano Medio Corto (MCU)": "Chest up, focusing on facial expressions and posture.",
-    "Primer Plano (CU)": "Tight on face, shallow depth of field, intense 70mm skin texture.",
-    "Primerísimo Primer Plano (ECU)": "Extreme tight shot on eyes or mouth, focusing on intense emotion.",
-    "Plano Detalle (XCU)": "Tiny detail of an object or texture, hyper-focused.",
-    "Ángulo Picado": "Looking down at the subject, making them appear vulnerable.",
-    "Ángulo Contrapicado (Heroico)": "Looking up at character, making them appear powerful.",
-    "Cenital / Vista de Pájaro": "Looking down, showing isolation or objective perspective.",
-    "Ángulo Nadir": "Looking straight up from the ground, extreme low angle.",
-    "Ángulo Holandés (Tensión)": "Tilted horizon, creating tension and unease.",
-    "Plano de Perfil": "Side profile of the subject, highlighting silhouette and features."
-  },
-  "color_palettes": {
-    "Clásico Teal & Orange": "Cool shadows, warm skin tones, high dynamic range pop.",
-    "Desaturado / Bleach Bypass": "High contrast, gritty, muted colors, metallic feel.",
-    "Tecnicolor Heredado": "Deep reds and blues, high saturation, nostalgic 1950s epic feel.",
-    "Monocromo (Double-X)": "Hyper-detailed black and white, deep blacks, glowing silver highlights.",
-    "Neón Noir": "Vibrant pinks and cyans against deep darkness."
-  }
-}
-
-def generate_prompt(scene, character, wardrobe, color, director, lens, stock, movement, angle_name, angle_desc, engine):
-    # Mapping técnico
-    is_anamorphic = "Anamórfico" in lens or "Anamorphic" in lens
-    aspect_ratio = "2.76:1 (Ultra Panavision)" if is_anamorphic else "1.43:1 (IMAX Full)"
-    
-    technical_details = f"Shot on IMAX MSM 9802 15/70mm film, {lens} lenses, {stock} film stock. Aspect ratio {aspect_ratio}."
-    
-    # Anclas de Consistencia Blindada (EN)
-    # Forced visual consistency for image generators
-    consistency_block = (
-        f"CHARACTER CONTINUITY: {character}. "
-        f"WARDROBE CONSISTENCY: {wardrobe}. "
-        f"COLOR SCHEME: {color}. "
-        "Maintain identical facial features and identical clothing textures across shots."
-    )
-    
-    # Optimización del Motor
-    engine_suffix = ""
-    if engine == "Midjourney":
-        ratio = "2.76:1" if is_anamorphic else "1.43:1"
-        engine_suffix = f" --ar {ratio} --v 6 --stylize 250"
-    elif engine == "DALL-E 3":
-        engine_suffix = " Wide-screen cinematic mode, hyper-photorealistic, maintain exact visual continuity with previous frames."
-
-    # Prompt final de Imagen (Sin movimiento)
-    image_prompt = (
-        f"{angle_name}: {scene}. {angle_desc}. "
-        f"{consistency_block} {director}. {technical_details}. "
-        f"Key visual traits: {'oval bokeh, horizontal lens flares, ' if is_anamorphic else ''}"
-        f"extreme detail, naturalistic grain, high dynamic range, 12k resolution texture, visceral atmosphere.{engine_suffix}"
-    )
-
-    # Prompt de Movimiento de Cámara (Específico)
-    movement_prompt = f"CAMERA MOVEMENT: {movement}. Technical execution: {angle_name} logic. Ensure smooth cinematic flow."
-    
-    # Lógica de Iluminación para Mermaid
-    diagram = f"graph TD\n    CAM[Cámara IMAX] --- SUB[({character})]\n"
-    if "Natural" in director or "Deakins" in director or "Naturalista" in director:
-        diagram += "    SUN[Fuente de Luz Natural] --> SUB\n    BOUNCE[Rebotador Muslin] --> SUB"
-    elif "Richardson" in director:
-        diagram += "    HALO[Luz Halo Cenital] --> SUB\n    BACK[Contraluz de Recorte] --> SUB"
-    elif "Spielberg" in director:
-        diagram += "    BLOOM[Luz Sobreexpuesta (Haze)] --> SUB\n    BACK[Contraluz Fuerte] --> SUB"
-    elif "Ridley Scott" in director:
-        diagram += "    FIRE[Luz de Fuego/Velas] --> SUB\n    SIDE[Luz Lateral Natural] --> SUB"
+def _report_engine_error(engine_choice, e):
+    error_msg = str(e)
+    if isinstance(e, EngineUnavailable):
+        st.error(error_msg)
+    elif isinstance(e, (CircuitOpen, RateLimitTimeout)):
+        st.warning(f"⏳ {error_msg} Prueba otro motor o el modo {FASTEST_ENGINE}.")
+    elif "billing_hard_limit_reached" in error_msg or "insufficient_quota" in error_msg:
+        st.error("⚠️ Límite de facturación alcanzado en el proveedor seleccionado.")
     else:
-        diagram += "    KEY[Luz Principal] --> SUB\n    FILL[Luz de Relleno] --> SUB\n    RIM[Luz de Recorte] --> SUB"
-
-    json_output = {
-        "cinematógrafo": "Asistente IMAX Antigravity V2",
-        "tipo_de_toma": angle_name,
-        "movimiento": movement,
-        "motor_optimizado": engine,
-        "descripcion": scene,
-        "datos_de_consistencia": {
-            "rasgos_personaje": character,
-            "vestuario": wardrobe,
-            "paleta_color": color
-        },
-        "stack_tecnico": {
-            "formato": "IMAX 70mm (15-perf)",
-            "lente": lens,
-            "pelicula": stock,
-            "relacion_aspecto": aspect_ratio
-        },
-        "intencion_director": director,
-        "esquema_iluminacion": diagram,
-        "prompt_imagen": image_prompt,
-        "prompt_movimiento": movement_prompt
-    }
-    return json_output, image_prompt, movement_prompt, diagram
+        st.error(f"Error en {engine_choice}: {error_msg}")
 
-def generate_intelligence(system_prompt, user_input, engine_choice="GPT-5.2"):
+def generate_intelligence(system_prompt, user_input, engine_choice="GPT-5.2", use_cache=True,
+                          race_pool=None, hedge_delay="auto", validate=None):
     """Lógica multicanal para análisis y razonamiento"""
     try:
-        if engine_choice == "GPT-5.2":
-            if "OPENAI_API_KEY" not in st.secrets:
-                st.error("Falta OPENAI_API_KEY para activar GPT-5.2.")
-                return None
-            client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-            response = client.responses.create(
-                model="gpt-5.2",
-                input=f"SYSTEM: {system_prompt}\nUSER: {user_input}"
-            )
-            return response.output_text
-            
-        elif engine_choice == "GPT-4o-mini (Fast)":
-            if "OPENAI_API_KEY" not in st.secrets:
-                st.error("Falta OPENAI_API_KEY.")
-                return None
-            client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_input}
-                ]
-            )
-            return response.choices[0].message.content
-            
-        elif engine_choice == "Gemini Flash (Free)":
-            if "GOOGLE_API_KEY" not in st.secrets:
-                st.error("Falta GOOGLE_API_KEY.")
-                return None
-            client = genai.Client(api_key=st.secrets["GOOGLE_API_KEY"])
-            # Usando el modelo Flash para análisis de texto rápido/gratis
-            response = client.models.generate_content(
-                model='gemini-1.5-flash',
-                contents=f"{system_prompt}\n\n{user_input}"
-            )
-            return response.text
-            
+        return complete(engine_choice, system_prompt, user_input, st.secrets, use_cache,
+                        race_pool, hedge_delay, validate)
     except Exception as e:
-        error_msg = str(e)
-        if "billing_hard_limit_reached" in error_msg or "insufficient_quota" in error_msg:
-            st.error("⚠️ Límite de facturación alcanzado en el proveedor seleccionado.")
-        else:
-            st.error(f"Error en {engine_choice}: {error_msg}")
+        _report_engine_error(engine_choice, e)
         return None
 
-def analyze_audio_with_gemini(audio_file_path, char_desc, vibe, mime_type, duration_seconds=0):
+def analyze_audio_with_gemini(audio_source, char_desc, vibe, mime_type, duration_seconds=0, on_text=None, audio_hash=None, slots=None,
+                              sections=None):
     try:
         if "GOOGLE_API_KEY" not in st.secrets:
             st.error("Falta GOOGLE_API_KEY en los secretos de Streamlit.")
             return None
         
-        # Usando la nueva librería google-genai para mayor robustez
-        client = genai.Client(api_key=st.secrets["GOOGLE_API_KEY"])
-        
-        # Subir archivo usando el nuevo SDK (Google Gen AI)
-        with open(audio_file_path, "rb") as f:
-            audio_file = client.files.upload(file=f, config={'mime_type': mime_type})
-        
-        # Duración legible para el prompt
-        duration_info = f"Duration: {round(duration_seconds, 1)} seconds." if duration_seconds > 0 else ""
-        
-        prompt = f"""
-        Analyze this audio ({duration_info}) and create a COMPREHENSIVE cinematographic storyboard.
-        
-        MANDATORY STEP 1: PRODUCTION BIBLE
-        Based on the lyrics, rhythm, and vibe, detect and define:
-        - LOCATION: Where is this taking place?
-        - CHARACTER: Who is the protagonist? (Physical traits)
-        - WARDROBE: What are they wearing?
-        - EPOCH: When is this happening? (Past, Present, Future, Specific Year)
-        
-        MANDATORY STEP 2: STORYBOARD SEQUENCE
-        Create a sequence of shots covering the entire {duration_seconds}s.
-        For each shot, provide exactly:
-        1. Timestamp (e.g., 0:05)
-        2. Scene Action (English)
-        3. IMAGE PROMPT: Detailed visual description (No camera movement here)
-        4. MOVEMENT PROMPT: Specific technical camera movement instruction
-        5. Mood/Atmosphere
-        
-        FORMATTING RULE:
-        Start your response with a JSON-like block for the PRODUCTION BIBLE so I can parse it, then follow with the Markdown Storyboard.
-        Example:
-        ---PRODUCTION_BIBLE---
-        LOCATION: [Value]
-        CHARACTER: [Value]
-        WARDROBE: [Value]
-        EPOCH: [Value]
-        ---END_BIBLE---
-        
-        Maintain absolute visual consistency across all shots based on the PRODUCTION BIBLE.
-        """
-        
-        response = None
-        # Probamos varios identificadores comunes para asegurar compatibilidad en 2026
-        for model_id in ['gemini-2.0-flash', 'gemini-1.5-flash-latest', 'gemini-1.5-flash']:
-            try:
-                response = client.models.generate_content(
-                    model=model_id,
-                    contents=[prompt, audio_file]
-                )
-                if response: break
-            except Exception as e_model:
-                if "404" in str(e_model) or "not found" in str(e_model).lower():
-                    continue
-                else:
-                    raise e_model
-        
-        if not response:
+        text = generate_storyboard(st.secrets["GOOGLE_API_KEY"], audio_source, mime_type, duration_seconds,
+                                   on_text=on_text, audio_hash=audio_hash, slots=slots, sections=sections)
+        if not text:
             return "Error: No se encontró un modelo de Gemini Flash compatible."
             
-        return response.text
+        return text
+    except GeminiModelUnavailable:
+        return "Error: No se encontró un modelo de Gemini Flash compatible."
+    except (CircuitOpen, RateLimitTimeout) as e:
+        st.warning(f"⏳ {e}")
+        return None
     except Exception as e:
         st.error(f"Error analizando audio con Gemini (SDK GenAI): {str(e)}")
         return None
 
+def keep_trace(trace_):
+    """Guarda la traza en la sesión para el panel de rendimiento (últimas 10)"""
+    traces = st.session_state.setdefault('perf_traces', [])
+    traces.append(trace_)
+    del traces[:-10]
+
+
+def render_perf_panel():
+    traces = st.session_state.get('perf_traces', [])
+    if not traces:
+        st.caption("Aún no hay ejecuciones medidas en esta sesión.")
+        return
+    names = [f"{t.name} · {t.duration * 1000:.0f} ms · {time.strftime('%H:%M:%S', time.localtime(t.started_at))}"
+             for t in traces]
+    selected = st.selectbox("Ejecución:", range(len(traces)), index=len(traces) - 1,
+                            format_func=lambda i: names[i], key="perf_trace_choice")
+    st.code(traces[selected].waterfall(), language=None)
+    st.download_button("⬇️ Trazas (JSONL)",
+                       "".join(json.dumps(t.to_dict(), ensure_ascii=False) + "\n" for t in traces),
+                       file_name="perf_traces.jsonl", mime="application/json")
+    st.download_button("⬇️ Histogramas (Prometheus)", STAGES.prometheus_text(),
+                       file_name="cine_stages.prom", mime="text/plain")
+
+def render_bible_metrics(bible_data):
+    cols = st.columns(4)
+    with cols[0]: st.metric("📍 Localización", bible_data.get('LOCATION', 'N/A'))
+    with cols[1]: st.metric("👤 Personaje", bible_data.get('CHARACTER', 'N/A')[:20] + "...")
+    with cols[2]: st.metric("👕 Vestuario", bible_data.get('WARDROBE', 'N/A')[:20] + "...")
+    with cols[3]: st.metric("⏳ Época", bible_data.get('EPOCH', 'N/A'))
+
+def render_section_errors(full_text, name=None):
+    """Aviso de storyboard incompleto: secciones del tema que fallaron y quedaron sin tomas"""
+    from shot_scheduler import format_time
+
+    prefix = f"{name}: " if name else ""
+    for error in storyboard_section_errors(full_text):
+        st.warning(f"⚠️ {prefix}la sección {error.get('section')} ({error.get('label', '')} "
+                   f"{format_time(error.get('start') or 0)}-{format_time(error.get('end') or 0)}) "
+                   f"quedó sin tomas: {error.get('error', '')}")
+
+# Las listas de tomas se aíslan en fragmentos: sus propios widgets solo rerenderizan
+# el fragmento, no todo main()
+
+@st.fragment
+def render_shot_list(shots, engine_label):
+    for i, shot in enumerate(shots):
+        with st.expander(f"Toma {i+1}: {shot.angle_name} | {shot.movement} ({engine_label})", expanded=(i==0)):
+            st.write("#### 🖼️ Prompt de Imagen")
+            st.code(shot.image_prompt, language=None)
+            
+            st.write("#### 🎥 Movimiento de Cámara")
+            st.code(shot.movement_prompt, language=None)
+            
+            st.info("💡 Haz clic en el botón de la esquina superior derecha de cada cuadro para copiar.")
+
+            st.write("---")
+            # Image generation removed per user request
+    
+    st.info("💡 **Tip:** Copia el prompt en tu generador de imágenes favorito (Midjourney, DALL-E, Flux, etc.)")
+
+def _load_shot(shot):
+    st.session_state['scene_creator'] = shot.scene
+    st.session_state['char_master'] = shot.character
+    st.session_state['wardrobe_master'] = shot.wardrobe
+
+@st.fragment
+def render_parsed_list(shots):
+    st.write("### 🎬 Lista de Tomas Derivada del Guion")
+    for i, shot in enumerate(shots):
+        with st.expander(f"Momento {i+1}: {shot.angle_name} | {shot.movement}", expanded=(i==0)):
+            st.write(f"**Acción:** *{shot.scene}*")
+            
+            # Carga rápida: el estado se escribe en el callback (antes de instanciar los widgets)
+            # y el rerun es de toda la app, porque cambian las anclas de la barra lateral
+            if st.button(f"📋 Cargar Toma {i+1}", key=f"btn_copy_{i}", on_click=_load_shot, args=(shot,)):
+                st.success("¡Toma cargada!")
+                st.rerun()
+
+            st.write("#### 🖼️ Prompt de Imagen")
+            st.code(shot.image_prompt, language=None)
+            st.write("#### 🎥 Movimiento")
+            st.code(shot.movement_prompt, language=None)
+
+def _save_project(name):
+    store = get_project_store()
+    project_id = store.save_project(name, st.session_state.get('char_master'), st.session_state.get('wardrobe_master'))
+    templates = get_templates()
+    for source, key in (("panel", 'shot_list_v2'), ("script", 'parsed_list')):
+        if key in st.session_state:
+            store.save_shots(project_id, source, st.session_state[key], templates)
+    if 'audio_storyboard' in st.session_state:
+        text = st.session_state['audio_storyboard']
+        store.save_storyboard(project_id, text, parse_bible(text), st.session_state.get('audio_slots'),
+                              st.session_state.get('audio_hash', ""))
+    return project_id
+
+def _open_project(project_id):
+    # Callback: el estado se escribe antes de instanciar los widgets (anclas de la barra lateral)
+    project = get_project_store().load_project(project_id)
+    if project is None:
+        return
+    st.session_state['project_name'] = project['name']
+    st.session_state['char_master'] = project['char_master']
+    st.session_state['wardrobe_master'] = project['wardrobe_master']
+    for source, key in (("panel", 'shot_list_v2'), ("script", 'parsed_list')):
+        if project['shots'].get(source):
+            st.session_state[key] = [generate_shot_cached(*inputs) for inputs in project['shots'][source]]
+        else:
+            st.session_state.pop(key, None)
+    storyboard = project['storyboard']
+    for key in ('audio_storyboard', 'audio_slots', 'audio_hash'):
+        st.session_state.pop(key, None)
+    if storyboard is not None:
+        st.session_state['audio_storyboard'] = storyboard['text']
+        if storyboard['slots']:
+            st.session_state['audio_slots'] = storyboard['slots']
+        st.session_state['audio_hash'] = storyboard['audio_hash']
+
+# El buscador es un fragmento: cambiar de página o de filtro solo rerenderiza el fragmento
+# y lee de SQLite únicamente las filas de la página visible
+
+@st.fragment
+def render_project_search():
+    store = get_project_store()
+    facets = store.facets()
+    query = st.text_input("Buscar en tomas guardadas:", placeholder="lluvia hangar anamórfico...", key="project_query")
+    cols = st.columns(3)
+    filters = {}
+    for col, (name, label) in zip(cols, (("director", "Director"), ("lens", "Lente"), ("angle", "Ángulo"))):
+        with col:
+            choice = st.selectbox(f"{label}:", ["Todos"] + facets[name], key=f"project_filter_{name}")
+            filters[name] = None if choice == "Todos" else choice
+
+    # Pila de cursores (id de la última fila de cada página); se reinicia al cambiar la búsqueda
+    signature = (query, tuple(filters.values()))
+    if st.session_state.get('project_search_signature') != signature:
+        st.session_state['project_search_signature'] = signature
+        st.session_state['project_search_cursors'] = [None]
+    cursors = st.session_state['project_search_cursors']
+
+    with span("projects.search", query=bool(query)) as stage:
+        rows, next_cursor = store.search_shots(query, before_id=cursors[-1], **filters)
+        stage["rows"] = len(rows)
+    if not rows:
+        st.caption("Sin resultados.")
+    for row in rows:
+        with st.expander(f"{row['project']} · {row['angle_name']} · {row['scene'][:60]}"):
+            st.caption(f"{row['director_key'] or 'Director personalizado'} | {row['lens']} | {row['engine']} "
+                       f"| {'Panel' if row['source'] == 'panel' else 'Guion'} #{row['position'] + 1}")
+            st.code(row['image_prompt'], language=None)
+            st.code(row['movement_prompt'], language=None)
+
+    nav = st.columns([1, 1, 4])
+    with nav[0]:
+        if st.button("⬅️ Anterior", disabled=len(cursors) == 1, key="project_prev"):
+            cursors.pop()
+            st.rerun(scope="fragment")
+    with nav[1]:
+        if st.button("Siguiente ➡️", disabled=next_cursor is None, key="project_next"):
+            cursors.append(next_cursor)
+            st.rerun(scope="fragment")
+    with nav[2]:
+        st.caption(f"Página {len(cursors)}")
+
+    matches = store.search_storyboards(query) if query else []
+    if matches:
+        st.write("#### 🎵 Storyboards")
+        for match in matches:
+            st.markdown(f"**{match['project']}** · {match['bible'].get('LOCATION', 'N/A')} — {match['excerpt']}")
+
+JOB_STATUS_LABELS = {
+    "queued": "⏳ En cola",
+    "analyzing": "🎚️ Analizando ritmo",
+    "storyboarding": "🎬 Storyboard",
+    "done": "✅ Lista",
+    "failed": "❌ Error",
+    "cancelled": "⏹️ Cancelada",
+}
+
+def _render_audio_jobs(batch, polling):
+    from audio_jobs import FINISHED, get_job_queue
+    from shot_scheduler import cut_list_csv, merge_storyboard
+
+    jobs = get_job_queue().jobs(batch)
+    active = [job for job in jobs if job['status'] not in FINISHED]
+    if polling and not active:
+        # Lote terminado: un rerun completo deja de consultar el estado
+        st.rerun()
+    st.progress((len(jobs) - len(active)) / len(jobs) if jobs else 0.0,
+                text=f"{len(jobs) - len(active)}/{len(jobs)} pistas terminadas")
+    rows = ["| Pista | Estado | BPM | Duración | Análisis | Storyboard |", "|---|---|---|---|---|---|"]
+    for job in jobs:
+        bpm = round(job['bpm'], 1) if job['bpm'] else "-"
+        duration, analysis_s, storyboard_s = (
+            "-" if job[key] is None else f"{job[key]:.1f}s" for key in ('duration', 'analysis_s', 'storyboard_s'))
+        rows.append(f"| {job['name']} | {JOB_STATUS_LABELS[job['status']]} | {bpm} | {duration} | "
+                    f"{analysis_s} | {storyboard_s} |")
+    st.markdown("\n".join(rows))
+    for job in jobs:
+        if job['error']:
+            st.error(f"{job['name']}: {job['error']}")
+        elif job['status'] == "done":
+            if job['storyboard']:
+                render_section_errors(job['storyboard'], job['name'])
+            with st.expander(f"🎞️ {job['name']} ({len(job['slots'] or [])} tomas)"):
+                if job['storyboard']:
+                    display_text = storyboard_display_text(job['storyboard'])
+                    st.markdown((merge_storyboard(job['slots'], display_text) if job['slots'] else None) or display_text)
+                if job['slots']:
+                    st.download_button("🎞️ Lista de Cortes (CSV)", cut_list_csv(job['slots']),
+                                       file_name=f"{job['name'].rsplit('.', 1)[0]}_cut_list.csv",
+                                       mime="text/csv", key=f"job_csv_{job['id']}")
+    if active and st.button("⏹️ Cancelar pistas pendientes", key="album_cancel"):
+        get_job_queue().cancel(batch)
+
+def render_audio_jobs(batch):
+    """Estado del lote; mientras haya pistas en curso el fragmento se refresca cada 2 s"""
+    from audio_jobs import FINISHED, get_job_queue
+
+    polling = any(job['status'] not in FINISHED for job in get_job_queue().jobs(batch))
+    st.fragment(_render_audio_jobs, run_every=2.0 if polling else None)(batch, polling)
+
 def main():
-    templates = TEMPLATES
+    # Plantillas compiladas (se recargan si cambia prompt_templates.json)
+    templates = get_templates()
+
+    # Resolución de modelos de Gemini en segundo plano: la primera petición ya no paga los 404
+    try:
+        google_key = st.secrets.get("GOOGLE_API_KEY")
+    except FileNotFoundError:
+        google_key = None
+    if google_key:
+        GEMINI_MODELS.prefetch(google_key)
     
     st.title("🎬 Asistente Cinematográfico PRO V2: IMAX Hub")
     st.subheader("Optimización de Prompts Cinematográficos (Sin Generadores de Imágenes)")
     
-    tabs = st.tabs(["🎮 Panel de Control", "📜 Analizador de Guion", "🎵 Ritmo & Audio (Storyboard)"])
+    tabs = st.tabs(["🎮 Panel de Control", "📜 Analizador de Guion", "🎵 Ritmo & Audio (Storyboard)", "🗂️ Proyectos"])
     
     with st.sidebar:
         st.write("### 🛡️ Master de Continuidad")
@@ -331,18 +358,56 @@ def main():
 
         st.write("---")
         st.write("### 🧠 Inteligencia Maestra")
-        intel_choice = st.selectbox("Motor de Razonamiento:", ["GPT-4o-mini (Fast)", "GPT-5.2", "Gemini Flash (Free)"], index=0)
+        intel_choice = st.selectbox("Motor de Razonamiento:", list(INTEL_MODELS.keys()) + [FASTEST_ENGINE], index=0)
+        race_pool, hedge_delay = None, "auto"
+        if intel_choice == FASTEST_ENGINE:
+            race_pool = st.multiselect("Motores en carrera (en orden de prioridad):", list(INTEL_MODELS.keys()),
+                                       default=["GPT-4o-mini (Fast)", "Gemini Flash (Free)"])
+            if not st.checkbox("Retardo de hedging adaptativo (p95 observado)", value=True):
+                hedge_delay = st.slider("Retardo entre motores (s):", 0.0, 10.0, 1.0, 0.5,
+                                        help="0 = lanzar todos los motores a la vez.")
+            for engine, stats in LATENCIES.summary().items():
+                st.caption(f"{engine}: p50 {stats['p50']:.1f}s | p95 {stats['p95']:.1f}s ({stats['n']} llamadas)")
+        for provider, state in PROVIDER_GUARD.states().items():
+            if state != "closed":
+                st.caption(f"⚠️ {provider}: proveedor degradado (circuito {state}); se desvía a otros motores.")
+        use_intel_cache = st.toggle("Reutilizar análisis en caché", value=True,
+                                    help="Evita repetir llamadas idénticas (mismo motor, instrucciones y guion).")
+        reuse_similar = st.toggle("Reutilizar escenas casi idénticas", value=True,
+                                  help="Las revisiones con cambios menores de una escena ya analizada reutilizan sus tomas.")
+        reuse_threshold = None
+        if reuse_similar:
+            from script_index import get_script_index
+            # Parte del umbral configurado (SCRIPT_SIMILARITY_THRESHOLD), dentro del rango del control
+            default_threshold = min(1.0, max(0.5, get_script_index().threshold))
+            reuse_threshold = st.slider("Similitud mínima para reutilizar:", 0.5, 1.0, default_threshold, 0.01)
+        cache_stats = get_response_cache().stats()
+        st.caption(f"Caché: {cache_stats['entries']} respuestas | {cache_stats['hits']} aciertos / {cache_stats['misses']} fallos")
+        with st.expander("📊 Consumo de Tokens"):
+            usage = USAGE.totals()
+            st.caption(f"{usage['calls']} llamadas ({usage['cache_hits']} desde caché local) | "
+                       f"Entrada: {usage['input_tokens']} ({usage['cached_ratio']:.0%} en caché del proveedor) | "
+                       f"Salida: {usage['output_tokens']}")
+            recent = USAGE.recent(10)
+            if recent:
+                rows = ["| Motor | Entrada | En caché | Salida | Latencia |", "|---|---|---|---|---|"]
+                rows += [f"| {u['engine']}{' (caché)' if u['source'] == 'cache' else ''} | {u['input_tokens']} | "
+                         f"{u['cached_tokens']} | {u['output_tokens']} | {u['latency_s']:.1f}s |" for u in reversed(recent)]
+                st.markdown("\n".join(rows))
+        show_perf = st.toggle("🐞 Panel de rendimiento", value=False,
+                              help="Cascada de etapas de las últimas ejecuciones e histogramas por etapa.")
+        # Se rellena al final de la ejecución para incluir la traza recién medida
+        perf_panel = st.container()
         
         st.write("### 🎥 Cámara y Estilo")
-        # Use direct dict access from TEMPLATES to satisfy linter
-        director_choice = st.selectbox("Firma Visual del Director:", list(TEMPLATES["director_styles"].keys()))
-        lens_choice = st.selectbox("Características del Lente:", list(TEMPLATES["lens_presets"].keys()))
-        movement_choice = st.selectbox("Movimiento de Cámara:", list(TEMPLATES["camera_movements"].keys()))
-        stock_choice = st.selectbox("Tipo de Película (Stock):", list(TEMPLATES['film_stocks']))
-        color_choice = st.selectbox("Paleta de Color:", list(TEMPLATES["color_palettes"].keys()))
+        director_choice = st.selectbox("Firma Visual del Director:", list(templates["director_styles"].keys()))
+        lens_choice = st.selectbox("Características del Lente:", list(templates["lens_presets"].keys()))
+        movement_choice = st.selectbox("Movimiento de Cámara:", list(templates["camera_movements"].keys()))
+        stock_choice = st.selectbox("Tipo de Película (Stock):", list(templates['film_stocks']))
+        color_choice = st.selectbox("Paleta de Color:", list(templates["color_palettes"].keys()))
         
         st.write("### 🚀 Motor de IA Destino")
-        engine_choice = st.selectbox("Optimizar para:", ["Meta AI / Grok", "Midjourney", "DALL-E 3", "Qwen / Flux"])
+        engine_choice = st.selectbox("Optimizar para:", TARGET_ENGINES)
 
     with tabs[0]:
         col1, col2 = st.columns([1, 1.5])
@@ -359,7 +424,7 @@ def main():
             wardrobe_desc = st.session_state['wardrobe_master']
             
             st.write("### 📸 Ángulos de Cámara")
-            shot_angles_keys = list(TEMPLATES['shot_angles'].keys())
+            shot_angles_keys = list(templates['shot_angles'].keys())
             selected_angles = st.multiselect("Selecciona ángulos para la lista de tomas:", shot_angles_keys, default=["Plano General (WS)", "Primer Plano (CU)"], key="angles_creator")
 
             if st.button("🎬 ACCIÓN: Generar Lista de Tomas"):
@@ -367,40 +432,30 @@ def main():
                     st.error("Por favor, proporciona descripciones de la escena y del personaje.")
                 else:
                     results = []
-                    for angle in selected_angles:
-                        json_res, img_p, mov_p, diag_res = generate_prompt(
-                            scene_desc, 
-                            char_desc,
-                            wardrobe_desc,
-                            TEMPLATES['color_palettes'][color_choice],
-                            TEMPLATES['director_styles'][director_choice],
-                            lens_choice,
-                            stock_choice,
-                            TEMPLATES['camera_movements'][movement_choice],
-                            angle,
-                            TEMPLATES['shot_angles'][angle],
-                            engine_choice
-                        )
-                        results.append((json_res, img_p, mov_p, diag_res))
+                    with trace("shot_list") as run, span("prompts.render", count=len(selected_angles)):
+                        for angle in selected_angles:
+                            # Memorizado: solo se recalculan las tomas cuyas entradas cambiaron
+                            shot = generate_shot_cached(
+                                scene_desc, 
+                                char_desc,
+                                wardrobe_desc,
+                                templates['color_palettes'][color_choice],
+                                templates['director_styles'][director_choice],
+                                lens_choice,
+                                stock_choice,
+                                templates['camera_movements'][movement_choice],
+                                angle,
+                                templates['shot_angles'][angle],
+                                engine_choice
+                            )
+                            results.append(shot)
                     st.session_state['shot_list_v2'] = results
+                    keep_trace(run)
 
         with col2:
             st.write("### 💎 Salida Cinematográfica (V2)")
             if 'shot_list_v2' in st.session_state:
-                for i, (json_res, img_p, mov_p, diag_res) in enumerate(st.session_state['shot_list_v2']):
-                    with st.expander(f"Toma {i+1}: {json_res['tipo_de_toma']} | {json_res['movimiento']} ({engine_choice})", expanded=(i==0)):
-                        st.write("#### 🖼️ Prompt de Imagen")
-                        st.code(img_p, language=None)
-                        
-                        st.write("#### 🎥 Movimiento de Cámara")
-                        st.code(mov_p, language=None)
-                        
-                        st.info("💡 Haz clic en el botón de la esquina superior derecha de cada cuadro para copiar.")
-
-                        st.write("---")
-                        # Image generation removed per user request
-                
-                st.info("💡 **Tip:** Copia el prompt en tu generador de imágenes favorito (Midjourney, DALL-E, Flux, etc.)")
+                render_shot_list(st.session_state['shot_list_v2'], engine_choice)
             else:
                 st.write("Completa los detalles y elige un Director Maestro para generar tus tomas.")
 
@@ -418,9 +473,15 @@ def main():
             if not script_text or not parser_char:
                 st.error("Por favor, proporciona el texto del guion e identidad del personaje.")
             else:
-                if intel_choice:
-                    with st.spinner(f"{intel_choice} analizando subtexto y persistencia visual..."):
-                        system_instr = """Eres un Director de Fotografía experto y Jefe de Continuidad. 
+                with trace("script_analysis") as run:
+                    if intel_choice:
+                        with span("script.split", chars=len(script_text)) as stage:
+                            scenes = split_scenes(script_text)
+                            stage["scenes"] = len(scenes)
+                        if reuse_similar:
+                            from script_index import get_script_index
+                        with st.spinner(f"{intel_choice} analizando subtexto y persistencia visual ({len(scenes)} escenas)..."):
+                            system_instr = """Eres un Director de Fotografía experto y Jefe de Continuidad. 
                         Analiza el guion y devuelve UNA LISTA de hasta 5 momentos clave.
                         
                         REGLA DE ORO DE CONTINUIDAD:
@@ -433,74 +494,66 @@ def main():
                         
                         Formato: Acción | Personaje | Vestuario"""
                         
-                        analysis = generate_intelligence(system_instr, f"Guion: {script_text}", intel_choice)
-                        if analysis:
-                            # Parsear la lista mejorada
-                            moments_data = []
-                            for line in analysis.split('\n'):
-                                if '|' in line:
-                                    parts = line.split('|')
-                                    if len(parts) >= 3:
-                                        moments_data.append({
-                                            'action': parts[0].strip(),
-                                            'char': parts[1].strip(),
-                                            'wardrobe': parts[2].strip()
-                                        })
-                            moments = moments_data[:5]
-                        else:
-                            # Fallback simple
-                            moments = [{'action': line.strip(), 'char': parser_char, 'wardrobe': parser_wardrobe} 
-                                      for line in script_text.split('.') if len(line.strip()) > 10][:5]
-                else:
-                    # Simple logic to simulate "parsing" key moments
-                    moments = [line.strip() for line in script_text.split('.') if len(line.strip()) > 10][:5]
+                            # Escenas analizadas en paralelo; las fallidas usan el fallback simple
+                            scene_progress = st.progress(0.0, text="Analizando escenas...")
+
+                            def _on_scene(done, total, scene, error):
+                                label = scene.heading or "Fragmento inicial"
+                                scene_progress.progress(done / total, text=f"Escena {done}/{total} lista: {label}" + (" (fallback)" if error else ""))
+
+                            # Las tomas se muestran en cuanto cada fila llega del motor (streaming)
+                            live_moments = st.container()
+
+                            def _on_moment(scene, moment):
+                                reused = f" ♻️ ({moment['reused']:.0%})" if moment.get('reused') else ""
+                                live_moments.write(f"🎬 **{scene.heading or 'Guion'}** — {moment['action']}{reused}")
+
+                            moments, scene_errors = analyze_scenes(scenes, system_instr, intel_choice, st.secrets,
+                                                                   parser_char, parser_wardrobe, use_intel_cache,
+                                                                   race_pool, hedge_delay, progress=_on_scene,
+                                                                   on_moment=_on_moment,
+                                                                   reuse=get_script_index() if reuse_similar else None,
+                                                                   reuse_threshold=reuse_threshold)
+                            for error in {str(e): e for e in scene_errors.values()}.values():
+                                _report_engine_error(intel_choice, error)
+                            if len(scenes) <= 1:
+                                moments = moments[:5]
+                    else:
+                        # Simple logic to simulate "parsing" key moments
+                        moments = [line.strip() for line in script_text.split('.') if len(line.strip()) > 10][:5]
                 
-                if not moments: moments = [script_text[:100]] # Fallback
+                    if not moments: moments = [script_text[:100]] # Fallback
                 
-                # Assign angles based on keywords or cycle
-                shot_angles_keys_list = list(TEMPLATES['shot_angles'].keys())
-                results = []
-                for i, m_data in enumerate(moments): 
-                    # Type checking to satisfy linter
-                    if not isinstance(m_data, dict): continue
+                    # Assign angles based on keywords or cycle
+                    shot_angles_keys_list = list(templates['shot_angles'].keys())
+                    results = []
+                    with span("prompts.render", count=len(moments)):
+                        for i, m_data in enumerate(moments): 
+                            # Type checking to satisfy linter
+                            if not isinstance(m_data, dict): continue
                     
-                    angle_idx = int(i % len(shot_angles_keys_list))
-                    angle = shot_angles_keys_list[angle_idx]
+                            angle_idx = int(i % len(shot_angles_keys_list))
+                            angle = shot_angles_keys_list[angle_idx]
                     
-                    json_res, img_p, mov_p, diag_res = generate_prompt(
-                        m_data.get('action', ''), 
-                        m_data.get('char', ''),
-                        m_data.get('wardrobe', ''),
-                        TEMPLATES['color_palettes'][color_choice],
-                        TEMPLATES['director_styles'][director_choice],
-                        lens_choice,
-                        stock_choice,
-                        TEMPLATES['camera_movements'][movement_choice],
-                        angle,
-                        TEMPLATES['shot_angles'][angle],
-                        engine_choice
-                    )
-                    results.append((json_res, img_p, mov_p, diag_res))
-                st.session_state['parsed_list'] = results
+                            shot = generate_shot_cached(
+                                m_data.get('action', ''), 
+                                m_data.get('char', ''),
+                                m_data.get('wardrobe', ''),
+                                templates['color_palettes'][color_choice],
+                                templates['director_styles'][director_choice],
+                                lens_choice,
+                                stock_choice,
+                                templates['camera_movements'][movement_choice],
+                                angle,
+                                templates['shot_angles'][angle],
+                                engine_choice
+                            )
+                            results.append(shot)
+                    st.session_state['parsed_list'] = results
+                keep_trace(run)
 
         if 'parsed_list' in st.session_state:
-            st.write("### 🎬 Lista de Tomas Derivada del Guion")
-            for i, (json_res, img_p, mov_p, diag_res) in enumerate(st.session_state['parsed_list']):
-                with st.expander(f"Momento {i+1}: {json_res['tipo_de_toma']} | {json_res['movimiento']}", expanded=(i==0)):
-                    st.write(f"**Acción:** *{json_res['descripcion']}*")
-                    
-                    # Carga rápida
-                    if st.button(f"📋 Cargar Toma {i+1}", key=f"btn_copy_{i}"):
-                        st.session_state['scene_creator'] = json_res['descripcion']
-                        st.session_state['char_master'] = json_res['datos_de_consistencia']['rasgos_personaje']
-                        st.session_state['wardrobe_master'] = json_res['datos_de_consistencia']['vestuario']
-                        st.success("¡Toma cargada!")
-                        st.rerun()
-
-                    st.write("#### 🖼️ Prompt de Imagen")
-                    st.code(img_p, language=None)
-                    st.write("#### 🎥 Movimiento")
-                    st.code(mov_p, language=None)
+            render_parsed_list(st.session_state['parsed_list'])
 
     with tabs[2]:
         st.write("### 🎵 Generador de Storyboard por Ritmo")
@@ -510,51 +563,83 @@ def main():
         audio_char = st.text_input("Protagonista para el Storyboard:", placeholder="Un cosmonauta perdido en Marte")
         
         if uploaded_audio and st.button("🔥 GENERAR STORYBOARD SINCRONIZADO"):
-            with st.spinner("Analizando ritmo y narrativa..."):
-                with tempfile.NamedTemporaryFile(delete=False, suffix=uploaded_audio.name[uploaded_audio.name.rfind('.'):]) as tmp:
-                    tmp.write(uploaded_audio.getbuffer())
-                    tmp_path = tmp.name
-                
-                try:
-                    # 1. Librosa BPM & Duration Analysis
-                    y, sr = librosa.load(tmp_path)
-                    duration_secs = librosa.get_duration(y=y, sr=sr)
-                    tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-                    bpm = float(np.mean(tempo))
+            # La pila científica (numpy/librosa) solo se carga al usar esta pestaña
+            from audio_analysis import analyze_audio
+            from audio_cache import audio_digest, get_audio_store
+            from shot_scheduler import detect_sections, format_time, schedule_shots
+
+            with trace("storyboard") as run:
+                with st.spinner("Analizando ritmo y narrativa..."):
+                    audio_store = get_audio_store()
+                    # Todo el pipeline trabaja sobre el buffer en memoria del archivo subido
+                    # (UploadedFile es un BytesIO): sin copias a disco ni relecturas
+                    with span("audio.hash", bytes=uploaded_audio.size):
+                        audio_hash = audio_digest(uploaded_audio.getbuffer())
+
+                    # 1. Librosa BPM & Duration Analysis (por bloques, memoria acotada),
+                    # cacheado por hash del contenido para no decodificar dos veces la misma canción
+                    with span("audio.features") as stage:
+                        features = audio_store.get_features(audio_hash)
+                        stage["cached"] = features is not None
+                        if features is None:
+                            features = analyze_audio(uploaded_audio)
+                            audio_store.put_features(audio_hash, features)
+                    duration_secs = features['duration']
+                    bpm = features['bpm']
                     st.success(f"Track Detectado: {round(bpm, 1)} BPM | Duración: {round(duration_secs, 1)}s")
-                    
-                    # 2. Gemini Analysis
-                    storyboard_text = analyze_audio_with_gemini(tmp_path, audio_char, director_choice, uploaded_audio.type, duration_secs)
-                    
+
+                    # Cortes calculados localmente sobre beats y compases (energía -> tamaño de plano)
+                    with span("audio.schedule") as stage:
+                        slots = schedule_shots(features)
+                        stage["slots"] = len(slots)
+                    # Temas largos: secciones musicales que se storyboardean en paralelo
+                    with span("audio.sections") as stage:
+                        sections = detect_sections(features, slots)
+                        stage["sections"] = len(sections)
+                    if len(sections) > 1:
+                        st.caption("Secciones: " + " · ".join(
+                            f"{s['label']} {format_time(s['start'])}-{format_time(s['end'])}" for s in sections))
+                    st.session_state['audio_slots'] = slots
+                    st.session_state['audio_hash'] = audio_hash
+                
+                    # 2. Gemini Analysis (en streaming: biblia y tomas aparecen según llegan)
+                    live_bible = st.empty()
+                    live_story = st.empty()
+                    stream_parser = StoryboardStreamParser()
+
+                    def _on_text(delta):
+                        shown = len(stream_parser.story_lines)
+                        if stream_parser.feed(delta):
+                            with live_bible.container():
+                                render_bible_metrics(stream_parser.bible)
+                        if len(stream_parser.story_lines) != shown:
+                            live_story.markdown(stream_parser.display_text)
+
+                    storyboard_text = analyze_audio_with_gemini(uploaded_audio, audio_char, director_choice, uploaded_audio.type, duration_secs,
+                                                                on_text=_on_text, audio_hash=audio_hash, slots=slots,
+                                                                sections=sections)
+                    live_bible.empty()
+                    live_story.empty()
+                
                     if storyboard_text:
                         st.session_state['audio_storyboard'] = storyboard_text
-                finally:
-                    if os.path.exists(tmp_path):
-                        os.remove(tmp_path)
         
+            keep_trace(run)
+
         if 'audio_storyboard' in st.session_state:
+            from shot_scheduler import cut_list_csv, merge_storyboard
+
             st.write("### � Biblia de Producción & Storyboard")
             
             full_text = st.session_state['audio_storyboard']
             
             # Parsing the Production Bible
-            bible_data = {}
-            if "---PRODUCTION_BIBLE---" in full_text and "---END_BIBLE---" in full_text:
-                try:
-                    bible_part = full_text.split("---PRODUCTION_BIBLE---")[1].split("---END_BIBLE---")[0].strip()
-                    for line in bible_part.split('\n'):
-                        if ':' in line:
-                            k, v = line.split(':', 1)
-                            bible_data[k.strip().upper()] = v.strip()
-                except Exception:
-                    pass
+            with span("storyboard.parse", chars=len(full_text)):
+                bible_data = parse_bible(full_text)
+                display_text = storyboard_display_text(full_text)
             
             if bible_data:
-                cols = st.columns(4)
-                with cols[0]: st.metric("📍 Localización", bible_data.get('LOCATION', 'N/A'))
-                with cols[1]: st.metric("👤 Personaje", bible_data.get('CHARACTER', 'N/A')[:20] + "...")
-                with cols[2]: st.metric("👕 Vestuario", bible_data.get('WARDROBE', 'N/A')[:20] + "...")
-                with cols[3]: st.metric("⏳ Época", bible_data.get('EPOCH', 'N/A'))
+                render_bible_metrics(bible_data)
                 
                 if st.button("🔄 Sincronizar Biblia con Master de Continuidad"):
                     if 'CHARACTER' in bible_data: st.session_state['char_master'] = bible_data['CHARACTER']
@@ -563,12 +648,64 @@ def main():
                     st.rerun()
             
             st.write("---")
+            render_section_errors(full_text)
             # Remove the bible block from display to keep it clean if desired, or show it all
-            display_text = full_text.split("---END_BIBLE---")[-1].strip() if "---END_BIBLE---" in full_text else full_text
-            st.markdown(display_text)
+            slots = st.session_state.get('audio_slots')
+            st.markdown((merge_storyboard(slots, display_text) if slots else None) or display_text)
+            if slots:
+                st.download_button("🎞️ Exportar Lista de Cortes (CSV)", cut_list_csv(slots),
+                                   file_name="cut_list.csv", mime="text/csv")
             
             st.write("---")
             st.caption("Tip: Los detalles de personaje y vestuario detectados se pueden aplicar a todo el proyecto usando el botón de sincronización.")
 
+        st.write("---")
+        st.write("### 📀 Lote de Pistas (Álbum)")
+        st.info("Encola varias pistas: el análisis de ritmo se reparte entre los núcleos y los storyboards se generan en segundo plano mientras sigues trabajando.")
+        album = st.file_uploader("Sube las pistas del álbum (mp3, wav)", type=["mp3", "wav"],
+                                 accept_multiple_files=True, key="album_upload")
+        album_storyboards = st.checkbox("Generar también el storyboard de cada pista", value=True)
+        if album and st.button("📥 ENCOLAR PISTAS"):
+            from audio_jobs import get_job_queue
+
+            if album_storyboards and not google_key:
+                st.warning("Falta GOOGLE_API_KEY: solo se analizará el ritmo de las pistas.")
+            batch = st.session_state.setdefault('audio_batch', uuid.uuid4().hex)
+            job_queue = get_job_queue()
+            with span("audio_jobs.submit", tracks=len(album)):
+                for track in album:
+                    job_queue.submit(batch, track.name, track.getvalue(), track.type,
+                                     google_key if album_storyboards else None)
+        if 'audio_batch' in st.session_state:
+            render_audio_jobs(st.session_state['audio_batch'])
+
+    with tabs[3]:
+        st.write("### 🗂️ Proyectos Guardados")
+        st.info("Guarda las anclas, las listas de tomas y el storyboard de la sesión para recuperarlos sin volver a generarlos.")
+        store = get_project_store()
+
+        col_p1, col_p2 = st.columns(2)
+        with col_p1:
+            project_name = st.text_input("Nombre del proyecto:", key="project_name")
+            if st.button("💾 Guardar Proyecto", disabled=not project_name):
+                with span("projects.save"):
+                    _save_project(project_name)
+                st.success(f"Proyecto '{project_name}' guardado.")
+        with col_p2:
+            projects = store.list_projects()
+            if projects:
+                labels = {p['id']: f"{p['name']} ({p['shots']} tomas, {p['storyboards']} storyboards)" for p in projects}
+                project_id = st.selectbox("Abrir proyecto:", list(labels), format_func=labels.get)
+                st.button("📂 Abrir Proyecto", on_click=_open_project, args=(project_id,))
+            else:
+                st.caption("Aún no hay proyectos guardados.")
+
+        st.write("---")
+        render_project_search()
+
+    if show_perf:
+        with perf_panel:
+            render_perf_panel()
+
 if __name__ == "__main__":
     main()
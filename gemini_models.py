@@ -0,0 +1,195 @@
+import hashlib
+import os
+import threading
+import time
+
+from llm_clients import get_gemini_client
+from resilience import status_code
+
+# Resolución de modelos de Gemini compartida por el proceso: qué identificador funciona
+# para cada capacidad se averigua una vez (con una sola llamada de listado, en segundo
+# plano al arrancar) y se recuerda con caducidad, en lugar de encadenar 404 por petición.
+
+# Candidatos por capacidad, en orden de preferencia
+MODEL_CANDIDATES = {
+    "audio": ["gemini-2.0-flash", "gemini-1.5-flash-latest", "gemini-1.5-flash"],
+    "text": ["gemini-1.5-flash", "gemini-2.0-flash", "gemini-1.5-flash-latest"],
+}
+
+# Segundos que se recuerda un modelo resuelto (GEMINI_MODEL_TTL_SECONDS)
+DEFAULT_MODEL_TTL = 6 * 3600
+
+
+class GeminiModelUnavailable(RuntimeError):
+    """Ningún modelo candidato de la capacidad está disponible para esta API key"""
+
+
+def is_model_not_found(error, model_id=None):
+    """404 sobre un recurso de modelo (models/...), no sobre un archivo subido u otra ruta"""
+    if status_code(error) != 404:
+        return False
+    message = str(error)
+    return "models/" in message or (model_id is not None and model_id in message)
+
+
+def _account(api_key):
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+class ModelResolver:
+    def __init__(self, candidates=MODEL_CANDIDATES, ttl_seconds=None):
+        self.candidates = candidates
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(
+            os.environ.get("GEMINI_MODEL_TTL_SECONDS", DEFAULT_MODEL_TTL))
+        # (cuenta, capacidad) -> (modelo, caduca); (cuenta, modelo) -> caduca para los no disponibles
+        self._resolved = {}
+        self._unavailable = {}
+        self._lock = threading.Lock()
+        # Un solo sondeo en vuelo por (cuenta, capacidad): las demás peticiones lo esperan
+        self._probes = {}
+        # cuenta -> (nombres listados, caduca)
+        self._listed = {}
+        # cuenta -> hilo de sondeo en segundo plano
+        self._prefetch_threads = {}
+
+    def _list_models(self, client, account):
+        with self._lock:
+            entry = self._listed.get(account)
+        if entry is not None and entry[1] > time.time():
+            return entry[0]
+        try:
+            listed = {m.name.split("/", 1)[-1] for m in client.models.list()}
+        except Exception:
+            return None
+        with self._lock:
+            self._listed[account] = (listed, time.time() + self.ttl_seconds)
+        return listed
+
+    def _probe(self, client, account, capability):
+        # Una llamada de listado por cuenta cubre todas las capacidades; los alias
+        # (-latest) que no aparecen en el listado se comprueban uno a uno con models.get
+        listed = self._list_models(client, account)
+        now = time.time()
+        for model_id in self.candidates[capability]:
+            with self._lock:
+                if self._unavailable.get((account, model_id), 0) > now:
+                    continue
+            if listed is not None and model_id in listed:
+                return model_id, True
+            try:
+                client.models.get(model=model_id)
+                return model_id, True
+            except Exception as e:
+                if not is_model_not_found(e, model_id):
+                    # Fallo de red o cuota: se usa el candidato sin recordarlo
+                    return model_id, False
+                self._mark(account, model_id)
+        raise GeminiModelUnavailable(f"Ningún modelo de Gemini disponible para '{capability}'.")
+
+    def _mark(self, account, model_id):
+        with self._lock:
+            self._unavailable[(account, model_id)] = time.time() + self.ttl_seconds
+
+    def cached(self, api_key, capability):
+        """Modelo resuelto vigente, o None (sin red)"""
+        with self._lock:
+            entry = self._resolved.get((_account(api_key), capability))
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    def resolve(self, api_key, capability, client=None):
+        """Identificador de modelo que funciona para `capability` con esta API key"""
+        model_id = self.cached(api_key, capability)
+        if model_id is not None:
+            return model_id
+        account = _account(api_key)
+        with self._lock:
+            probe = self._probes.get((account, capability))
+            owner = probe is None
+            if owner:
+                probe = self._probes[(account, capability)] = threading.Event()
+        if not owner:
+            probe.wait()
+            model_id = self.cached(api_key, capability)
+            if model_id is not None:
+                return model_id
+        try:
+            model_id, confirmed = self._probe(client or get_gemini_client(api_key), account, capability)
+            if confirmed:
+                with self._lock:
+                    self._resolved[(account, capability)] = (model_id, time.time() + self.ttl_seconds)
+            return model_id
+        finally:
+            if owner:
+                with self._lock:
+                    del self._probes[(account, capability)]
+                probe.set()
+
+    def unavailable(self, api_key, capability, model_id):
+        """Marca `model_id` como no disponible (p. ej. tras un 404) y devuelve el siguiente"""
+        account = _account(api_key)
+        self._mark(account, model_id)
+        with self._lock:
+            if self._resolved.get((account, capability), (None,))[0] == model_id:
+                del self._resolved[(account, capability)]
+        return self.resolve(api_key, capability)
+
+    def prefetch(self, api_key):
+        """Resuelve todas las capacidades en un hilo de fondo (no bloquea el arranque)"""
+        def _run():
+            for capability in self.candidates:
+                try:
+                    self.resolve(api_key, capability)
+                except Exception:
+                    # Se reintenta en la primera petición real
+                    pass
+
+        if all(self.cached(api_key, capability) for capability in self.candidates):
+            return None
+        account = _account(api_key)
+        with self._lock:
+            # Los reruns de Streamlit no lanzan un sondeo nuevo mientras otro sigue en marcha
+            thread = self._prefetch_threads.get(account)
+            if thread is None or not thread.is_alive():
+                thread = threading.Thread(target=_run, name="gemini-model-probe", daemon=True)
+                self._prefetch_threads[account] = thread
+                thread.start()
+        return thread
+
+    def clear(self):
+        with self._lock:
+            self._resolved.clear()
+            self._unavailable.clear()
+            self._listed.clear()
+
+
+GEMINI_MODELS = ModelResolver()
+
+
+def generate_with_model(api_key, capability, call):
+    """call(model_id) con el modelo resuelto; ante un 404 pasa al siguiente candidato"""
+    model_id = GEMINI_MODELS.resolve(api_key, capability)
+    while True:
+        try:
+            return call(model_id)
+        except Exception as e:
+            if not is_model_not_found(e, model_id):
+                raise
+            model_id = GEMINI_MODELS.unavailable(api_key, capability, model_id)
+
+
+def stream_with_model(api_key, capability, call):
+    """Versión en streaming: solo cambia de modelo si aún no se emitió ningún fragmento"""
+    model_id = GEMINI_MODELS.resolve(api_key, capability)
+    while True:
+        emitted = False
+        try:
+            for item in call(model_id):
+                emitted = True
+                yield item
+            return
+        except Exception as e:
+            if emitted or not is_model_not_found(e, model_id):
+                raise
+            model_id = GEMINI_MODELS.unavailable(api_key, capability, model_id)
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Caché persistente (SQLite) de respuestas de los motores de razonamiento.
+# Direccionada por contenido: (motor, modelo, system prompt, entrada del usuario).
+# Se puede compartir entre procesos/usuarios apuntando LLM_CACHE_PATH a un disco común.
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "llm_responses.sqlite3")
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    engine TEXT NOT NULL,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def cache_key(engine, model, system_prompt, user_input):
+    payload = json.dumps([engine, model, system_prompt, user_input], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Caché LRU acotada por número de entradas, con TTL y contadores hit/miss compartidos"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _bump(self, name):
+        self._conn.execute(
+            "INSERT INTO counters(name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, engine, model, system_prompt, user_input, accept=None):
+        """Respuesta guardada o None; con `accept`, una entrada que no lo cumple se descarta (fallo)"""
+        return self.get_any([(engine, model)], system_prompt, user_input, accept)[1]
+
+    def get_any(self, candidates, system_prompt, user_input, accept=None):
+        """(motor, respuesta) de la primera entrada válida entre los pares (motor, modelo).
+
+        Es una sola consulta: cuenta un único acierto o fallo, no uno por candidato.
+        Devuelve (None, None) si ninguno está en caché.
+        """
+        keys = [cache_key(engine, model, system_prompt, user_input) for engine, model in candidates]
+        now = time.time()
+        with self._lock, self._conn:
+            rows = dict((key, (response, created)) for key, response, created in self._conn.execute(
+                f"SELECT key, response, created FROM responses WHERE key IN ({', '.join('?' * len(keys))})", keys))
+            for (engine, _), key in zip(candidates, keys):
+                if key not in rows:
+                    continue
+                response, created = rows[key]
+                expired = self.ttl_seconds and now - created > self.ttl_seconds
+                if expired or (accept is not None and not accept(response)):
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    continue
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self._bump("hits")
+                return engine, response
+            self._bump("misses")
+            return None, None
+
+    def put(self, engine, model, system_prompt, user_input, response):
+        key = cache_key(engine, model, system_prompt, user_input)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses(key, engine, model, response, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, engine, model, response, now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            # LRU: se descartan las entradas con acceso más antiguo
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+            self._conn.execute(
+                "INSERT INTO counters(name, value) VALUES ('evictions', ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (overflow,),
+            )
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        total = hits + misses
+        return {
+            "entries": entries,
+            "hits": hits,
+            "misses": misses,
+            "evictions": counters.get("evictions", 0),
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+        }
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.execute("DELETE FROM counters")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Instancia compartida del proceso, configurable por variables de entorno"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    os.environ.get("LLM_CACHE_PATH", DEFAULT_CACHE_PATH),
+                    int(os.environ.get("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+                    float(os.environ.get("LLM_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)),
+                )
+    return _cache
@@ -0,0 +1,124 @@
+import hashlib
+import os
+import threading
+
+# Pool de clientes LLM compartido por todo el proceso (todas las sesiones y reruns de
+# Streamlit). Un cliente por (proveedor, API key, base_url) reutiliza sus conexiones
+# HTTP keep-alive en lugar de abrir TLS nuevo en cada llamada.
+
+# Ajustes por proveedor; se pueden sobrescribir con variables de entorno
+# LLM_<PROVEEDOR>_TIMEOUT / LLM_<PROVEEDOR>_MAX_CONNECTIONS o con configure_pool().
+POOL_SETTINGS = {
+    "openai": {"timeout": 120.0, "connect_timeout": 10.0, "max_connections": 20},
+    "gemini": {"timeout": 180.0, "connect_timeout": 10.0, "max_connections": 20},
+}
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _setting(provider, name):
+    env_name = f"LLM_{provider.upper()}_{name.upper()}"
+    value = os.environ.get(env_name)
+    return type(POOL_SETTINGS[provider][name])(value) if value else POOL_SETTINGS[provider][name]
+
+
+def configure_pool(provider, timeout=None, connect_timeout=None, max_connections=None):
+    """Cambia los ajustes de un proveedor y descarta sus clientes para que se recreen"""
+    settings = POOL_SETTINGS[provider]
+    if timeout is not None:
+        settings["timeout"] = float(timeout)
+    if connect_timeout is not None:
+        settings["connect_timeout"] = float(connect_timeout)
+    if max_connections is not None:
+        settings["max_connections"] = int(max_connections)
+    close_clients(provider)
+
+
+def _pool_key(provider, api_key, base_url):
+    # La API key no se guarda en claro como clave del diccionario
+    digest = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    return (provider, digest, base_url)
+
+
+def _limits(provider):
+    import httpx
+
+    max_connections = _setting(provider, "max_connections")
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+
+
+def _build_openai(api_key, base_url):
+    from openai import OpenAI, DefaultHttpxClient, Timeout
+
+    timeout = Timeout(_setting("openai", "timeout"), connect=_setting("openai", "connect_timeout"))
+    http_client = DefaultHttpxClient(limits=_limits("openai"), timeout=timeout)
+    # Los reintentos los gestiona resilience.PROVIDER_GUARD (con cupo y breaker compartidos);
+    # los del SDK se sumarían a ellos y multiplicarían las peticiones en un 429
+    kwargs = {"api_key": api_key, "timeout": timeout, "http_client": http_client, "max_retries": 0}
+    if base_url:
+        kwargs["base_url"] = base_url
+    return OpenAI(**kwargs)
+
+
+def _connect_timeout_hook(connect_timeout):
+    # google-genai pasa a cada petición su timeout total, que pisa el del cliente httpx:
+    # el hook acota solo la fase de conexión, como Timeout(connect=...) en OpenAI
+    def hook(request):
+        timeout = request.extensions.get("timeout") or {}
+        request.extensions["timeout"] = dict(timeout, connect=connect_timeout)
+
+    return hook
+
+
+def _build_gemini(api_key, base_url):
+    from google import genai
+    from google.genai import types
+
+    options = {
+        # google-genai espera el timeout en milisegundos
+        "timeout": int(_setting("gemini", "timeout") * 1000),
+        "client_args": {
+            "limits": _limits("gemini"),
+            "event_hooks": {"request": [_connect_timeout_hook(_setting("gemini", "connect_timeout"))]},
+        },
+    }
+    if base_url:
+        options["base_url"] = base_url
+    return genai.Client(api_key=api_key, http_options=types.HttpOptions(**options))
+
+
+_BUILDERS = {"openai": _build_openai, "gemini": _build_gemini}
+
+
+def get_client(provider, api_key, base_url=None):
+    """Cliente compartido para el proveedor; se construye una sola vez por clave"""
+    base_url = base_url or os.environ.get(f"{provider.upper()}_BASE_URL") or None
+    key = _pool_key(provider, api_key, base_url)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = _BUILDERS[provider](api_key, base_url)
+    return client
+
+
+def get_openai_client(api_key, base_url=None):
+    return get_client("openai", api_key, base_url)
+
+
+def get_gemini_client(api_key, base_url=None):
+    return get_client("gemini", api_key, base_url)
+
+
+def close_clients(provider=None):
+    with _lock:
+        for key in [k for k in _clients if provider is None or k[0] == provider]:
+            client = _clients.pop(key)
+            close = getattr(client, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception:
+                    pass
@@ -0,0 +1,547 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from gemini_models import generate_with_model, stream_with_model
+from llm_cache import get_response_cache
+from llm_clients import get_gemini_client, get_openai_client
+from llm_usage import USAGE, gemini_usage, openai_usage, prompt_cache_key
+from perf_trace import span
+from resilience import PROVIDER_GUARD, status_code
+
+# Motores de razonamiento sin dependencias de Streamlit: llamada por motor, modo
+# "más rápido disponible" (carrera con hedging) y latencias observadas por motor.
+
+# Identificador de modelo por motor de razonamiento (forma parte de la clave de caché).
+# Para Gemini es la familia: el id concreto lo resuelve gemini_models.GEMINI_MODELS.
+INTEL_MODELS = {
+    "GPT-4o-mini (Fast)": "gpt-4o-mini",
+    "GPT-5.2": "gpt-5.2",
+    "Gemini Flash (Free)": "gemini-1.5-flash",
+}
+
+# Proveedor de cada motor (para límites de concurrencia compartidos)
+ENGINE_PROVIDERS = {
+    "GPT-4o-mini (Fast)": "openai",
+    "GPT-5.2": "openai",
+    "Gemini Flash (Free)": "gemini",
+}
+
+# Secreto que necesita cada motor (para desviar a otro motor con clave configurada)
+ENGINE_SECRETS = {
+    "GPT-4o-mini (Fast)": "OPENAI_API_KEY",
+    "GPT-5.2": "OPENAI_API_KEY",
+    "Gemini Flash (Free)": "GOOGLE_API_KEY",
+}
+
+# Llamadas simultáneas máximas por proveedor en todo el proceso
+PROVIDER_CONCURRENCY = {"openai": 8, "gemini": 4}
+
+# Opción de la barra lateral que lanza la carrera entre varios motores
+FASTEST_ENGINE = "⚡ Más Rápido Disponible"
+
+# Retardo de hedging por defecto mientras no haya suficientes muestras de latencia
+DEFAULT_HEDGE_DELAY = 2.0
+MIN_SAMPLES_FOR_AUTO_HEDGE = 5
+
+
+class EngineUnavailable(RuntimeError):
+    """El motor no se puede usar (p. ej. falta su API key)"""
+
+
+class InvalidResponse(RuntimeError):
+    """El motor respondió, pero la respuesta no pasa la validación"""
+
+
+class RaceCancelled(RuntimeError):
+    """Otro motor ganó la carrera y este intento se abandonó"""
+
+
+class _RaceSlot:
+    """Hueco del proveedor para un intento de carrera: deja de esperarlo si otro motor gana"""
+
+    def __init__(self, semaphore, cancel, engine_choice):
+        self._semaphore = semaphore
+        self._cancel = cancel
+        self._engine = engine_choice
+
+    def acquire(self):
+        while not self._semaphore.acquire(timeout=0.05):
+            if self._cancel.is_set():
+                raise RaceCancelled(self._engine)
+        if self._cancel.is_set():
+            # El hueco llegó cuando la carrera ya estaba decidida
+            self._semaphore.release()
+            raise RaceCancelled(self._engine)
+
+    def release(self):
+        self._semaphore.release()
+
+
+def _require_secret(secrets, name, engine_choice):
+    if name not in secrets:
+        raise EngineUnavailable(f"Falta {name} para activar {engine_choice}.")
+    return secrets[name]
+
+
+def _has_secret(secrets, engine_choice):
+    try:
+        return ENGINE_SECRETS[engine_choice] in secrets
+    except Exception:
+        # st.secrets sin archivo de secretos
+        return False
+
+
+def reroute(engine_choice, secrets):
+    """Motor a usar: el elegido o, con el circuito de su proveedor abierto, el primer motor
+    de otro proveedor disponible y con clave (si no hay ninguno, el elegido: fallará rápido)"""
+    if PROVIDER_GUARD.available(ENGINE_PROVIDERS[engine_choice]):
+        return engine_choice
+    for engine in INTEL_MODELS:
+        if PROVIDER_GUARD.available(ENGINE_PROVIDERS[engine]) and _has_secret(secrets, engine):
+            return engine
+    return engine_choice
+
+
+def _responses_format(schema):
+    name, json_schema = schema
+    return {"text": {"format": {"type": "json_schema", "name": name, "schema": json_schema, "strict": True}}}
+
+
+def _chat_format(schema):
+    name, json_schema = schema
+    return {"response_format": {"type": "json_schema",
+                                "json_schema": {"name": name, "schema": json_schema, "strict": True}}}
+
+
+def gemini_config(schema, system_instruction=None):
+    """Configuración de generate_content: instrucciones fijas y salida JSON con esquema (o None)"""
+    config = {}
+    if system_instruction:
+        config["system_instruction"] = system_instruction
+    if schema is not None:
+        config["response_mime_type"] = "application/json"
+        config["response_json_schema"] = schema[1]
+    return config or None
+
+
+# Parámetros de salida estructurada que nombra el proveedor al rechazarlos
+SCHEMA_ERROR_MARKERS = ("response_format", "json_schema", "response_schema", "response_mime_type", "json mode")
+
+
+def schema_rejected(error):
+    """El proveedor rechazó la petición de salida estructurada (modelo o parámetro no soportado).
+
+    Hace falta un 400 que nombre el parámetro de esquema: otros 400 (contexto demasiado
+    largo, parámetro erróneo) no se repiten en texto libre.
+    """
+    if status_code(error) != 400:
+        return False
+    message = str(error).lower()
+    return any(marker in message for marker in SCHEMA_ERROR_MARKERS)
+
+
+def call_engine(engine_choice, system_prompt, user_input, secrets, schema=None, slot=None):
+    """Llamada síncrona a un motor; lanza excepción ante cualquier fallo.
+
+    `schema` es un par (nombre, JSON Schema) de shot_schema: el motor devuelve JSON
+    restringido a ese esquema en lugar de texto libre. Si el motor no lo admite se
+    repite la llamada en texto libre, que los parsers de shot_parsers siguen entendiendo.
+
+    Cada intento pasa por PROVIDER_GUARD: cupo compartido del proveedor, reintentos con
+    backoff ante errores transitorios y CircuitOpen si el proveedor está degradado.
+    `slot` (semáforo de concurrencia del proveedor) se ocupa solo durante cada petición,
+    no durante las esperas de cupo ni el backoff.
+    """
+    provider, model_id = ENGINE_PROVIDERS[engine_choice], INTEL_MODELS[engine_choice]
+    # Sin clave no se llega a pedir turno: no se gasta cupo del proveedor
+    _require_secret(secrets, ENGINE_SECRETS[engine_choice], engine_choice)
+    if schema is not None:
+        try:
+            return PROVIDER_GUARD.call(provider, model_id, lambda: _call_engine(
+                engine_choice, system_prompt, user_input, secrets, schema), slot)
+        except Exception as e:
+            if not schema_rejected(e):
+                raise
+    return PROVIDER_GUARD.call(provider, model_id, lambda: _call_engine(
+        engine_choice, system_prompt, user_input, secrets, None), slot)
+
+
+def _call_engine(engine_choice, system_prompt, user_input, secrets, schema):
+    # Las instrucciones fijas van separadas y primero (instructions / mensaje system /
+    # system_instruction) para que formen un prefijo estable cacheable por el proveedor
+    model_id = INTEL_MODELS[engine_choice]
+    started = time.perf_counter()
+    if engine_choice == "GPT-5.2":
+        client = get_openai_client(_require_secret(secrets, "OPENAI_API_KEY", engine_choice))
+        response = client.responses.create(
+            model=model_id,
+            instructions=system_prompt,
+            input=user_input,
+            prompt_cache_key=prompt_cache_key(system_prompt),
+            **(_responses_format(schema) if schema else {})
+        )
+        USAGE.record(engine_choice, model_id, openai_usage(response.usage), time.perf_counter() - started)
+        return response.output_text
+
+    if engine_choice == "GPT-4o-mini (Fast)":
+        client = get_openai_client(_require_secret(secrets, "OPENAI_API_KEY", engine_choice))
+        response = client.chat.completions.create(
+            model=model_id,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_input}
+            ],
+            prompt_cache_key=prompt_cache_key(system_prompt),
+            **(_chat_format(schema) if schema else {})
+        )
+        USAGE.record(engine_choice, model_id, openai_usage(response.usage), time.perf_counter() - started)
+        return response.choices[0].message.content
+
+    if engine_choice == "Gemini Flash (Free)":
+        api_key = _require_secret(secrets, "GOOGLE_API_KEY", engine_choice)
+        client = get_gemini_client(api_key)
+        # Usando el modelo Flash para análisis de texto rápido/gratis
+        response = generate_with_model(api_key, "text", lambda resolved_id: client.models.generate_content(
+            model=resolved_id,
+            contents=user_input,
+            config=gemini_config(schema, system_prompt)
+        ))
+        USAGE.record(engine_choice, response.model_version or model_id, gemini_usage(response.usage_metadata),
+                     time.perf_counter() - started)
+        return response.text
+
+    raise EngineUnavailable(f"Motor desconocido: {engine_choice}")
+
+
+def stream_engine(engine_choice, system_prompt, user_input, secrets, schema=None, slot=None):
+    """Versión en streaming de call_engine: genera los fragmentos de texto según llegan"""
+    provider, model_id = ENGINE_PROVIDERS[engine_choice], INTEL_MODELS[engine_choice]
+    _require_secret(secrets, ENGINE_SECRETS[engine_choice], engine_choice)
+    if schema is not None:
+        emitted = False
+        try:
+            for delta in PROVIDER_GUARD.stream(provider, model_id, lambda: _stream_engine(
+                    engine_choice, system_prompt, user_input, secrets, schema), slot):
+                emitted = True
+                yield delta
+            return
+        except Exception as e:
+            # Solo se repite en texto libre si aún no se entregó ningún fragmento
+            if emitted or not schema_rejected(e):
+                raise
+    yield from PROVIDER_GUARD.stream(provider, model_id, lambda: _stream_engine(
+        engine_choice, system_prompt, user_input, secrets, None), slot)
+
+
+def _stream_engine(engine_choice, system_prompt, user_input, secrets, schema):
+    model_id = INTEL_MODELS[engine_choice]
+    started = time.perf_counter()
+    if engine_choice == "GPT-5.2":
+        client = get_openai_client(_require_secret(secrets, "OPENAI_API_KEY", engine_choice))
+        stream = client.responses.create(
+            model=model_id,
+            instructions=system_prompt,
+            input=user_input,
+            prompt_cache_key=prompt_cache_key(system_prompt),
+            stream=True,
+            **(_responses_format(schema) if schema else {})
+        )
+        usage = None
+        # Cerrar el stream corta la conexión si el consumidor abandona (p. ej. pierde la carrera)
+        with stream:
+            for event in stream:
+                if event.type == "response.output_text.delta":
+                    yield event.delta
+                elif event.type == "response.completed":
+                    usage = openai_usage(event.response.usage)
+        USAGE.record(engine_choice, model_id, usage, time.perf_counter() - started)
+        return
+
+    if engine_choice == "GPT-4o-mini (Fast)":
+        client = get_openai_client(_require_secret(secrets, "OPENAI_API_KEY", engine_choice))
+        stream = client.chat.completions.create(
+            model=model_id,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_input}
+            ],
+            prompt_cache_key=prompt_cache_key(system_prompt),
+            stream=True,
+            # El consumo llega en un último fragmento sin choices
+            stream_options={"include_usage": True},
+            **(_chat_format(schema) if schema else {})
+        )
+        usage = None
+        with stream:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                if chunk.usage is not None:
+                    usage = openai_usage(chunk.usage)
+        USAGE.record(engine_choice, model_id, usage, time.perf_counter() - started)
+        return
+
+    if engine_choice == "Gemini Flash (Free)":
+        api_key = _require_secret(secrets, "GOOGLE_API_KEY", engine_choice)
+        client = get_gemini_client(api_key)
+        usage, model_version = None, model_id
+        for chunk in stream_with_model(api_key, "text", lambda resolved_id: client.models.generate_content_stream(
+            model=resolved_id,
+            contents=user_input,
+            config=gemini_config(schema, system_prompt)
+        )):
+            if chunk.text:
+                yield chunk.text
+            # Cada fragmento trae el acumulado; vale el último
+            if chunk.usage_metadata is not None:
+                usage = gemini_usage(chunk.usage_metadata)
+            model_version = chunk.model_version or model_version
+        USAGE.record(engine_choice, model_version, usage, time.perf_counter() - started)
+        return
+
+    raise EngineUnavailable(f"Motor desconocido: {engine_choice}")
+
+
+class LatencyTracker:
+    """Ventana deslizante de latencias por motor (compartida por el proceso)"""
+
+    def __init__(self, window=200):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, engine, seconds):
+        with self._lock:
+            self._samples.setdefault(engine, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, engine, q):
+        with self._lock:
+            samples = sorted(self._samples.get(engine, ()))
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def count(self, engine):
+        with self._lock:
+            return len(self._samples.get(engine, ()))
+
+    def summary(self):
+        with self._lock:
+            engines = list(self._samples)
+        return {
+            engine: {
+                "n": self.count(engine),
+                "p50": self.percentile(engine, 0.50),
+                "p95": self.percentile(engine, 0.95),
+            }
+            for engine in engines
+        }
+
+    def hedge_delay(self, engine, default=DEFAULT_HEDGE_DELAY):
+        """Retardo adaptativo: p95 observado del motor primario"""
+        if self.count(engine) < MIN_SAMPLES_FOR_AUTO_HEDGE:
+            return default
+        return self.percentile(engine, 0.95)
+
+
+LATENCIES = LatencyTracker()
+
+# Ejecutor propio: asyncio.run() esperaría a los hilos del ejecutor por defecto, y las
+# llamadas perdedoras de una carrera no deben retrasar la respuesta ganadora.
+_RACE_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-race")
+
+
+def timed_call_engine(engine_choice, system_prompt, user_input, secrets, tracker=LATENCIES, schema=None, slot=None):
+    started = time.perf_counter()
+    result = call_engine(engine_choice, system_prompt, user_input, secrets, schema, slot)
+    # Solo se registran respuestas completas: los errores rápidos sesgarían el p95
+    tracker.record(engine_choice, time.perf_counter() - started)
+    return result
+
+
+def _race_call(engine_choice, system_prompt, user_input, secrets, tracker, schema, cancel):
+    # Se ejecuta en _RACE_EXECUTOR. Cancelar la tarea de asyncio no detiene el hilo: el
+    # intento comprueba `cancel` mientras espera turno y entre fragmentos, y al perder
+    # cierra el stream (y su conexión) en lugar de seguir gastando cupo del proveedor
+    slot = _RaceSlot(_provider_slots[ENGINE_PROVIDERS[engine_choice]], cancel, engine_choice)
+    started = time.perf_counter()
+    parts = []
+    stream = stream_engine(engine_choice, system_prompt, user_input, secrets, schema, slot)
+    try:
+        for delta in stream:
+            if cancel.is_set():
+                raise RaceCancelled(engine_choice)
+            parts.append(delta)
+    finally:
+        stream.close()
+    # Solo se registran respuestas completas: los errores rápidos sesgarían el p95
+    tracker.record(engine_choice, time.perf_counter() - started)
+    return "".join(parts)
+
+
+async def race_engines(engines, system_prompt, user_input, secrets, hedge_delay="auto",
+                       validate=None, tracker=LATENCIES, schema=None):
+    """Lanza la petición a varios motores y devuelve (motor, texto) del primero válido.
+
+    Los motores arrancan escalonados cada `hedge_delay` segundos (0 = todos a la vez,
+    "auto" = p95 observado del motor anterior). Al llegar la primera respuesta que pasa
+    `validate`, el resto de intentos se cancela: dejan de leer su stream y lo cierran.
+    Cada intento ocupa un hueco del límite de concurrencia de su proveedor.
+    """
+    if not engines:
+        raise EngineUnavailable("No hay motores seleccionados para la carrera.")
+
+    # Si un intento falla, los motores en espera arrancan sin agotar su retardo
+    kick = asyncio.Event()
+    cancel = threading.Event()
+
+    async def _attempt(engine, delay):
+        if delay:
+            try:
+                await asyncio.wait_for(kick.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        try:
+            text = await asyncio.get_running_loop().run_in_executor(
+                _RACE_EXECUTOR, _race_call, engine, system_prompt, user_input, secrets, tracker, schema, cancel
+            )
+            if validate is not None and not validate(text):
+                raise InvalidResponse(f"{engine} devolvió una respuesta sin el formato esperado.")
+        except Exception:
+            kick.set()
+            raise
+        return engine, text
+
+    delay = 0.0
+    tasks = []
+    for i, engine in enumerate(engines):
+        if i > 0:
+            previous = engines[i - 1]
+            step = tracker.hedge_delay(previous) if hedge_delay == "auto" else float(hedge_delay)
+            delay += step
+        tasks.append(asyncio.create_task(_attempt(engine, delay)))
+
+    errors = []
+    try:
+        for finished in asyncio.as_completed(tasks):
+            try:
+                return await finished
+            except Exception as e:
+                errors.append(e)
+    finally:
+        cancel.set()
+        for task in tasks:
+            task.cancel()
+    raise RuntimeError("; ".join(str(e) for e in errors))
+
+
+def run_race(engines, system_prompt, user_input, secrets, hedge_delay="auto", validate=None, schema=None):
+    return asyncio.run(race_engines(engines, system_prompt, user_input, secrets, hedge_delay, validate, schema=schema))
+
+
+_provider_slots = {provider: threading.BoundedSemaphore(limit) for provider, limit in PROVIDER_CONCURRENCY.items()}
+
+
+def _cache_model(engine_choice, schema):
+    # Las respuestas JSON y las de texto libre no son intercambiables en la caché
+    model_id = INTEL_MODELS[engine_choice]
+    return f"{model_id}+json:{schema[0]}" if schema else model_id
+
+
+def _cacheable(result, validate):
+    return bool(result) and (validate is None or validate(result))
+
+
+def complete(engine_choice, system_prompt, user_input, secrets, use_cache=True,
+             race_pool=None, hedge_delay="auto", validate=None, schema=None):
+    """Respuesta del motor (o de la carrera) pasando por la caché; lanza excepción si falla"""
+    with span("llm.complete", engine=engine_choice, input_chars=len(user_input)) as stage:
+        result = _complete(engine_choice, system_prompt, user_input, secrets, use_cache,
+                           race_pool, hedge_delay, validate, schema, stage)
+        stage["output_chars"] = len(result or "")
+        return result
+
+
+def _complete(engine_choice, system_prompt, user_input, secrets, use_cache, race_pool, hedge_delay,
+              validate, schema, stage):
+    # En modo carrera se aceptan respuestas en caché de cualquiera de los motores del pool
+    candidates = (race_pool or list(INTEL_MODELS)) if engine_choice == FASTEST_ENGINE else [engine_choice]
+    cache = get_response_cache() if use_cache else None
+    if cache is not None:
+        # Una sola búsqueda para todos los candidatos: un acierto o fallo por llamada
+        engine, cached = cache.get_any([(e, _cache_model(e, schema)) for e in candidates],
+                                       system_prompt, user_input, accept=validate)
+        if cached is not None:
+            USAGE.record(engine, INTEL_MODELS[engine], None, 0.0, source="cache")
+            stage["cached"] = True
+            return cached
+
+    if engine_choice == FASTEST_ENGINE:
+        # Los motores con el circuito abierto no entran en la carrera (salvo que no quede ninguno)
+        live = [e for e in candidates if PROVIDER_GUARD.available(ENGINE_PROVIDERS[e])] or candidates
+        engine_used, result = run_race(live, system_prompt, user_input, secrets, hedge_delay, validate, schema)
+        stage["winner"] = engine_used
+    else:
+        engine_used = reroute(engine_choice, secrets)
+        if engine_used != engine_choice:
+            stage["rerouted"] = engine_used
+        result = timed_call_engine(engine_used, system_prompt, user_input, secrets, schema=schema,
+                                   slot=_provider_slots[ENGINE_PROVIDERS[engine_used]])
+
+    # Solo se cachean respuestas útiles: ni vacías ni sin el formato que pide `validate`
+    if cache is not None and _cacheable(result, validate):
+        cache.put(engine_used, _cache_model(engine_used, schema), system_prompt, user_input, result)
+    return result
+
+
+def complete_stream(engine_choice, system_prompt, user_input, secrets, use_cache=True,
+                    race_pool=None, hedge_delay="auto", validate=None, schema=None):
+    """Como complete(), pero genera fragmentos de texto en cuanto llegan.
+
+    Un acierto de caché o el modo carrera (que necesita la respuesta completa para
+    validarla) producen un único fragmento con el texto entero.
+    """
+    if engine_choice == FASTEST_ENGINE:
+        yield complete(engine_choice, system_prompt, user_input, secrets, use_cache, race_pool, hedge_delay, validate, schema)
+        return
+
+    model_id = _cache_model(engine_choice, schema)
+    cache = get_response_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(engine_choice, model_id, system_prompt, user_input, accept=validate)
+        if cached is not None:
+            USAGE.record(engine_choice, INTEL_MODELS[engine_choice], None, 0.0, source="cache")
+            with span("llm.complete", engine=engine_choice, input_chars=len(user_input), cached=True,
+                      output_chars=len(cached)):
+                pass
+            yield cached
+            return
+
+    parts = []
+    # Con el circuito del proveedor abierto se desvía a otro motor disponible
+    engine_used = reroute(engine_choice, secrets)
+    with span("llm.complete", engine=engine_choice, input_chars=len(user_input), streaming=True) as stage:
+        if engine_used != engine_choice:
+            stage["rerouted"] = engine_used
+        started = time.perf_counter()
+        # Las esperas de cupo (provider.wait) y de hueco (provider.slot) son etapas propias;
+        # cerrar el stream al abandonarlo devuelve el hueco enseguida
+        stream = stream_engine(engine_used, system_prompt, user_input, secrets, schema,
+                               _provider_slots[ENGINE_PROVIDERS[engine_used]])
+        try:
+            for delta in stream:
+                if not parts:
+                    stage["first_chunk_s"] = round(time.perf_counter() - started, 3)
+                parts.append(delta)
+                yield delta
+        finally:
+            stream.close()
+        LATENCIES.record(engine_used, time.perf_counter() - started)
+        stage["output_chars"] = sum(len(p) for p in parts)
+
+    result = "".join(parts)
+    if cache is not None and _cacheable(result, validate):
+        cache.put(engine_used, _cache_model(engine_used, schema), system_prompt, user_input, result)
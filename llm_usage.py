@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Contabilidad de tokens por llamada: entrada, entrada servida desde la caché de prefijos
+# del proveedor, salida y latencia. Se acumula en memoria (panel de la barra lateral) y
+# se escribe una línea JSON por llamada en LLM_USAGE_LOG (vacío = sin log).
+
+DEFAULT_USAGE_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "llm_usage.jsonl")
+
+
+def prompt_cache_key(system_prompt):
+    """Clave estable de las instrucciones fijas (agrupa peticiones con el mismo prefijo en OpenAI)"""
+    return "cine-" + hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def _field(obj, *names):
+    for name in names:
+        obj = getattr(obj, name, None)
+        if obj is None:
+            return 0
+    return obj or 0
+
+
+def openai_usage(usage):
+    """(entrada, en caché, salida) de un objeto usage de OpenAI (Responses o Chat Completions)"""
+    if usage is None:
+        return None
+    if hasattr(usage, "input_tokens"):
+        return (_field(usage, "input_tokens"), _field(usage, "input_tokens_details", "cached_tokens"),
+                _field(usage, "output_tokens"))
+    return (_field(usage, "prompt_tokens"), _field(usage, "prompt_tokens_details", "cached_tokens"),
+            _field(usage, "completion_tokens"))
+
+
+def gemini_usage(metadata):
+    """(entrada, en caché, salida) de usage_metadata de Gemini"""
+    if metadata is None:
+        return None
+    return (_field(metadata, "prompt_token_count"), _field(metadata, "cached_content_token_count"),
+            _field(metadata, "candidates_token_count"))
+
+
+class UsageLedger:
+    """Registro de consumo compartido por el proceso (ventana reciente + totales)"""
+
+    def __init__(self, log_path=None, window=200):
+        self.log_path = log_path
+        self._recent = deque(maxlen=window)
+        self._totals = {"calls": 0, "cache_hits": 0, "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0}
+        self._lock = threading.Lock()
+
+    def record(self, engine, model, tokens, latency, source="api"):
+        """Anota una llamada; `tokens` es (entrada, en caché, salida) o None si el proveedor no lo informó"""
+        input_tokens, cached_tokens, output_tokens = tokens or (0, 0, 0)
+        entry = {
+            "ts": round(time.time(), 3),
+            "engine": engine,
+            "model": model,
+            "source": source,
+            "input_tokens": int(input_tokens),
+            "cached_tokens": int(cached_tokens),
+            "output_tokens": int(output_tokens),
+            "latency_s": round(latency, 3),
+        }
+        with self._lock:
+            self._recent.append(entry)
+            self._totals["calls"] += 1
+            if source == "cache":
+                self._totals["cache_hits"] += 1
+            self._totals["input_tokens"] += entry["input_tokens"]
+            self._totals["cached_tokens"] += entry["cached_tokens"]
+            self._totals["output_tokens"] += entry["output_tokens"]
+            if self.log_path:
+                try:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                except OSError:
+                    # El log es auxiliar: un disco lleno o de solo lectura no debe tumbar la llamada
+                    pass
+        return entry
+
+    def totals(self):
+        with self._lock:
+            totals = dict(self._totals)
+        totals["cached_ratio"] = totals["cached_tokens"] / totals["input_tokens"] if totals["input_tokens"] else 0.0
+        return totals
+
+    def recent(self, n=10):
+        with self._lock:
+            return list(self._recent)[-n:]
+
+    def clear(self):
+        with self._lock:
+            self._recent.clear()
+            for name in self._totals:
+                self._totals[name] = 0
+
+
+USAGE = UsageLedger(os.environ.get("LLM_USAGE_LOG", DEFAULT_USAGE_LOG))
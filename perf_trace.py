@@ -0,0 +1,212 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Instrumentación ligera por etapas: cada `span` mide una etapa (decodificación, subida,
+# cada intento de generate_content, parseo...) con atributos de tamaño. Las etapas de una
+# ejecución se agrupan en un `trace` (JSONL + cascada en el panel de depuración) y todas
+# se acumulan en histogramas por etapa exportables en formato de texto de Prometheus.
+
+DEFAULT_TRACE_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "perf_traces.jsonl")
+
+# Límites (s) de los histogramas de Prometheus
+BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_current_trace = contextvars.ContextVar("perf_trace", default=None)
+_current_depth = contextvars.ContextVar("perf_trace_depth", default=0)
+
+
+class Trace:
+    """Una ejecución (p. ej. un storyboard) con sus etapas en orden de inicio"""
+
+    def __init__(self, name):
+        self.name = name
+        self.id = uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self.duration = None
+        self.spans = []
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _add(self, name, start, duration, depth, attrs):
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "start_s": round(start - self._t0, 6),
+                "duration_s": round(duration, 6),
+                "depth": depth,
+                "thread": threading.current_thread().name,
+                "attrs": attrs,
+            })
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._t0
+        with self._lock:
+            self.spans.sort(key=lambda s: s["start_s"])
+
+    def to_dict(self):
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "trace": self.name,
+            "id": self.id,
+            "ts": round(self.started_at, 3),
+            "duration_s": round(self.duration or 0.0, 6),
+            "spans": spans,
+        }
+
+    def waterfall(self, width=40):
+        """Cascada en texto: una fila por etapa, barra proporcional a inicio y duración"""
+        total = self.duration or max((s["start_s"] + s["duration_s"] for s in self.spans), default=0.0)
+        scale = width / total if total > 0 else 0.0
+        label_width = max((len(s["name"]) + 2 * s["depth"] for s in self.spans), default=0)
+        rows = [f"{self.name}  {total * 1000:.0f} ms"]
+        for s in self.spans:
+            offset = int(s["start_s"] * scale)
+            length = max(1, int(round(s["duration_s"] * scale)))
+            label = ("  " * s["depth"] + s["name"]).ljust(label_width)
+            attrs = " ".join(f"{k}={v}" for k, v in s["attrs"].items())
+            rows.append(f"{label} |{' ' * offset}{'█' * length}{' ' * max(0, width - offset - length)}| "
+                        f"{s['duration_s'] * 1000:8.1f} ms {attrs}".rstrip())
+        return "\n".join(rows)
+
+
+class StageStats:
+    """Histogramas acumulados por etapa (todo el proceso)"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, error=False):
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = {"count": 0, "sum": 0.0, "max": 0.0, "errors": 0,
+                                              "buckets": [0] * len(self.buckets)}
+            stage["count"] += 1
+            stage["sum"] += seconds
+            stage["max"] = max(stage["max"], seconds)
+            stage["errors"] += int(error)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    stage["buckets"][i] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(stage, buckets=list(stage["buckets"])) for name, stage in self._stages.items()}
+
+    def prometheus_text(self, prefix="cine_stage"):
+        lines = [
+            f"# HELP {prefix}_duration_seconds Duración de cada etapa instrumentada.",
+            f"# TYPE {prefix}_duration_seconds histogram",
+        ]
+        snapshot = self.snapshot()
+        for name, stage in sorted(snapshot.items()):
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            for bound, count in zip(self.buckets, stage["buckets"]):
+                lines.append(f'{prefix}_duration_seconds_bucket{{stage="{label}",le="{bound}"}} {count}')
+            lines.append(f'{prefix}_duration_seconds_bucket{{stage="{label}",le="+Inf"}} {stage["count"]}')
+            lines.append(f'{prefix}_duration_seconds_sum{{stage="{label}"}} {stage["sum"]:.6f}')
+            lines.append(f'{prefix}_duration_seconds_count{{stage="{label}"}} {stage["count"]}')
+        lines.append(f"# TYPE {prefix}_errors_total counter")
+        for name, stage in sorted(snapshot.items()):
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            lines.append(f'{prefix}_errors_total{{stage="{label}"}} {stage["errors"]}')
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._stages.clear()
+
+
+STAGES = StageStats()
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name, **attrs):
+    """Mide una etapa; el dict que se entrega admite atributos añadidos durante la etapa"""
+    trace_ = _current_trace.get()
+    depth = _current_depth.get()
+    token = _current_depth.set(depth + 1)
+    started = time.perf_counter()
+    error = False
+    try:
+        yield attrs
+    except GeneratorExit:
+        # Generador (stream) abandonado por el consumidor: no es un fallo de la etapa
+        attrs["closed"] = True
+        raise
+    except BaseException as e:
+        error = True
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        try:
+            _current_depth.reset(token)
+        except ValueError:
+            # Un stream cerrado desde otro contexto (recolector de basura) no puede restaurarlo
+            pass
+        STAGES.observe(name, duration, error)
+        if trace_ is not None:
+            trace_._add(name, started, duration, depth, attrs)
+
+
+def export_trace(trace_, path=None):
+    """Añade la traza al JSONL (PERF_TRACE_LOG; vacío = sin log)"""
+    path = os.environ.get("PERF_TRACE_LOG", DEFAULT_TRACE_LOG) if path is None else path
+    if not path:
+        return
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(trace_.to_dict(), ensure_ascii=False) + "\n")
+    except OSError:
+        pass
+
+
+def write_prometheus(path=None):
+    """Escribe los histogramas en `path` (PERF_PROM_PATH) de forma atómica, p. ej. para el
+    textfile collector de node_exporter"""
+    path = path or os.environ.get("PERF_PROM_PATH")
+    if not path:
+        return
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(STAGES.prometheus_text())
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+@contextmanager
+def trace(name):
+    """Agrupa las etapas de una ejecución; al terminar se exporta (JSONL y Prometheus)"""
+    trace_ = Trace(name)
+    token = _current_trace.set(trace_)
+    depth_token = _current_depth.set(0)
+    try:
+        yield trace_
+    finally:
+        _current_depth.reset(depth_token)
+        _current_trace.reset(token)
+        trace_.finish()
+        export_trace(trace_)
+        write_prometheus()
+
+
+def run_in_context(func):
+    """Envuelve `func` para ejecutarlo en otro hilo con la traza activa del que lo lanza"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(func, *args, **kwargs)
@@ -0,0 +1,320 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Almacén local (SQLite) de proyectos: anclas de continuidad, listas de tomas (panel y
+# guion) con sus claves de preset y prompts, y storyboards de audio con su biblia.
+# Búsqueda de texto completo con FTS5 y paginación por cursor (keyset): cada página
+# es una consulta por índice que solo carga las filas visibles.
+
+DEFAULT_PROJECT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "projects.sqlite3")
+DEFAULT_PAGE_SIZE = 20
+
+# Listas de tomas de la sesión que se guardan con el proyecto
+SHOT_SOURCES = ("panel", "script")
+
+_SHOT_INPUTS = ("scene", "character", "wardrobe", "color", "director", "lens", "stock",
+                "movement", "angle_name", "angle_desc", "engine")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    char_master TEXT NOT NULL DEFAULT '',
+    wardrobe_master TEXT NOT NULL DEFAULT '',
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS shots (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    source TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    scene TEXT NOT NULL,
+    character TEXT NOT NULL,
+    wardrobe TEXT NOT NULL,
+    color TEXT NOT NULL,
+    director TEXT NOT NULL,
+    lens TEXT NOT NULL,
+    stock TEXT NOT NULL,
+    movement TEXT NOT NULL,
+    angle_name TEXT NOT NULL,
+    angle_desc TEXT NOT NULL,
+    engine TEXT NOT NULL,
+    director_key TEXT,
+    color_key TEXT,
+    movement_key TEXT,
+    image_prompt TEXT NOT NULL,
+    movement_prompt TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_shots_project ON shots(project_id, source, position);
+CREATE INDEX IF NOT EXISTS idx_shots_director ON shots(director_key, id);
+CREATE INDEX IF NOT EXISTS idx_shots_lens ON shots(lens, id);
+CREATE INDEX IF NOT EXISTS idx_shots_angle ON shots(angle_name, id);
+CREATE TABLE IF NOT EXISTS storyboards (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    audio_hash TEXT NOT NULL DEFAULT '',
+    text TEXT NOT NULL,
+    bible TEXT NOT NULL,
+    slots TEXT,
+    created REAL NOT NULL,
+    UNIQUE (project_id, audio_hash)
+);
+"""
+
+# Índices FTS5 de contenido externo: el texto vive una sola vez en shots/storyboards y
+# los triggers mantienen el índice al insertar o borrar
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS shots_fts USING fts5(
+    scene, character, wardrobe, image_prompt, content='shots', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS shots_fts_insert AFTER INSERT ON shots BEGIN
+    INSERT INTO shots_fts(rowid, scene, character, wardrobe, image_prompt)
+    VALUES (new.id, new.scene, new.character, new.wardrobe, new.image_prompt);
+END;
+CREATE TRIGGER IF NOT EXISTS shots_fts_delete AFTER DELETE ON shots BEGIN
+    INSERT INTO shots_fts(shots_fts, rowid, scene, character, wardrobe, image_prompt)
+    VALUES ('delete', old.id, old.scene, old.character, old.wardrobe, old.image_prompt);
+END;
+CREATE VIRTUAL TABLE IF NOT EXISTS storyboards_fts USING fts5(
+    text, bible, content='storyboards', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS storyboards_fts_insert AFTER INSERT ON storyboards BEGIN
+    INSERT INTO storyboards_fts(rowid, text, bible) VALUES (new.id, new.text, new.bible);
+END;
+CREATE TRIGGER IF NOT EXISTS storyboards_fts_delete AFTER DELETE ON storyboards BEGIN
+    INSERT INTO storyboards_fts(storyboards_fts, rowid, text, bible) VALUES ('delete', old.id, old.text, old.bible);
+END;
+"""
+
+# Columnas de una fila de resultados (sin los textos de preset completos)
+_PAGE_COLUMNS = ("s.id, p.name AS project, s.project_id, s.source, s.position, s.scene, s.angle_name, "
+                 "s.director_key, s.lens, s.engine, s.image_prompt, s.movement_prompt")
+
+
+def fts_query(text):
+    """Consulta FTS5 segura a partir de texto libre: todas las palabras, por prefijo"""
+    words = re.findall(r"\w+", text or "")
+    return " ".join(f'"{w}"*' for w in words)
+
+
+def _reverse(mapping):
+    return {value: key for key, value in mapping.items()}
+
+
+class ProjectStore:
+    def __init__(self, path=DEFAULT_PROJECT_DB_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(_SCHEMA)
+        try:
+            self._conn.executescript(_FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite sin FTS5: la búsqueda cae a LIKE (recorre la tabla)
+            self.fts = False
+
+    # --- Proyectos ---
+
+    def save_project(self, name, char_master="", wardrobe_master=""):
+        """Crea o actualiza el proyecto `name` con sus anclas; devuelve su id"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO projects(name, char_master, wardrobe_master, created, updated) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET char_master = excluded.char_master, "
+                "wardrobe_master = excluded.wardrobe_master, updated = excluded.updated",
+                (name, char_master or "", wardrobe_master or "", now, now),
+            )
+            return self._conn.execute("SELECT id FROM projects WHERE name = ?", (name,)).fetchone()[0]
+
+    def list_projects(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT p.id, p.name, p.updated, "
+                "(SELECT COUNT(*) FROM shots s WHERE s.project_id = p.id) AS shots, "
+                "(SELECT COUNT(*) FROM storyboards b WHERE b.project_id = p.id) AS storyboards "
+                "FROM projects p ORDER BY p.updated DESC"
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def load_project(self, project_id):
+        """Anclas, tomas por origen (entradas de Shot en orden) y último storyboard, o None"""
+        with self._lock:
+            project = self._conn.execute("SELECT * FROM projects WHERE id = ?", (project_id,)).fetchone()
+            if project is None:
+                return None
+            shots = self._conn.execute(
+                f"SELECT source, {', '.join(_SHOT_INPUTS)} FROM shots WHERE project_id = ? ORDER BY source, position",
+                (project_id,),
+            ).fetchall()
+            storyboard = self._conn.execute(
+                "SELECT text, bible, slots, audio_hash FROM storyboards WHERE project_id = ? ORDER BY created DESC LIMIT 1",
+                (project_id,),
+            ).fetchone()
+        result = dict(project)
+        result["shots"] = {source: [] for source in SHOT_SOURCES}
+        for row in shots:
+            result["shots"].setdefault(row["source"], []).append(tuple(row[c] for c in _SHOT_INPUTS))
+        result["storyboard"] = None
+        if storyboard is not None:
+            result["storyboard"] = {
+                "text": storyboard["text"],
+                "bible": json.loads(storyboard["bible"]),
+                "slots": json.loads(storyboard["slots"]) if storyboard["slots"] else None,
+                "audio_hash": storyboard["audio_hash"],
+            }
+        return result
+
+    def delete_project(self, project_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+
+    # --- Tomas y storyboards ---
+
+    def save_shots(self, project_id, source, shots, templates=None):
+        """Sustituye la lista de tomas `source` del proyecto (objetos Shot de prompt_engine).
+
+        Con `templates` se anotan también las claves de director, paleta y movimiento
+        (las tomas guardan el texto del preset) para filtrar por ellas.
+        """
+        directors = _reverse(templates["director_styles"]) if templates else {}
+        colors = _reverse(templates["color_palettes"]) if templates else {}
+        movements = _reverse(templates["camera_movements"]) if templates else {}
+        rows = [
+            (project_id, source, position, *shot.inputs(),
+             directors.get(shot.director), colors.get(shot.color), movements.get(shot.movement),
+             shot.image_prompt, shot.movement_prompt)
+            for position, shot in enumerate(shots)
+        ]
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM shots WHERE project_id = ? AND source = ?", (project_id, source))
+            self._conn.executemany(
+                f"INSERT INTO shots(project_id, source, position, {', '.join(_SHOT_INPUTS)}, "
+                "director_key, color_key, movement_key, image_prompt, movement_prompt) "
+                f"VALUES ({', '.join('?' * (len(_SHOT_INPUTS) + 8))})",
+                rows,
+            )
+            self._touch(project_id)
+
+    def save_storyboard(self, project_id, text, bible=None, slots=None, audio_hash=""):
+        """Guarda el storyboard (uno por proyecto y audio: repetir el audio lo sustituye)"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM storyboards WHERE project_id = ? AND audio_hash = ?",
+                               (project_id, audio_hash or ""))
+            self._conn.execute(
+                "INSERT INTO storyboards(project_id, audio_hash, text, bible, slots, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (project_id, audio_hash or "", text, json.dumps(bible or {}, ensure_ascii=False),
+                 json.dumps(slots) if slots else None, time.time()),
+            )
+            self._touch(project_id)
+
+    def _touch(self, project_id):
+        self._conn.execute("UPDATE projects SET updated = ? WHERE id = ?", (time.time(), project_id))
+
+    # --- Búsqueda ---
+
+    def search_shots(self, query="", project_id=None, director=None, lens=None, angle=None,
+                     limit=DEFAULT_PAGE_SIZE, before_id=None):
+        """Página de tomas (las más recientes primero) y cursor de la siguiente, o None.
+
+        `query` es texto libre sobre escena, personaje, vestuario y prompt; `director` es
+        la clave del preset. El cursor es el id de la última fila: la página siguiente se
+        lee por índice desde ahí, sin OFFSET, tan rápida como la primera.
+        """
+        clauses, params = [], []
+        match = fts_query(query)
+        if match and self.fts:
+            # CROSS JOIN fija el orden: se recorre el índice FTS por rowid descendente y se
+            # para en la fila `limit`, en lugar de juntar y ordenar todas las coincidencias
+            source = "shots_fts CROSS JOIN shots s ON s.id = shots_fts.rowid CROSS JOIN projects p ON p.id = s.project_id"
+            key = "shots_fts.rowid"
+            clauses.append("shots_fts MATCH ?")
+            params.append(match)
+        else:
+            source = "shots s JOIN projects p ON p.id = s.project_id"
+            key = "s.id"
+            for word in re.findall(r"\w+", query or ""):
+                clauses.append("(s.scene LIKE ? OR s.character LIKE ? OR s.wardrobe LIKE ? OR s.image_prompt LIKE ?)")
+                params.extend([f"%{word}%"] * 4)
+        for column, value in (("s.project_id", project_id), ("s.director_key", director),
+                              ("s.lens", lens), ("s.angle_name", angle)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if before_id is not None:
+            clauses.append(f"{key} < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_PAGE_COLUMNS} FROM {source} {where} ORDER BY {key} DESC LIMIT ?",
+                (*params, limit + 1),
+            ).fetchall()
+        page = [dict(r) for r in rows[:limit]]
+        return page, (page[-1]["id"] if len(rows) > limit else None)
+
+    def search_storyboards(self, query, limit=DEFAULT_PAGE_SIZE):
+        """Storyboards cuyo texto o biblia contienen las palabras de `query`"""
+        match = fts_query(query)
+        if not match:
+            return []
+        with self._lock:
+            if self.fts:
+                rows = self._conn.execute(
+                    "SELECT b.id, p.name AS project, b.project_id, b.bible, b.created, "
+                    "snippet(storyboards_fts, 0, '**', '**', '…', 12) AS excerpt "
+                    "FROM storyboards_fts JOIN storyboards b ON b.id = storyboards_fts.rowid "
+                    "JOIN projects p ON p.id = b.project_id "
+                    "WHERE storyboards_fts MATCH ? ORDER BY rank LIMIT ?",
+                    (match, limit),
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT b.id, p.name AS project, b.project_id, b.bible, b.created, substr(b.text, 1, 120) AS excerpt "
+                    "FROM storyboards b JOIN projects p ON p.id = b.project_id "
+                    "WHERE b.text LIKE ? OR b.bible LIKE ? ORDER BY b.id DESC LIMIT ?",
+                    (f"%{query}%", f"%{query}%", limit),
+                ).fetchall()
+        return [{**dict(r), "bible": json.loads(r["bible"])} for r in rows]
+
+    def facets(self):
+        """Claves de director, lente y ángulo presentes en las tomas guardadas (para filtros)"""
+        with self._lock:
+            return {
+                name: [r[0] for r in self._conn.execute(
+                    f"SELECT DISTINCT {column} FROM shots WHERE {column} IS NOT NULL ORDER BY {column}")]
+                for name, column in (("director", "director_key"), ("lens", "lens"), ("angle", "angle_name"))
+            }
+
+    def stats(self):
+        with self._lock:
+            (projects,) = self._conn.execute("SELECT COUNT(*) FROM projects").fetchone()
+            (shots,) = self._conn.execute("SELECT COUNT(*) FROM shots").fetchone()
+            (storyboards,) = self._conn.execute("SELECT COUNT(*) FROM storyboards").fetchone()
+        return {"projects": projects, "shots": shots, "storyboards": storyboards, "fts": self.fts}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_project_store():
+    """Instancia compartida del proceso (PROJECT_DB_PATH)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ProjectStore(os.environ.get("PROJECT_DB_PATH", DEFAULT_PROJECT_DB_PATH))
+    return _store
@@ -0,0 +1,106 @@
+# Motor de prompts sin dependencias de Streamlit (usado por la app y por batch_generator.py)
+from functools import lru_cache
+
+from template_registry import get_registry, get_templates
+
+# Motores de imagen destino soportados por generate_prompt
+TARGET_ENGINES = ["Meta AI / Grok", "Midjourney", "DALL-E 3", "Qwen / Flux"]
+
+# Las plantillas viven en prompt_templates.json y se compilan en template_registry
+# (recarga en caliente por mtime). TEMPLATES se conserva como vista del arranque.
+TEMPLATES = get_templates()
+
+# Tomas memorizadas para la UI (los reruns de Streamlit repiten las mismas entradas)
+SHOT_CACHE_SIZE = 2048
+
+
+def generate_prompt(scene, character, wardrobe, color, director, lens, stock, movement, angle_name, angle_desc, engine):
+    # Mapping técnico: bloque de estilo (director + lente + película + motor) precompilado en el registro
+    aspect_ratio, style_block, lighting_rig = get_registry().style(director, lens, stock, engine)
+
+    # Prompt final de Imagen (Sin movimiento), con anclas de consistencia blindada (EN)
+    image_prompt = (
+        f"{angle_name}: {scene}. {angle_desc}. "
+        f"CHARACTER CONTINUITY: {character}. WARDROBE CONSISTENCY: {wardrobe}. COLOR SCHEME: {color}. "
+        f"Maintain identical facial features and identical clothing textures across shots. {style_block}"
+    )
+
+    # Prompt de Movimiento de Cámara (Específico)
+    movement_prompt = f"CAMERA MOVEMENT: {movement}. Technical execution: {angle_name} logic. Ensure smooth cinematic flow."
+
+    # Lógica de Iluminación para Mermaid
+    diagram = f"graph TD\n    CAM[Cámara IMAX] --- SUB[({character})]\n{lighting_rig}"
+
+    json_output = {
+        "cinematógrafo": "Asistente IMAX Antigravity V2",
+        "tipo_de_toma": angle_name,
+        "movimiento": movement,
+        "motor_optimizado": engine,
+        "descripcion": scene,
+        "datos_de_consistencia": {
+            "rasgos_personaje": character,
+            "vestuario": wardrobe,
+            "paleta_color": color
+        },
+        "stack_tecnico": {
+            "formato": "IMAX 70mm (15-perf)",
+            "lente": lens,
+            "pelicula": stock,
+            "relacion_aspecto": aspect_ratio
+        },
+        "intencion_director": director,
+        "esquema_iluminacion": diagram,
+        "prompt_imagen": image_prompt,
+        "prompt_movimiento": movement_prompt
+    }
+    return json_output, image_prompt, movement_prompt, diagram
+
+
+class Shot:
+    """Toma compacta para la sesión: referencias a las entradas (textos de los presets
+    compartidos, no copias) y los dos prompts que muestra la UI, guardados una sola vez.
+
+    El diagrama y la vista JSON se reconstruyen bajo demanda con generate_prompt.
+    """
+    __slots__ = ("scene", "character", "wardrobe", "color", "director", "lens", "stock",
+                 "movement", "angle_name", "angle_desc", "engine", "image_prompt", "movement_prompt")
+
+    def __init__(self, scene, character, wardrobe, color, director, lens, stock, movement, angle_name, angle_desc, engine):
+        self.scene = scene
+        self.character = character
+        self.wardrobe = wardrobe
+        self.color = color
+        self.director = director
+        self.lens = lens
+        self.stock = stock
+        self.movement = movement
+        self.angle_name = angle_name
+        self.angle_desc = angle_desc
+        self.engine = engine
+        _, self.image_prompt, self.movement_prompt, _ = generate_prompt(*self.inputs())
+
+    def inputs(self):
+        return (self.scene, self.character, self.wardrobe, self.color, self.director, self.lens, self.stock,
+                self.movement, self.angle_name, self.angle_desc, self.engine)
+
+    @property
+    def diagram(self):
+        return generate_prompt(*self.inputs())[3]
+
+    def to_json(self):
+        """Vista JSON completa (exportación), la misma que devuelve generate_prompt"""
+        return generate_prompt(*self.inputs())[0]
+
+
+@lru_cache(maxsize=SHOT_CACHE_SIZE)
+def _cached_shot(registry, *args):
+    return Shot(*args)
+
+
+def generate_shot_cached(*args):
+    """Shot memorizado por entradas y versión de plantillas.
+
+    La misma instancia se comparte entre reruns y sesiones: no debe modificarse.
+    """
+    # El registro forma parte de la clave: recargar prompt_templates.json invalida las tomas
+    return _cached_shot(get_registry(), *args)
@@ -0,0 +1,320 @@
+import os
+import random
+import threading
+import time
+
+from perf_trace import span
+
+# Protección compartida por el proceso frente a los límites de los proveedores: un token
+# bucket por (proveedor, modelo) que reparte el cupo entre todas las sesiones, reintentos
+# con backoff exponencial con jitter para errores transitorios (429, 5xx, timeouts) y un
+# circuit breaker por proveedor que corta en seco (o permite desviar a otro motor)
+# mientras el proveedor está degradado, en lugar de amontonar reintentos.
+
+# Cupo por proveedor (por modelo: las cuotas de OpenAI y Gemini son por modelo). Se puede
+# sobrescribir con LLM_<PROVEEDOR>_RPM / LLM_<PROVEEDOR>_BURST.
+RATE_LIMITS = {
+    "openai": {"rpm": 500, "burst": 20},
+    # Nivel gratuito de Gemini Flash
+    "gemini": {"rpm": 15, "burst": 5},
+}
+
+# Reintentos (LLM_RETRY_MAX_ATTEMPTS) y backoff exponencial con jitter completo
+DEFAULT_MAX_ATTEMPTS = 4
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 20.0
+
+# Espera máxima por un token antes de desistir (s)
+DEFAULT_MAX_WAIT = 60.0
+
+# Fallos transitorios seguidos que abren el circuito y segundos que permanece abierto
+# (LLM_BREAKER_THRESHOLD / LLM_BREAKER_RESET_SECONDS)
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_RESET = 30.0
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class RateLimitTimeout(RuntimeError):
+    """No hubo cupo del proveedor dentro de la espera máxima"""
+
+
+class CircuitOpen(RuntimeError):
+    """El proveedor está degradado y el circuito está abierto"""
+
+    def __init__(self, provider, retry_in):
+        super().__init__(f"{provider} está degradado; se volverá a intentar en {retry_in:.0f}s.")
+        self.provider = provider
+        self.retry_in = retry_in
+
+
+def _env_number(name, default):
+    value = os.environ.get(name)
+    return type(default)(value) if value else default
+
+
+def status_code(error):
+    """Código HTTP de un error de los SDK (openai: status_code, google-genai: code), o None"""
+    for name in ("status_code", "code"):
+        value = getattr(error, name, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retryable(error):
+    """429, 5xx, timeouts y errores de conexión: merece la pena reintentar"""
+    if isinstance(error, (RateLimitTimeout, CircuitOpen)):
+        return False
+    code = status_code(error)
+    if code is not None:
+        return code in RETRYABLE_STATUS
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # Errores de transporte de httpx / openai sin importar los SDK
+    name = type(error).__name__
+    return "Timeout" in name or "Connect" in name or name in ("RemoteProtocolError", "ReadError")
+
+
+def retry_after(error):
+    """Segundos indicados por la cabecera Retry-After del error, o None"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt, error=None, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Backoff exponencial con jitter completo; respeta Retry-After si pide esperar más"""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    hinted = retry_after(error) if error is not None else None
+    return min(cap, max(delay, hinted)) if hinted else delay
+
+
+class TokenBucket:
+    """Cupo de peticiones: `rate` tokens por segundo con ráfagas de hasta `burst`"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout=DEFAULT_MAX_WAIT):
+        """Espera a tener un token; False si no llega dentro de `timeout`"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def drain(self):
+        """Vacía el cupo (p. ej. tras un 429: el proveedor ya dijo que no queda)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0.0)
+
+
+class CircuitBreaker:
+    """Cerrado -> abierto tras `threshold` fallos transitorios seguidos; pasado `reset_seconds`
+    deja pasar una sola petición de prueba (semiabierto) que lo cierra o lo vuelve a abrir"""
+
+    def __init__(self, threshold=DEFAULT_BREAKER_THRESHOLD, reset_seconds=DEFAULT_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.reset_seconds:
+                return "open"
+            return "half-open"
+
+    def retry_in(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """La petición de prueba terminó sin veredicto (p. ej. error no transitorio)"""
+        with self._lock:
+            self._probing = False
+
+
+class ProviderGuard:
+    """Buckets por (proveedor, modelo) y breakers por proveedor, compartidos por el proceso"""
+
+    def __init__(self, limits=RATE_LIMITS):
+        self.limits = limits
+        self.max_attempts = _env_number("LLM_RETRY_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)
+        self._buckets = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, provider, model):
+        key = (provider, model)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                rpm = _env_number(f"LLM_{provider.upper()}_RPM", self.limits[provider]["rpm"])
+                burst = _env_number(f"LLM_{provider.upper()}_BURST", self.limits[provider]["burst"])
+                bucket = self._buckets[key] = TokenBucket(rpm / 60.0, burst)
+            return bucket
+
+    def breaker(self, provider):
+        with self._lock:
+            breaker = self._breakers.get(provider)
+            if breaker is None:
+                breaker = self._breakers[provider] = CircuitBreaker(
+                    _env_number("LLM_BREAKER_THRESHOLD", DEFAULT_BREAKER_THRESHOLD),
+                    _env_number("LLM_BREAKER_RESET_SECONDS", DEFAULT_BREAKER_RESET))
+            return breaker
+
+    def available(self, provider):
+        """El circuito del proveedor no está abierto (sin consumir la petición de prueba)"""
+        return self.breaker(provider).state != "open"
+
+    def states(self):
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {provider: breaker.state for provider, breaker in breakers.items()}
+
+    def acquire(self, provider, model):
+        """Turno para una petición: CircuitOpen si el proveedor está degradado, o espera al cupo"""
+        breaker = self.breaker(provider)
+        if not breaker.allow():
+            raise CircuitOpen(provider, breaker.retry_in())
+        # La espera por cupo es una etapa propia: separa el límite del tiempo del proveedor
+        with span("provider.wait", provider=provider, model=model) as stage:
+            acquired = self.bucket(provider, model).acquire()
+            stage["acquired"] = acquired
+        if not acquired:
+            breaker.release()
+            raise RateLimitTimeout(f"Sin cupo de {provider}/{model} tras {DEFAULT_MAX_WAIT:.0f}s de espera.")
+
+    def settle(self, provider, model, error=None):
+        """Registra el resultado de una petición; True si `error` es transitorio"""
+        breaker = self.breaker(provider)
+        if error is not None and not is_retryable(error):
+            # Un error HTTP no transitorio (400, 401, 404...) prueba que el proveedor responde;
+            # uno local (sin código: clave ausente, parseo, TypeError...) no prueba nada
+            if status_code(error) is not None:
+                breaker.success()
+            else:
+                breaker.release()
+            return False
+        if error is None:
+            breaker.success()
+            return False
+        breaker.failure()
+        if status_code(error) == 429:
+            self.bucket(provider, model).drain()
+        return True
+
+    def _take_slot(self, provider, slot):
+        # Hueco de concurrencia (semáforo del llamante) solo para la petición en sí: se pide
+        # después del turno y del cupo, y se devuelve antes del backoff. Su espera es otra etapa.
+        if slot is None:
+            return
+        with span("provider.slot", provider=provider):
+            try:
+                slot.acquire()
+            except BaseException:
+                self.breaker(provider).release()
+                raise
+
+    def call(self, provider, model, func, slot=None):
+        """func() con cupo, reintentos con backoff y breaker; `slot` se ocupa solo mientras corre"""
+        for attempt in range(self.max_attempts):
+            self.acquire(provider, model)
+            self._take_slot(provider, slot)
+            try:
+                try:
+                    result = func()
+                finally:
+                    if slot is not None:
+                        slot.release()
+            except Exception as e:
+                if not self.settle(provider, model, e) or attempt == self.max_attempts - 1:
+                    raise
+                time.sleep(backoff_delay(attempt, e))
+                continue
+            self.settle(provider, model)
+            return result
+
+    def stream(self, provider, model, func, slot=None):
+        """Versión en streaming: solo se reintenta si aún no se emitió ningún fragmento"""
+        for attempt in range(self.max_attempts):
+            self.acquire(provider, model)
+            self._take_slot(provider, slot)
+            emitted = False
+            try:
+                try:
+                    for item in func():
+                        emitted = True
+                        yield item
+                finally:
+                    if slot is not None:
+                        slot.release()
+            except GeneratorExit:
+                self.breaker(provider).release()
+                raise
+            except Exception as e:
+                if not self.settle(provider, model, e) or emitted or attempt == self.max_attempts - 1:
+                    raise
+                time.sleep(backoff_delay(attempt, e))
+                continue
+            self.settle(provider, model)
+            return
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._breakers.clear()
+
+
+PROVIDER_GUARD = ProviderGuard()
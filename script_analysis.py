@@ -0,0 +1,169 @@
+import queue
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from llm_engines import complete_stream
+from perf_trace import run_in_context, span
+from shot_parsers import MAX_MOMENTS, MomentStreamParser, has_moments
+from shot_schema import MOMENTS_SCHEMA
+
+# Análisis de guiones completos: división por escenas (sluglines INT./EXT.), análisis
+# concurrente con límite de hilos y fusión en una lista de tomas ordenada.
+
+SLUGLINE_RE = re.compile(r"^[ \t]*(?:INT\./EXT\.|EXT\./INT\.|INT/EXT\.?|I/E\.?|INT\.|EXT\.)[^\n]*$", re.MULTILINE)
+
+# Hilos por análisis; el límite real por proveedor lo aplica llm_engines.complete
+DEFAULT_MAX_WORKERS = 8
+
+
+class Scene:
+    __slots__ = ("index", "heading", "text")
+
+    def __init__(self, index, heading, text):
+        self.index = index
+        self.heading = heading
+        self.text = text
+
+
+def split_scenes(script_text):
+    """Divide el guion por sluglines; el texto previo al primer encabezado es su propia escena"""
+    matches = list(SLUGLINE_RE.finditer(script_text))
+    if not matches:
+        return [Scene(0, "", script_text.strip())] if script_text.strip() else []
+    bounds = [m.start() for m in matches] + [len(script_text)]
+    scenes = []
+    preamble = script_text[:bounds[0]].strip()
+    if preamble:
+        scenes.append(Scene(0, "", preamble))
+    for m, end in zip(matches, bounds[1:]):
+        text = script_text[m.start():end].strip()
+        scenes.append(Scene(len(scenes), m.group(0).strip(), text))
+    return scenes
+
+
+def scene_user_input(scene, char_anchor, wardrobe_anchor):
+    anchors = f"Anclas de continuidad (mantener EXACTAMENTE): Personaje: {char_anchor} | Vestuario: {wardrobe_anchor}"
+    return f"{anchors}\nGuion: {scene.text}"
+
+
+def fallback_moments(text, char_anchor, wardrobe_anchor, limit=MAX_MOMENTS):
+    # Fallback simple: frases largas del propio texto
+    return [{'action': line.strip(), 'char': char_anchor, 'wardrobe': wardrobe_anchor}
+            for line in text.split('.') if len(line.strip()) > 10][:limit]
+
+
+def carry_anchors(moments, char_anchor, wardrobe_anchor):
+    """Arrastra personaje/vestuario de la última toma conocida a las que vengan vacías"""
+    last_char, last_wardrobe = char_anchor, wardrobe_anchor
+    for moment in moments:
+        moment['char'] = moment.get('char') or last_char
+        moment['wardrobe'] = moment.get('wardrobe') or last_wardrobe
+        last_char, last_wardrobe = moment['char'], moment['wardrobe']
+    return moments
+
+
+def analyze_scenes(scenes, system_prompt, engine_choice, secrets, char_anchor, wardrobe_anchor,
+                   use_cache=True, race_pool=None, hedge_delay="auto",
+                   max_workers=DEFAULT_MAX_WORKERS, progress=None, on_moment=None, schema=MOMENTS_SCHEMA,
+                   reuse=None, reuse_threshold=None):
+    """Analiza las escenas en paralelo y devuelve (momentos ordenados, errores por escena).
+
+    Se pide a los motores JSON con `schema` (None = texto libre) y las respuestas se
+    consumen en streaming: cada momento (objeto JSON o fila 'Acción | Personaje |
+    Vestuario') se entrega a `on_moment(escena, momento)` en cuanto se completa. Tanto `on_moment`
+    como `progress(hechas, total, escena, error)` se invocan desde el hilo que llama,
+    por lo que pueden actualizar la UI de Streamlit directamente.
+
+    Con `reuse` (un ScriptIndex de script_index) las escenas casi idénticas a otras ya
+    analizadas con las mismas instrucciones y anclas reutilizan sus momentos (marcados con
+    'reused': similitud) y solo las escenas nuevas o cambiadas pasan por el motor.
+    """
+    per_scene = {}
+    # Momentos ya entregados por escena (se conservan si el stream falla a medias)
+    partial = {}
+    errors = {}
+    events = queue.Queue()
+    done_count = 0
+
+    pending_scenes = scenes
+    if reuse is not None:
+        # Import diferido: el índice usa numpy y la app no lo carga hasta analizar un guion
+        from script_index import context_key
+
+        context = context_key(system_prompt, char_anchor, wardrobe_anchor)
+        with span("script.reuse", scenes=len(scenes)) as stage:
+            for scene in scenes:
+                found = reuse.lookup(scene.text, context, reuse_threshold)
+                if found is not None:
+                    moments, similarity = found
+                    per_scene[scene.index] = [dict(m, scene=scene.heading, reused=round(similarity, 3)) for m in moments]
+            stage["reused"] = len(per_scene)
+        pending_scenes = [scene for scene in scenes if scene.index not in per_scene]
+        for scene in scenes:
+            if scene.index in per_scene:
+                if on_moment:
+                    for moment in per_scene[scene.index]:
+                        on_moment(scene, moment)
+                done_count += 1
+                if progress:
+                    progress(done_count, len(scenes), scene, None)
+
+    def _analyze(scene):
+        moments = partial[scene.index] = []
+        parser = MomentStreamParser()
+
+        def _take(found):
+            for moment in found:
+                if len(moments) < MAX_MOMENTS:
+                    moment['scene'] = scene.heading
+                    moments.append(moment)
+                    events.put((scene, moment))
+
+        for delta in complete_stream(engine_choice, system_prompt, scene_user_input(scene, char_anchor, wardrobe_anchor),
+                                     secrets, use_cache, race_pool, hedge_delay, validate=has_moments, schema=schema):
+            _take(parser.feed(delta or ""))
+        _take(parser.close())
+        return moments
+
+    def _drain():
+        while True:
+            try:
+                scene, moment = events.get_nowait()
+            except queue.Empty:
+                return
+            if on_moment:
+                on_moment(scene, moment)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending_scenes)))) as pool:
+        # Cada hilo hereda la traza activa (las etapas llm.complete cuelgan de la ejecución)
+        futures = {pool.submit(run_in_context(_analyze), scene): scene for scene in pending_scenes}
+        pending = set(futures)
+        while pending:
+            finished, pending = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+            _drain()
+            for future in finished:
+                scene = futures[future]
+                error = None
+                try:
+                    moments = future.result()
+                except Exception as e:
+                    error = errors[scene.index] = e
+                    # Lo ya entregado por on_moment se queda: el fallback solo cubre las
+                    # escenas que fallaron sin ningún momento (no se mezclan ni se duplican)
+                    moments = partial.get(scene.index, [])
+                if moments and error is None and reuse is not None:
+                    # Solo se indexan análisis reales del motor (no el fallback)
+                    reuse.add(scene.text, context, [{k: v for k, v in m.items() if k != 'scene'} for m in moments])
+                if not moments:
+                    moments = fallback_moments(scene.text, char_anchor, wardrobe_anchor)
+                    for moment in moments:
+                        moment['scene'] = scene.heading
+                        if on_moment:
+                            on_moment(scene, moment)
+                per_scene[scene.index] = moments
+                done_count += 1
+                if progress:
+                    progress(done_count, len(scenes), scene, error)
+
+    ordered = [moment for scene in scenes for moment in per_scene.get(scene.index, [])]
+    return carry_anchors(ordered, char_anchor, wardrobe_anchor), errors
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+# Índice de similitud de fragmentos de guion ya analizados (MinHash + LSH por bandas).
+# Las revisiones de una escena con cambios de redacción menores reutilizan los momentos
+# guardados en lugar de volver a pasar por el motor. Las firmas viven en SQLite para
+# sobrevivir a reinicios y en memoria: las bandas cargadas al arrancar en un array
+# ordenado (búsqueda binaria) y las añadidas después en un diccionario.
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "script_index.sqlite3")
+
+# Jaccard estimado mínimo para reutilizar (SCRIPT_SIMILARITY_THRESHOLD): con shingles de
+# 3 palabras, cambiar 2 palabras de una escena de 80 deja la similitud en torno a 0.86
+DEFAULT_THRESHOLD = 0.8
+
+# Shingles de 3 palabras; 64 permutaciones en 16 bandas de 4 filas: los pares con
+# Jaccard >= 0.7 coinciden en alguna banda con probabilidad > 0.98
+SHINGLE_WORDS = 3
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+_PERM_RNG = np.random.default_rng(0x5C121B7)
+# Familia multiplicar-desplazar sobre 64 bits (el desbordamiento de uint64 es intencionado)
+_PERM_A = _PERM_RNG.integers(1, 2 ** 63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _PERM_RNG.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+_BAND_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fragments (
+    id INTEGER PRIMARY KEY,
+    context TEXT NOT NULL,
+    signature BLOB NOT NULL,
+    moments TEXT NOT NULL,
+    created REAL NOT NULL
+);
+"""
+
+
+def context_key(system_prompt, char_anchor, wardrobe_anchor):
+    """Los momentos solo se reutilizan con las mismas instrucciones y anclas de continuidad"""
+    payload = json.dumps([system_prompt, char_anchor, wardrobe_anchor], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def shingles(text, k=SHINGLE_WORDS):
+    """Hashes (crc32) de los k-gramas de palabras del texto normalizado"""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= k:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))} if words else set()
+    return {zlib.crc32(" ".join(words[i:i + k]).encode("utf-8")) for i in range(len(words) - k + 1)}
+
+
+def signature(text):
+    """Firma MinHash (NUM_PERM uint32) del texto"""
+    hashed = np.fromiter(shingles(text), dtype=np.uint64)
+    if not len(hashed):
+        return np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint32)
+    with np.errstate(over="ignore"):
+        permuted = (hashed[:, None] * _PERM_A + _PERM_B) >> np.uint64(32)
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def band_keys(signatures, codes):
+    """Clave de 64 bits de cada banda (filas x BANDS), mezclada con el número de banda y el
+    contexto de la fila: todas las bandas comparten un único espacio de claves"""
+    bands = signatures.reshape(len(signatures), BANDS, ROWS).astype(np.uint64)
+    keys = codes.astype(np.uint64)[:, None] * np.uint64(BANDS) + np.arange(BANDS, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for r in range(ROWS):
+            keys = keys * _BAND_MIX + bands[:, :, r]
+    return keys
+
+
+class ScriptIndex:
+    """Índice incremental: add() guarda fragmento y momentos, lookup() busca el más parecido"""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, threshold=DEFAULT_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._loaded = False
+        self._ids = []
+        self._contexts = {}
+        self._context_codes = np.zeros(0, dtype=np.int32)
+        self._signatures = np.zeros((0, NUM_PERM), dtype=np.uint32)
+        self._size = 0
+        self._buckets = {}
+        self._sorted_keys = np.zeros(0, dtype=np.uint64)
+        self._sorted_rows = np.zeros(0, dtype=np.int64)
+
+    def _load(self):
+        # Carga perezosa de las firmas guardadas (una sola vez por proceso)
+        if self._loaded:
+            return
+        rows = self._conn.execute("SELECT id, context, signature FROM fragments ORDER BY id").fetchall()
+        if rows:
+            ids, contexts, blobs = zip(*rows)
+            signatures = np.frombuffer(b"".join(blobs), dtype=np.uint32).reshape(len(rows), NUM_PERM)
+            codes = np.array([self._contexts.setdefault(c, len(self._contexts)) for c in contexts], dtype=np.int32)
+            self._reserve(len(rows))
+            self._signatures[:len(rows)] = signatures
+            self._context_codes[:len(rows)] = codes
+            self._ids.extend(ids)
+            self._size = len(rows)
+            keys = band_keys(signatures, codes).ravel()
+            order = np.argsort(keys)
+            self._sorted_keys = keys[order]
+            self._sorted_rows = order // BANDS
+        self._loaded = True
+
+    def _reserve(self, extra):
+        # Arrays con capacidad que se duplica: las inserciones incrementales son O(1) amortizado
+        needed = self._size + extra
+        if needed <= len(self._signatures):
+            return
+        capacity = max(needed, 2 * len(self._signatures), 1024)
+        signatures = np.zeros((capacity, NUM_PERM), dtype=np.uint32)
+        signatures[:self._size] = self._signatures[:self._size]
+        codes = np.zeros(capacity, dtype=np.int32)
+        codes[:self._size] = self._context_codes[:self._size]
+        self._signatures, self._context_codes = signatures, codes
+
+    def _append(self, row_id, context, sig):
+        code = self._contexts.setdefault(context, len(self._contexts))
+        row = self._size
+        self._signatures[row] = sig
+        self._context_codes[row] = code
+        self._ids.append(row_id)
+        self._size += 1
+        for key in band_keys(sig[None, :], np.array([code]))[0].tolist():
+            self._buckets.setdefault(key, []).append(row)
+
+    def add(self, text, context, moments):
+        """Indexa el fragmento con los momentos obtenidos al analizarlo"""
+        sig = signature(text)
+        with self._lock, self._conn:
+            self._load()
+            cursor = self._conn.execute(
+                "INSERT INTO fragments(context, signature, moments, created) VALUES (?, ?, ?, ?)",
+                (context, sig.tobytes(), json.dumps(moments, ensure_ascii=False), time.time()),
+            )
+            self._reserve(1)
+            self._append(cursor.lastrowid, context, sig)
+
+    def lookup(self, text, context, threshold=None):
+        """(momentos, similitud) del fragmento indexado más parecido por encima del umbral, o None"""
+        threshold = self.threshold if threshold is None else threshold
+        sig = signature(text)
+        with self._lock:
+            self._load()
+            code = self._contexts.get(context)
+            if code is None:
+                return None
+            candidates = set()
+            keys = band_keys(sig[None, :], np.array([code]))[0]
+            lo = self._sorted_keys.searchsorted(keys, "left")
+            hi = self._sorted_keys.searchsorted(keys, "right")
+            for start, end in zip(lo[lo < hi].tolist(), hi[lo < hi].tolist()):
+                candidates.update(self._sorted_rows[start:end].tolist())
+            for key in keys.tolist():
+                candidates.update(self._buckets.get(key, ()))
+            if not candidates:
+                return None
+            rows = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            similarity = (self._signatures[rows] == sig).mean(axis=1)
+            # Ante empates gana la revisión más reciente
+            best = int(np.lexsort((rows, similarity))[-1])
+            if similarity[best] < threshold:
+                return None
+            row_id = self._ids[rows[best]]
+            (moments,) = self._conn.execute("SELECT moments FROM fragments WHERE id = ?", (row_id,)).fetchone()
+        return json.loads(moments), float(similarity[best])
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return self._size
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM fragments")
+            self._ids, self._contexts, self._size = [], {}, 0
+            self._buckets = {}
+            self._sorted_keys = np.zeros(0, dtype=np.uint64)
+            self._sorted_rows = np.zeros(0, dtype=np.int64)
+            self._loaded = True
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_script_index():
+    """Instancia compartida del proceso (SCRIPT_INDEX_PATH, SCRIPT_SIMILARITY_THRESHOLD)"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ScriptIndex(
+                    os.environ.get("SCRIPT_INDEX_PATH", DEFAULT_INDEX_PATH),
+                    float(os.environ.get("SCRIPT_SIMILARITY_THRESHOLD", DEFAULT_THRESHOLD)),
+                )
+    return _index
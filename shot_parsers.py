@@ -0,0 +1,234 @@
+# Parsers de las respuestas de los motores (sin dependencias de Streamlit): JSON
+# estructurado (shot_schema) con fallback a los formatos de texto de siempre.
+from shot_schema import JsonStreamParser, looks_like_json, parse_json_response
+
+# Número máximo de momentos que el analizador convierte en tomas
+MAX_MOMENTS = 5
+
+
+def parse_moment_line(line):
+    """Fila 'Acción | Personaje | Vestuario' -> dict, o None si no tiene el formato"""
+    if '|' not in line:
+        return None
+    parts = line.split('|')
+    if len(parts) < 3:
+        return None
+    return {
+        'action': parts[0].strip(),
+        'char': parts[1].strip(),
+        'wardrobe': parts[2].strip()
+    }
+
+
+def moment_from_json(item):
+    """Objeto {action, char, wardrobe} -> dict de momento, o None si no es válido"""
+    if not isinstance(item, dict) or not str(item.get('action') or '').strip():
+        return None
+    return {
+        'action': str(item.get('action', '')).strip(),
+        'char': str(item.get('char') or '').strip(),
+        'wardrobe': str(item.get('wardrobe') or '').strip()
+    }
+
+
+def parse_moments(analysis, limit=MAX_MOMENTS):
+    moments_data = []
+    if looks_like_json(analysis):
+        data = parse_json_response(analysis) or {}
+        items = data.get('moments') if isinstance(data.get('moments'), list) else []
+        moments_data = [m for m in map(moment_from_json, items) if m is not None]
+    if not moments_data:
+        # Fallback: filas 'Acción | Personaje | Vestuario'
+        for line in analysis.split('\n'):
+            moment = parse_moment_line(line)
+            if moment is not None:
+                moments_data.append(moment)
+    return moments_data[:limit] if limit else moments_data
+
+
+def has_moments(analysis):
+    """Validación para la carrera de motores: al menos un momento parseable (JSON o filas)"""
+    return bool(analysis) and bool(parse_moments(analysis, limit=1))
+
+
+class LineBuffer:
+    """Reensambla líneas completas a partir de fragmentos de texto en streaming"""
+
+    def __init__(self):
+        self._pending = ""
+
+    def feed(self, delta):
+        self._pending += delta
+        if '\n' not in self._pending:
+            return []
+        *lines, self._pending = self._pending.split('\n')
+        return lines
+
+    def flush(self):
+        rest, self._pending = self._pending, ""
+        return [rest] if rest else []
+
+
+class MomentStreamParser:
+    """Momentos en cuanto llegan: objetos de "moments" en modo JSON, o filas completas"""
+
+    def __init__(self):
+        self._json = None
+        self._lines = LineBuffer()
+        self._stream = JsonStreamParser()
+        self._emitted = 0
+
+    def feed(self, delta):
+        if self._json is None:
+            if not (self._stream.text + delta).strip():
+                self._stream.feed(delta)
+                return []
+            self._json = looks_like_json(self._stream.text + delta)
+        if self._json:
+            moments = [moment_from_json(value) for key, value in self._stream.feed(delta) if key == 'moments']
+        else:
+            moments = [parse_moment_line(line) for line in self._lines.feed(delta)]
+        moments = [m for m in moments if m is not None]
+        self._emitted += len(moments)
+        return moments
+
+    def close(self):
+        if self._json:
+            # JSON truncado o con otra forma: se reintenta con los parsers completos
+            if not self._emitted:
+                return parse_moments(self._stream.text, limit=None)
+            return []
+        return [m for m in map(parse_moment_line, self._lines.flush()) if m is not None]
+
+
+BIBLE_START = "---PRODUCTION_BIBLE---"
+BIBLE_END = "---END_BIBLE---"
+
+
+def parse_bible_lines(lines):
+    bible_data = {}
+    for line in lines:
+        if ':' in line:
+            k, v = line.split(':', 1)
+            bible_data[k.strip().upper()] = v.strip()
+    return bible_data
+
+
+def bible_from_json(item):
+    """Objeto {location, character, ...} -> dict con las claves del bloque de texto"""
+    if not isinstance(item, dict):
+        return {}
+    return {str(k).strip().upper(): str(v).strip() for k, v in item.items()}
+
+
+def storyboard_line(shot):
+    """Toma JSON -> fila 'n | Acción | Imagen | Movimiento | Mood | Tiempo' (formato de los slots)"""
+    fields = [shot.get(k) or '' for k in ('action', 'image_prompt', 'movement_prompt', 'mood', 'timestamp')]
+    return ' | '.join([str(shot.get('slot', ''))] + [str(f).strip() for f in fields])
+
+
+def parse_bible(full_text):
+    """Extrae la biblia (JSON o bloque ---PRODUCTION_BIBLE---) como dict (vacío si no está completa)"""
+    if looks_like_json(full_text):
+        data = parse_json_response(full_text)
+        if data is not None:
+            return bible_from_json(data.get('bible'))
+    if BIBLE_START not in full_text or BIBLE_END not in full_text:
+        return {}
+    try:
+        bible_part = full_text.split(BIBLE_START)[1].split(BIBLE_END)[0].strip()
+    except IndexError:
+        return {}
+    return parse_bible_lines(bible_part.split('\n'))
+
+
+def storyboard_display_text(full_text):
+    if looks_like_json(full_text):
+        data = parse_json_response(full_text)
+        if data is not None and isinstance(data.get('shots'), list):
+            return '\n'.join(storyboard_line(shot) for shot in data['shots'] if isinstance(shot, dict))
+    # Se oculta el bloque de la biblia para dejar solo el storyboard
+    return full_text.split(BIBLE_END)[-1].strip() if BIBLE_END in full_text else full_text
+
+
+def storyboard_section_errors(full_text):
+    """Secciones que fallaron en un storyboard por secciones ("section_errors"), o []"""
+    if looks_like_json(full_text):
+        data = parse_json_response(full_text)
+        if data is not None and isinstance(data.get('section_errors'), list):
+            return [error for error in data['section_errors'] if isinstance(error, dict)]
+    return []
+
+
+class StoryboardStreamParser:
+    """Parser incremental del storyboard: biblia en cuanto se cierra, y líneas completas.
+
+    Si la respuesta es JSON (STORYBOARD_SCHEMA) cada toma se convierte en su fila
+    en cuanto su objeto se cierra; si no, se parsea el formato de texto.
+    """
+
+    def __init__(self):
+        self.bible = {}
+        self.story_lines = []
+        self._lines = LineBuffer()
+        self._bible_lines = None
+        self._bible_done = False
+        self._json = None
+        self._stream = JsonStreamParser()
+
+    def _feed_json(self, delta):
+        bible_ready = False
+        for key, value in self._stream.feed(delta):
+            if key == 'bible':
+                self.bible = bible_from_json(value)
+                bible_ready = True
+            elif key == 'shots' and isinstance(value, dict):
+                self.story_lines.append(storyboard_line(value))
+        return bible_ready
+
+    def _consume(self, line):
+        stripped = line.strip()
+        if not self._bible_done and BIBLE_START in stripped:
+            # Igual que storyboard_display_text: lo previo a la biblia no se muestra
+            self._bible_lines = []
+            self.story_lines = []
+        elif self._bible_lines is not None and BIBLE_END in stripped:
+            self.bible = parse_bible_lines(self._bible_lines)
+            self._bible_lines = None
+            self._bible_done = True
+            return True
+        elif self._bible_lines is not None:
+            self._bible_lines.append(line)
+        else:
+            self.story_lines.append(line)
+        return False
+
+    def feed(self, delta):
+        """Procesa un fragmento; devuelve True si la biblia acaba de completarse"""
+        if self._json is None:
+            pending = self._stream.text + delta
+            if not pending.strip():
+                self._stream.feed(delta)
+                return False
+            self._json = looks_like_json(pending)
+            if not self._json:
+                # Lo acumulado mientras se decidía el modo pasa al parser de texto
+                delta, self._stream = pending, JsonStreamParser()
+        if self._json:
+            return self._feed_json(delta)
+        bible_ready = False
+        for line in self._lines.feed(delta):
+            bible_ready = self._consume(line) or bible_ready
+        return bible_ready
+
+    def close(self):
+        if self._json:
+            return False
+        bible_ready = False
+        for line in self._lines.flush():
+            bible_ready = self._consume(line) or bible_ready
+        return bible_ready
+
+    @property
+    def display_text(self):
+        return '\n'.join(self.story_lines).strip()
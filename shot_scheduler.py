@@ -0,0 +1,305 @@
+import csv
+import io
+
+import numpy as np
+
+# Planificador de cortes sobre la rejilla de beats: a partir de beats, compases y
+# envolvente de onsets calcula localmente los slots de toma (inicio/fin, energía,
+# tamaño de plano). Gemini solo rellena el contenido de cada slot. Los temas largos se
+# parten además en secciones musicales (novedad sobre la autosimilitud por compases)
+# que se storyboardean en paralelo.
+
+BEATS_PER_BAR = 4
+MIN_SHOT_SECONDS = 2.0
+MAX_SLOTS = 48
+EXPORT_FPS = 24
+
+# Secciones: duración mínima del tema para partirlo (por debajo compensa una sola llamada),
+# duración objetivo (fija cuántas se buscan), mínima entre fronteras, tope,
+# semianchura mínima del kernel de novedad (en compases), novedad normalizada mínima de una
+# frontera (el ruido de un tema homogéneo queda por debajo de 0.3) y similitud para repetir etiqueta
+MIN_SECTIONED_SECONDS = 180.0
+TARGET_SECTION_SECONDS = 60.0
+MIN_SECTION_SECONDS = 20.0
+MAX_SECTIONS = 8
+NOVELTY_MIN_BARS = 2
+NOVELTY_THRESHOLD = 0.35
+SECTION_REPEAT_SIMILARITY = 0.8
+
+ENERGY_LEVELS = ("low", "mid", "high")
+# Tamaño de plano sugerido por nivel de energía (claves de shot_angles)
+SHOT_SIZE_BY_ENERGY = {
+    "low": "Plano General (WS)",
+    "mid": "Plano Medio (MS)",
+    "high": "Primer Plano (CU)",
+}
+
+
+def downbeat_times(beat_times, onset_env, sr, hop_length, beats_per_bar=BEATS_PER_BAR):
+    """Tiempos de inicio de compás: la fase de beat con mayor fuerza de onset media"""
+    beat_times = np.asarray(beat_times, dtype=np.float64)
+    if len(beat_times) < beats_per_bar:
+        return beat_times[:1]
+    frames = np.minimum(np.round(beat_times * sr / hop_length).astype(np.int64), len(onset_env) - 1)
+    strength = np.asarray(onset_env, dtype=np.float64)[frames]
+    pad = -len(strength) % beats_per_bar
+    by_phase = np.pad(strength, (0, pad), constant_values=np.nan).reshape(-1, beats_per_bar)
+    phase = int(np.nanargmax(np.nanmean(by_phase, axis=0)))
+    return beat_times[phase::beats_per_bar]
+
+
+def _cut_times(beat_times, downbeats, duration, min_shot_seconds, max_slots):
+    # Sin beats detectables (audio ambiental, voz) se cae a una rejilla fija
+    if len(beat_times) < 2 or len(downbeats) < 2:
+        length = max(min_shot_seconds, duration / max_slots)
+        return np.append(np.arange(0.0, duration, length), duration)
+    bar_seconds = float(np.median(np.diff(downbeats)))
+    bars_per_shot = max(1, int(np.ceil(min_shot_seconds / bar_seconds)),
+                        int(np.ceil(len(downbeats) / max_slots)))
+    cuts = downbeats[::bars_per_shot]
+    cuts = cuts[(cuts > 0) & (cuts < duration)]
+    # El primer slot abarca la intro hasta el primer corte; uno demasiado corto se fusiona
+    cuts = np.concatenate(([0.0], cuts, [duration]))
+    if len(cuts) > 2 and cuts[1] < min_shot_seconds / 2:
+        cuts = np.delete(cuts, 1)
+    if len(cuts) > 2 and duration - cuts[-2] < min_shot_seconds / 2:
+        cuts = np.delete(cuts, -2)
+    return cuts
+
+
+def schedule_shots(features, beats_per_bar=BEATS_PER_BAR, min_shot_seconds=MIN_SHOT_SECONDS, max_slots=MAX_SLOTS):
+    """Lista de slots {index, start, end, energy, level, shot_size} que cubre todo el track"""
+    duration = float(features['duration'])
+    if duration <= 0:
+        return []
+    sr, hop_length = features['sr'], features['hop_length']
+    onset_env = np.asarray(features['onset_env'], dtype=np.float64)
+    beat_times = np.asarray(features['beat_times'], dtype=np.float64)
+
+    downbeats = downbeat_times(beat_times, onset_env, sr, hop_length, beats_per_bar)
+    cuts = _cut_times(beat_times, downbeats, duration, min_shot_seconds, max_slots)
+
+    # Energía media de onsets por slot en una sola pasada (reduceat sobre los frames de corte)
+    frames = np.minimum(np.round(cuts * sr / hop_length).astype(np.int64), len(onset_env))
+    starts = frames[:-1]
+    lengths = np.maximum(frames[1:] - starts, 1)
+    sums = np.add.reduceat(np.append(onset_env, 0.0), starts)
+    energy = sums / lengths
+    peak = energy.max() if len(energy) else 0.0
+    energy = energy / peak if peak > 0 else np.zeros_like(energy)
+    levels = np.digitize(energy, np.quantile(energy, [1 / 3, 2 / 3])) if len(energy) > 2 else np.ones(len(energy), dtype=int)
+
+    return [
+        {
+            'index': i + 1,
+            'start': float(cuts[i]),
+            'end': float(cuts[i + 1]),
+            'energy': round(float(energy[i]), 3),
+            'level': ENERGY_LEVELS[levels[i]],
+            'shot_size': SHOT_SIZE_BY_ENERGY[ENERGY_LEVELS[levels[i]]],
+        }
+        for i in range(len(cuts) - 1)
+    ]
+
+
+def _bar_grid(features, duration, beats_per_bar):
+    # Compases detectados; sin beats (o muy pocos) se cae a una rejilla fija de 2 s
+    onset_env = np.asarray(features['onset_env'], dtype=np.float64)
+    downbeats = downbeat_times(features['beat_times'], onset_env, features['sr'], features['hop_length'],
+                               beats_per_bar)
+    downbeats = downbeats[(downbeats > 0) & (downbeats < duration)]
+    if len(downbeats) < 8:
+        downbeats = np.arange(MIN_SHOT_SECONDS, duration, MIN_SHOT_SECONDS)
+    grid = np.concatenate(([0.0], downbeats, [duration]))
+    # Tramos sin beats (intro ambiental, silencios) se parten en compases de duración típica
+    bar_seconds = float(np.median(np.diff(grid)))
+    pieces = np.maximum(1, np.round(np.diff(grid) / bar_seconds)).astype(np.int64)
+    if (pieces > 1).any():
+        steps = np.repeat(np.diff(grid) / pieces, pieces)
+        grid = np.concatenate(([0.0], np.cumsum(steps)))
+        grid[-1] = duration
+    return grid
+
+
+def _bar_features(features, grid):
+    # Vector por compás: log-mel medio (si hay resumen tímbrico) y energía de onsets
+    sr, hop_length = features['sr'], features['hop_length']
+    onset_env = np.asarray(features['onset_env'], dtype=np.float64)
+    frames = np.minimum(np.round(grid * sr / hop_length).astype(np.int64), len(onset_env) - 1)
+    lengths = np.maximum(np.diff(frames), 1)
+    energy = np.add.reduceat(onset_env, frames[:-1]) / lengths
+    energy[np.diff(frames) == 0] = onset_env[frames[:-1][np.diff(frames) == 0]]
+    columns = [np.log1p(energy)[:, None]]
+    timbre = features.get('timbre')
+    if timbre is not None and len(timbre):
+        timbre = np.asarray(timbre, dtype=np.float64)
+        centers = (np.arange(len(timbre)) + 0.5) * features['timbre_hop']
+        rows = np.minimum(np.searchsorted(centers, grid), len(timbre) - 1)
+        counts = np.diff(rows)
+        means = np.add.reduceat(timbre, rows[:-1], axis=0) / np.maximum(counts, 1)[:, None]
+        # Compases más cortos que la ventana tímbrica: la ventana que los contiene
+        means[counts <= 0] = timbre[rows[:-1][counts <= 0]]
+        columns.append(means)
+    bars = np.hstack(columns)
+    bars = (bars - bars.mean(axis=0)) / (bars.std(axis=0) + 1e-9)
+    return bars, energy
+
+
+def _novelty(bars, half_width):
+    # Novedad de Foote: kernel en tablero de ajedrez (con ventana gaussiana) deslizado
+    # por la diagonal de la matriz de autosimilitud (coseno) entre compases, normalizada
+    # por la masa del kernel (1 = dos bloques idénticos por dentro y opuestos entre sí)
+    unit = bars / (np.linalg.norm(bars, axis=1, keepdims=True) + 1e-9)
+    similarity = np.pad(unit @ unit.T, half_width)
+    offsets = np.arange(-half_width, half_width) + 0.5
+    taper = np.exp(-0.5 * (offsets / (0.5 * half_width)) ** 2)
+    kernel = np.outer(np.sign(offsets) * taper, np.sign(offsets) * taper)
+    kernel /= np.abs(kernel).sum()
+    # novelty[i]: frontera al inicio del compás i
+    return np.array([(kernel * similarity[i:i + 2 * half_width, i:i + 2 * half_width]).sum()
+                     for i in range(len(bars) + 1)])
+
+
+def detect_sections(features, slots=None, beats_per_bar=BEATS_PER_BAR, min_track_seconds=MIN_SECTIONED_SECONDS,
+                    target_seconds=TARGET_SECTION_SECONDS, min_seconds=MIN_SECTION_SECONDS, max_sections=MAX_SECTIONS):
+    """Secciones musicales {index, start, end, label, energy, level} que cubren todo el track.
+
+    Solo se parten los temas de `min_track_seconds` o más. Las fronteras son los picos de
+    novedad más fuertes (uno por cada `target_seconds` de audio, separados al menos
+    `min_seconds`); con `slots` se ajustan al corte más cercano para que ningún slot quede
+    partido. Secciones parecidas comparten etiqueta (A, B, A...).
+    """
+    duration = float(features['duration'])
+    if duration <= 0:
+        return []
+    grid = _bar_grid(features, duration, beats_per_bar)
+    bars, bar_energy = _bar_features(features, grid)
+    wanted = min(max_sections, int(np.ceil(duration / target_seconds))) - 1 if duration >= min_track_seconds else 0
+
+    boundaries = []
+    if wanted > 0 and len(bars) >= 2 * NOVELTY_MIN_BARS:
+        bar_seconds = float(np.median(np.diff(grid)))
+        half_width = max(NOVELTY_MIN_BARS, int(round(min_seconds / bar_seconds / 2)))
+        novelty = _novelty(bars, half_width)
+        for i in np.argsort(-novelty, kind="stable"):
+            t = float(grid[i])
+            if novelty[i] < NOVELTY_THRESHOLD or len(boundaries) == wanted:
+                break
+            if min(t, duration - t) >= min_seconds and all(abs(t - b) >= min_seconds for b in boundaries):
+                boundaries.append(t)
+    # Sin estructura suficiente (tema homogéneo) se parte la sección más larga por el
+    # compás más próximo a su mitad: los temas largos siempre se reparten
+    while len(boundaries) < wanted:
+        edges = [0.0] + sorted(boundaries) + [duration]
+        longest = int(np.argmax(np.diff(edges)))
+        start, end = edges[longest], edges[longest + 1]
+        if end - start < 2 * min_seconds:
+            break
+        boundaries.append(float(grid[np.argmin(np.abs(grid - (start + end) / 2))]))
+    if slots and boundaries:
+        cuts = np.array([s['start'] for s in slots[1:]])
+        boundaries = {float(cuts[np.argmin(np.abs(cuts - b))]) for b in boundaries} if len(cuts) else set()
+    edges = [0.0] + sorted(boundaries) + [duration]
+
+    # Energía y vector medio por sección (compases cuyo inicio cae dentro)
+    owner = np.searchsorted(edges, grid[:-1], side="right") - 1
+    energy = np.array([bar_energy[owner == k].mean() if (owner == k).any() else 0.0 for k in range(len(edges) - 1)])
+    peak = energy.max()
+    energy = energy / peak if peak > 0 else energy
+    levels = np.digitize(energy, [0.55, 0.8])
+    labels, references = [], []
+    for k in range(len(edges) - 1):
+        mean = bars[owner == k].mean(axis=0) if (owner == k).any() else np.zeros(bars.shape[1])
+        mean = mean / (np.linalg.norm(mean) + 1e-9)
+        scores = [float(mean @ ref) for ref in references]
+        if scores and max(scores) >= SECTION_REPEAT_SIMILARITY:
+            labels.append(chr(ord("A") + int(np.argmax(scores))))
+        else:
+            labels.append(chr(ord("A") + len(references)))
+            references.append(mean)
+    return [
+        {
+            'index': k + 1,
+            'start': edges[k],
+            'end': edges[k + 1],
+            'label': labels[k],
+            'energy': round(float(energy[k]), 3),
+            'level': ENERGY_LEVELS[levels[k]],
+        }
+        for k in range(len(edges) - 1)
+    ]
+
+
+def section_slots(sections, slots):
+    """Slots de cada sección (por su inicio), en el mismo orden que `sections`"""
+    starts = np.array([s['start'] for s in slots])
+    edges = np.array([sec['start'] for sec in sections[1:]])
+    owner = np.searchsorted(edges, starts, side="right")
+    return [[slot for slot, k in zip(slots, owner.tolist()) if k == i] for i in range(len(sections))]
+
+
+def format_time(seconds):
+    minutes, secs = divmod(seconds, 60)
+    return f"{int(minutes)}:{secs:05.2f}"
+
+
+def slot_table(slots):
+    """Tabla compacta de slots para el prompt: una línea por slot"""
+    return "\n".join(
+        f"{s['index']} | {format_time(s['start'])}-{format_time(s['end'])} | {s['level']} | {s['shot_size']}"
+        for s in slots
+    )
+
+
+def parse_slot_line(line):
+    """Fila '#n | Acción | Imagen | Movimiento | Mood' -> (n, [campos]), o None"""
+    parts = [p.strip() for p in line.strip().strip('|').split('|')]
+    if len(parts) < 2:
+        return None
+    number = parts[0].lstrip('#').strip()
+    if not number.isdigit():
+        return None
+    return int(number), parts[1:]
+
+
+def merge_storyboard(slots, text):
+    """Storyboard en tabla Markdown: tiempos locales + contenido generado para cada slot"""
+    filled = {}
+    for line in text.split('\n'):
+        row = parse_slot_line(line)
+        if row is not None:
+            filled.setdefault(row[0], row[1])
+    if not filled:
+        return None
+    lines = [
+        "| # | Tiempo | Plano | Acción | Prompt de Imagen | Movimiento | Mood |",
+        "|---|---|---|---|---|---|---|",
+    ]
+    for s in slots:
+        fields = (filled.get(s['index'], []) + ["", "", "", ""])[:4]
+        lines.append(f"| {s['index']} | {format_time(s['start'])}-{format_time(s['end'])} | {s['shot_size']} | "
+                     + " | ".join(fields) + " |")
+    return "\n".join(lines)
+
+
+def timecode(seconds, fps=EXPORT_FPS):
+    frames = int(round(seconds * fps))
+    hours, rest = divmod(frames, 3600 * fps)
+    minutes, rest = divmod(rest, 60 * fps)
+    secs, frame = divmod(rest, fps)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}:{frame:02d}"
+
+
+def cut_list_csv(slots, fps=EXPORT_FPS):
+    """Lista de cortes para edición (frames y timecode a `fps`)"""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["shot", "start_s", "end_s", "start_frame", "end_frame", "start_tc", "end_tc", "energy", "shot_size"])
+    for s in slots:
+        writer.writerow([
+            s['index'], f"{s['start']:.3f}", f"{s['end']:.3f}",
+            int(round(s['start'] * fps)), int(round(s['end'] * fps)),
+            timecode(s['start'], fps), timecode(s['end'], fps),
+            s['energy'], s['shot_size'],
+        ])
+    return out.getvalue()
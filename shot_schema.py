@@ -0,0 +1,146 @@
+import json
+
+# Esquemas JSON compartidos por los motores (salida estructurada) y parser incremental
+# que entrega cada toma en cuanto su objeto JSON se cierra en el stream.
+# Los esquemas son JSON Schema estricto (OpenAI strict / Gemini response_json_schema).
+
+
+def _object(properties, description=None):
+    schema = {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+    if description:
+        schema["description"] = description
+    return schema
+
+
+def _text(description):
+    return {"type": "string", "description": description}
+
+
+MOMENT_SCHEMA = _object({
+    "action": _text("Descripción técnica de la acción en una frase"),
+    "char": _text("Rasgos físicos del personaje (idénticos en cada toma)"),
+    "wardrobe": _text("Detalles del vestuario (idénticos en cada toma)"),
+})
+
+BIBLE_SCHEMA = _object({
+    "location": _text("Where is this taking place?"),
+    "character": _text("Who is the protagonist? (Physical traits)"),
+    "wardrobe": _text("What are they wearing?"),
+    "epoch": _text("When is this happening? (Past, Present, Future, Specific Year)"),
+})
+
+STORYBOARD_SHOT_SCHEMA = _object({
+    "slot": {"type": "integer", "description": "Slot number (or shot number when no slots are given)"},
+    "timestamp": _text("Start time, e.g. 0:05"),
+    "action": _text("Scene action (English)"),
+    "image_prompt": _text("Detailed visual description, no camera movement"),
+    "movement_prompt": _text("Specific technical camera movement instruction"),
+    "mood": _text("Mood/Atmosphere"),
+})
+
+# (nombre, esquema) tal como se pasa a llm_engines y al cliente de Gemini
+MOMENTS_SCHEMA = ("moments", _object({"moments": {"type": "array", "items": MOMENT_SCHEMA}}))
+STORYBOARD_SCHEMA = ("storyboard", _object({
+    "bible": BIBLE_SCHEMA,
+    "shots": {"type": "array", "items": STORYBOARD_SHOT_SCHEMA},
+}))
+# Storyboard por secciones: primera pasada solo con la biblia y una llamada por sección
+# solo con sus tomas (la biblia ya está fijada)
+BIBLE_ONLY_SCHEMA = ("production_bible", _object({"bible": BIBLE_SCHEMA}))
+SECTION_SHOTS_SCHEMA = ("section_shots", _object({
+    "shots": {"type": "array", "items": STORYBOARD_SHOT_SCHEMA},
+}))
+
+
+def looks_like_json(text):
+    """La respuesta empieza como objeto JSON (admite bloque ```json)"""
+    stripped = text.lstrip()
+    return stripped.startswith("{") or stripped.startswith("```")
+
+
+class JsonStreamParser:
+    """Extrae valores completos de un objeto JSON que llega por fragmentos.
+
+    Entrega (clave, valor) por cada elemento objeto de un array de primer nivel
+    (p. ej. cada toma de "shots") y por cada objeto de primer nivel (p. ej. "bible")
+    en cuanto se cierra, sin esperar al final de la respuesta. El texto previo al
+    primer '{' (vallas ```json) se ignora.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        self._key = None
+        self._value_start = None
+        self.done = False
+
+    def feed(self, delta):
+        self._text += delta
+        items = []
+        text = self._text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        self._last_string = text[self._string_start:i + 1]
+                continue
+            if self.done or (not self._stack and c != "{"):
+                continue
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == ":" and len(self._stack) == 1:
+                self._key = json.loads(self._last_string)
+            elif c in "{[":
+                self._stack.append(c)
+                depth = len(self._stack)
+                if c == "{" and (depth == 2 or (depth == 3 and self._stack[1] == "[")):
+                    self._value_start = i
+            elif c in "}]":
+                depth = len(self._stack)
+                if c == "}" and (depth == 2 or (depth == 3 and self._stack[1] == "[")) and self._value_start is not None:
+                    try:
+                        items.append((self._key, json.loads(text[self._value_start:i + 1])))
+                    except ValueError:
+                        pass
+                    self._value_start = None
+                self._stack.pop()
+                if not self._stack:
+                    self.done = True
+        self._pos = len(text)
+        return items
+
+    @property
+    def text(self):
+        return self._text
+
+
+def parse_json_response(text):
+    """Objeto JSON de una respuesta completa (tolerando vallas ```json), o None"""
+    stripped = text.strip()
+    if stripped.startswith("```"):
+        stripped = stripped.split("\n", 1)[-1].rsplit("```", 1)[0]
+    start, end = stripped.find("{"), stripped.rfind("}")
+    if start < 0 or end < start:
+        return None
+    try:
+        data = json.loads(stripped[start:end + 1])
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
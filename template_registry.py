@@ -0,0 +1,203 @@
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+
+# Registro compilado de plantillas: se carga una vez desde prompt_templates.json,
+# se valida y precalcula los atributos por preset en tablas indexadas.
+
+TEMPLATES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt_templates.json")
+
+# Secciones obligatorias y su tipo (dict clave -> descripción, o lista de nombres)
+SCHEMA = {
+    "director_styles": dict,
+    "lens_presets": dict,
+    "camera_movements": dict,
+    "film_stocks": list,
+    "shot_angles": dict,
+    "color_palettes": dict,
+}
+
+ANAMORPHIC_ASPECT = "2.76:1 (Ultra Panavision)"
+SPHERICAL_ASPECT = "1.43:1 (IMAX Full)"
+
+# Segundos entre comprobaciones del mtime (os.stat cuesta más que generar un prompt)
+RELOAD_CHECK_INTERVAL = 1.0
+
+# Entradas libres (fuera del catálogo) memorizadas: acotadas, llegan de la interfaz
+FREE_CACHE_SIZE = 1024
+STYLE_CACHE_SIZE = 4096
+
+# Esquemas de iluminación Mermaid por tipo de rig
+LIGHTING_RIGS = {
+    "natural": "    SUN[Fuente de Luz Natural] --> SUB\n    BOUNCE[Rebotador Muslin] --> SUB",
+    "halo": "    HALO[Luz Halo Cenital] --> SUB\n    BACK[Contraluz de Recorte] --> SUB",
+    "haze": "    BLOOM[Luz Sobreexpuesta (Haze)] --> SUB\n    BACK[Contraluz Fuerte] --> SUB",
+    "fire": "    FIRE[Luz de Fuego/Velas] --> SUB\n    SIDE[Luz Lateral Natural] --> SUB",
+    "three_point": "    KEY[Luz Principal] --> SUB\n    FILL[Luz de Relleno] --> SUB\n    RIM[Luz de Recorte] --> SUB",
+}
+
+
+class TemplateSchemaError(ValueError):
+    pass
+
+
+def validate_templates(data):
+    """Valida la estructura de prompt_templates.json; lanza TemplateSchemaError"""
+    if not isinstance(data, dict):
+        raise TemplateSchemaError("La raíz de las plantillas debe ser un objeto JSON.")
+    for section, kind in SCHEMA.items():
+        if section not in data:
+            raise TemplateSchemaError(f"Falta la sección '{section}'.")
+        value = data[section]
+        if not isinstance(value, kind) or not value:
+            raise TemplateSchemaError(f"La sección '{section}' debe ser un {kind.__name__} no vacío.")
+        items = value.items() if kind is dict else ((v, v) for v in value)
+        for key, text in items:
+            if not isinstance(key, str) or not isinstance(text, str) or not key.strip():
+                raise TemplateSchemaError(f"Entrada inválida en '{section}': {key!r}")
+    return data
+
+
+def is_anamorphic_lens(lens):
+    return "Anamórfico" in lens or "Anamorphic" in lens
+
+
+def lighting_rig_for(director):
+    """Rig de iluminación para una firma de director (clave o descripción)"""
+    if "Natural" in director or "Deakins" in director or "Naturalista" in director:
+        return "natural"
+    if "Richardson" in director:
+        return "halo"
+    if "Spielberg" in director:
+        return "haze"
+    if "Ridley Scott" in director:
+        return "fire"
+    return "three_point"
+
+
+def engine_suffix_for(engine, is_anamorphic):
+    if engine == "Midjourney":
+        ratio = "2.76:1" if is_anamorphic else "1.43:1"
+        return f" --ar {ratio} --v 6 --stylize 250"
+    if engine == "DALL-E 3":
+        return " Wide-screen cinematic mode, hyper-photorealistic, maintain exact visual continuity with previous frames."
+    return ""
+
+
+class LensInfo:
+    __slots__ = ("is_anamorphic", "aspect_ratio", "technical_prefix", "visual_traits")
+
+    def __init__(self, lens):
+        self.is_anamorphic = is_anamorphic_lens(lens)
+        self.aspect_ratio = ANAMORPHIC_ASPECT if self.is_anamorphic else SPHERICAL_ASPECT
+        self.technical_prefix = f"Shot on IMAX MSM 9802 15/70mm film, {lens} lenses, "
+        self.visual_traits = (
+            "Key visual traits: "
+            f"{'oval bokeh, horizontal lens flares, ' if self.is_anamorphic else ''}"
+            "extreme detail, naturalistic grain, high dynamic range, 12k resolution texture, visceral atmosphere."
+        )
+
+    def tail(self, engine):
+        """Cola del prompt (rasgos + sufijo del motor destino)"""
+        return _lens_tail(self, engine)
+
+
+@lru_cache(maxsize=STYLE_CACHE_SIZE)
+def _lens_tail(info, engine):
+    return info.visual_traits + engine_suffix_for(engine, info.is_anamorphic)
+
+
+@lru_cache(maxsize=FREE_CACHE_SIZE)
+def _free_lens(lens):
+    # Lente libre (no preset): se compila una vez mientras siga en uso
+    return LensInfo(lens)
+
+
+@lru_cache(maxsize=FREE_CACHE_SIZE)
+def _free_lighting_rig(director):
+    return LIGHTING_RIGS[lighting_rig_for(director)]
+
+
+class CompiledRegistry:
+    """Plantillas validadas + tablas de búsqueda precalculadas por preset"""
+
+    def __init__(self, templates, mtime=None):
+        self.templates = validate_templates(templates)
+        self.mtime = mtime
+        self.lenses = {lens: LensInfo(lens) for lens in templates["lens_presets"]}
+        # El rig se indexa tanto por clave como por descripción del director,
+        # ya que generate_prompt recibe la descripción.
+        self.lighting = {}
+        for key, desc in templates["director_styles"].items():
+            rig = LIGHTING_RIGS[lighting_rig_for(key + " " + desc)]
+            self.lighting[key] = rig
+            self.lighting[desc] = rig
+
+    def lens_info(self, lens):
+        info = self.lenses.get(lens)
+        return info if info is not None else _free_lens(lens)
+
+    def lighting_rig(self, director):
+        rig = self.lighting.get(director)
+        return rig if rig is not None else _free_lighting_rig(director)
+
+    def style(self, director, lens, stock, engine):
+        """(relación de aspecto, bloque técnico final, rig): solo depende de los presets"""
+        return _compiled_style(self, director, lens, stock, engine)
+
+
+@lru_cache(maxsize=STYLE_CACHE_SIZE)
+def _compiled_style(registry, director, lens, stock, engine):
+    # El registro forma parte de la clave: recargar prompt_templates.json invalida los estilos
+    info = registry.lens_info(lens)
+    block = (
+        f"{director}. {info.technical_prefix}{stock} film stock. "
+        f"Aspect ratio {info.aspect_ratio}.. {info.tail(engine)}"
+    )
+    return info.aspect_ratio, block, registry.lighting_rig(director)
+
+
+def load_registry(path=TEMPLATES_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return CompiledRegistry(data, mtime=os.stat(path).st_mtime_ns)
+
+
+_registries = {}
+_next_check = {}
+_registry_lock = threading.Lock()
+
+
+def get_registry(path=TEMPLATES_PATH):
+    """Registro compartido del proceso; se recarga si cambia el mtime del JSON.
+
+    Si la nueva versión del archivo no pasa la validación se mantiene la anterior.
+    """
+    current = _registries.get(path)
+    now = time.monotonic()
+    if current is not None and now < _next_check.get(path, 0.0):
+        return current
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+    _next_check[path] = now + RELOAD_CHECK_INTERVAL
+    if current is not None and (mtime is None or current.mtime == mtime):
+        return current
+    with _registry_lock:
+        current = _registries.get(path)
+        if current is None or current.mtime != mtime:
+            try:
+                current = _registries[path] = load_registry(path)
+            except (OSError, ValueError):
+                if current is None:
+                    raise
+                # Versión rota en disco: se sigue sirviendo la anterior sin reintentar en cada llamada
+                current.mtime = mtime
+        return current
+
+
+def get_templates():
+    return get_registry().templates
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+# Sin logs de consumo ni de trazas fuera del directorio temporal de cada prueba
+os.environ["LLM_USAGE_LOG"] = ""
+os.environ["PERF_TRACE_LOG"] = ""
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path, monkeypatch):
+    """Cachés en un directorio temporal y cupo/breakers de proveedor limpios en cada prueba"""
+    import audio_cache
+    import llm_cache
+    from resilience import PROVIDER_GUARD
+
+    monkeypatch.setenv("LLM_CACHE_PATH", str(tmp_path / "llm_cache.sqlite3"))
+    monkeypatch.setenv("AUDIO_CACHE_PATH", str(tmp_path / "audio_cache.sqlite3"))
+    monkeypatch.setattr(audio_cache, "_store", None)
+    monkeypatch.setattr(llm_cache, "_cache", None)
+    PROVIDER_GUARD.clear()
+    yield
+    PROVIDER_GUARD.clear()
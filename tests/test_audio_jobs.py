@@ -0,0 +1,63 @@
+import io
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import shot_scheduler
+from audio_analysis import analyze_audio
+from audio_cache import audio_digest, get_audio_store
+from audio_jobs import FAILED, AudioJob, AudioJobQueue
+from fixtures import click_track
+
+
+@pytest.fixture
+def track():
+    data = click_track(20.0).getvalue()
+    return data, analyze_audio(io.BytesIO(data))
+
+
+@pytest.fixture
+def queue():
+    queue = AudioJobQueue(workers=1, storyboard_concurrency=2)
+    yield queue
+    queue.shutdown()
+
+
+def _wait_finished(queue, batch, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        jobs = queue.jobs(batch)
+        if all(job["status"] in ("done", "failed", "cancelled") for job in jobs):
+            return jobs
+        time.sleep(0.01)
+    raise AssertionError(f"trabajos sin terminar: {queue.jobs(batch)}")
+
+
+def _failing_schedule(features):
+    raise ValueError("sin beats")
+
+
+def test_schedule_failure_on_cached_features_fails_the_job(track, queue, monkeypatch):
+    data, features = track
+    get_audio_store().put_features(audio_digest(data), features)
+    monkeypatch.setattr(shot_scheduler, "schedule_shots", _failing_schedule)
+    queue.submit("lote", "pista.wav", data, "audio/wav", api_key="clave")
+    [job] = _wait_finished(queue, "lote")
+    assert job["status"] == FAILED
+    assert "sin beats" in job["error"]
+
+
+def test_schedule_failure_after_analysis_fails_the_job(track, queue, monkeypatch):
+    data, features = track
+    monkeypatch.setattr(shot_scheduler, "schedule_shots", _failing_schedule)
+    # Resultado del pool de procesos entregado al callback, sin lanzar procesos hijos
+    future = Future()
+    future.set_result((features, 0.5))
+    job = AudioJob(1, "lote", "pista.wav", "audio/wav", audio_digest(data), data)
+    queue._jobs[job.id] = job
+    queue._on_analysis(job, "clave", future)
+    [snapshot] = _wait_finished(queue, "lote")
+    assert snapshot["status"] == FAILED
+    assert "sin beats" in snapshot["error"]
+    assert get_audio_store().get_features(job.digest) is not None
@@ -0,0 +1,110 @@
+import io
+
+import pytest
+from google.genai.errors import ClientError
+
+import shot_scheduler
+from audio_analysis import analyze_audio
+from audio_storyboard import _file_missing, generate_storyboard
+from fake_llm import FAKE_SECRETS, FakeBehavior, fake_providers
+from fixtures import click_track
+from gemini_models import GEMINI_MODELS
+from shot_parsers import StoryboardStreamParser, storyboard_section_errors
+from shot_schema import parse_json_response
+from shot_scheduler import detect_sections, section_slots, schedule_shots
+
+
+@pytest.fixture(scope="module")
+def track():
+    audio = click_track(240.0)
+    features = analyze_audio(io.BytesIO(audio.getvalue()))
+    slots = schedule_shots(features)
+    sections = detect_sections(features, slots)
+    assert len(sections) >= 3
+    return audio, features, slots, sections
+
+
+def _storyboard(track, behavior, slots):
+    audio, features, _, sections = track
+    parser = StoryboardStreamParser()
+    with fake_providers(gemini_behavior=behavior):
+        text = generate_storyboard(FAKE_SECRETS["GOOGLE_API_KEY"], io.BytesIO(audio.getvalue()), "audio/wav",
+                                   features["duration"], on_text=parser.feed, slots=slots, sections=sections)
+    return text, parser
+
+
+def test_failed_section_is_reported_and_the_rest_kept(track):
+    _, _, slots, sections = track
+    failed = sections[1]
+    behavior = FakeBehavior(latency_s=0.0, chunk_delay_s=0.0, fail_sections={failed['index']})
+    text, parser = _storyboard(track, behavior, slots)
+    [error] = storyboard_section_errors(text)
+    assert error["section"] == failed['index']
+    assert error["label"] == failed['label']
+    assert "overloaded" in error["error"]
+    own = section_slots(sections, slots)
+    filled = {shot["slot"] for shot in parse_json_response(text)["shots"]}
+    assert filled == {s['index'] for s in slots} - {s['index'] for s in own[1]}
+    # El parser incremental ignora la clave extra
+    assert len(parser.story_lines) == len(filled)
+
+
+def test_section_without_slots_is_not_requested(track):
+    _, _, slots, sections = track
+    own = section_slots(sections, slots)
+    kept = [slot for i, section_own in enumerate(own) if i != 1 for slot in section_own]
+    behavior = FakeBehavior(latency_s=0.0, chunk_delay_s=0.0)
+    text, _ = _storyboard(track, behavior, kept)
+    assert sections[1]['index'] not in behavior.section_requests
+    assert storyboard_section_errors(text) == []
+    assert {shot["slot"] for shot in parse_json_response(text)["shots"]} == {s['index'] for s in kept}
+
+
+
+def test_no_section_owning_slots_gives_an_empty_storyboard(track, monkeypatch):
+    _, _, slots, sections = track
+    monkeypatch.setattr(shot_scheduler, "section_slots", lambda sections, slots: [[] for _ in sections])
+    behavior = FakeBehavior(latency_s=0.0, chunk_delay_s=0.0)
+    text, parser = _storyboard(track, behavior, slots)
+    data = parse_json_response(text)
+    assert data["bible"] and data["shots"] == []
+    assert behavior.section_requests == []
+    assert parser.bible and parser.story_lines == []
+
+def test_missing_fresh_upload_is_uploaded_again(monkeypatch):
+    audio = click_track(10.0)
+    behavior = FakeBehavior(latency_s=0.0, chunk_delay_s=0.0)
+    with fake_providers(gemini_behavior=behavior) as (_, gemini):
+        stream = gemini.models.generate_content_stream
+        uploads = []
+        upload = gemini.files.upload
+        monkeypatch.setattr(gemini.files, "upload", lambda *args, **kwargs: uploads.append(1) or upload(*args, **kwargs))
+
+        def _stream(model, contents, config=None):
+            if len(uploads) == 1:
+                raise ClientError(404, {"error": {"code": 404, "message": "File files/fake not found.",
+                                                  "status": "NOT_FOUND"}})
+            return stream(model, contents, config)
+
+        monkeypatch.setattr(gemini.models, "generate_content_stream", _stream)
+        text = generate_storyboard(FAKE_SECRETS["GOOGLE_API_KEY"], io.BytesIO(audio.getvalue()), "audio/wav", 10.0)
+        model_id = GEMINI_MODELS.cached(FAKE_SECRETS["GOOGLE_API_KEY"], "audio")
+    assert len(uploads) == 2
+    assert parse_json_response(text)["shots"]
+    # El modelo sigue siendo el primero: el 404 era del archivo
+    assert model_id == "gemini-2.0-flash"
+
+
+def test_file_missing_needs_the_uploaded_resource():
+    from types import SimpleNamespace
+
+    upload = SimpleNamespace(name="files/abc123", uri="https://fake.invalid/v1beta/files/abc123")
+    cached = SimpleNamespace(file_data=SimpleNamespace(file_uri="https://fake.invalid/v1beta/files/abc123"))
+
+    def _error(code, message):
+        return ClientError(code, {"error": {"code": code, "message": message, "status": "X"}})
+
+    denied = _error(403, "You do not have permission to access the File abc123 or it may not exist.")
+    assert _file_missing(denied, upload) and _file_missing(denied, cached)
+    assert not _file_missing(_error(400, "Request file size exceeds the limit for files/abc123"), upload)
+    assert not _file_missing(_error(404, "models/gemini-9 is not found (profile)"), upload)
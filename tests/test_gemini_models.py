@@ -0,0 +1,43 @@
+import pytest
+from google.genai.errors import ClientError
+
+from gemini_models import GEMINI_MODELS, MODEL_CANDIDATES, GeminiModelUnavailable, generate_with_model, is_model_not_found
+
+API_KEY = "fake-google"
+
+
+def _error(code, message, status):
+    return ClientError(code, {"error": {"code": code, "message": message, "status": status}})
+
+
+@pytest.fixture(autouse=True)
+def resolved_models():
+    GEMINI_MODELS.clear()
+    yield
+    GEMINI_MODELS.clear()
+
+
+def test_model_not_found_needs_a_model_resource():
+    assert is_model_not_found(_error(404, "models/gemini-9 is not found for API version v1beta", "NOT_FOUND"))
+    assert not is_model_not_found(_error(404, "File files/abc123 not found.", "NOT_FOUND"))
+    assert not is_model_not_found(_error(400, "Request payload size exceeds the limit: 404 MB", "INVALID_ARGUMENT"))
+    assert not is_model_not_found(RuntimeError("Tool not found"))
+
+
+def test_missing_file_does_not_discard_the_model(monkeypatch):
+    model_id = MODEL_CANDIDATES["text"][0]
+    monkeypatch.setattr(GEMINI_MODELS, "resolve", lambda api_key, capability, client=None: model_id)
+    discarded = []
+
+    def _unavailable(api_key, capability, model):
+        discarded.append(model)
+        raise GeminiModelUnavailable(model)
+
+    monkeypatch.setattr(GEMINI_MODELS, "unavailable", _unavailable)
+
+    def _call(model):
+        raise _error(404, "File files/abc123 not found.", "NOT_FOUND")
+
+    with pytest.raises(ClientError):
+        generate_with_model(API_KEY, "text", _call)
+    assert discarded == []
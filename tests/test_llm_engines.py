@@ -0,0 +1,149 @@
+import threading
+import time
+
+import pytest
+
+import resilience
+from fake_llm import FAKE_SECRETS, FakeBehavior, FakeProviderError, fake_providers
+from llm_cache import get_response_cache
+from llm_engines import (FASTEST_ENGINE, PROVIDER_CONCURRENCY, _cache_model, _provider_slots, call_engine, complete,
+                         complete_stream, run_race)
+from perf_trace import trace
+from shot_parsers import has_moments
+from shot_schema import MOMENTS_SCHEMA
+
+ENGINE = "GPT-4o-mini (Fast)"
+
+
+def test_race_loser_stops_streaming():
+    # OpenAI responde entero a los 0.2 s; Gemini empieza antes pero tarda 0.05 s por
+    # fragmento, así que pierde la carrera a mitad de su stream
+    fast = FakeBehavior(latency_s=0.2, chunk_delay_s=0.0)
+    slow = FakeBehavior(latency_s=0.0, chunk_delay_s=0.05, chunk_chars=4)
+    with fake_providers(fast, slow):
+        engine, _ = run_race(["GPT-4o-mini (Fast)", "Gemini Flash (Free)"], "sys", "Escena 1", FAKE_SECRETS,
+                             hedge_delay=0)
+        assert engine == "GPT-4o-mini (Fast)"
+        time.sleep(0.2)
+        sent = slow.chunks_sent
+        time.sleep(0.3)
+        assert slow.chunks_sent == sent
+        assert 0 < sent < 20
+    assert _provider_slots["gemini"]._value == PROVIDER_CONCURRENCY["gemini"]
+
+
+def test_race_waits_for_provider_slot():
+    behavior = FakeBehavior(latency_s=0.0, chunk_delay_s=0.0)
+    slots = _provider_slots["openai"]
+    for _ in range(PROVIDER_CONCURRENCY["openai"]):
+        slots.acquire()
+    try:
+        # Sin hueco libre de OpenAI gana Gemini aunque arranque después
+        with fake_providers(behavior, behavior):
+            engine, _ = run_race(["GPT-4o-mini (Fast)", "Gemini Flash (Free)"], "sys", "Escena 1", FAKE_SECRETS,
+                                 hedge_delay=0.01)
+        assert engine == "Gemini Flash (Free)"
+    finally:
+        for _ in range(PROVIDER_CONCURRENCY["openai"]):
+            slots.release()
+
+
+def test_response_failing_validation_is_not_cached():
+    behavior = FakeBehavior(latency_s=0.0, chunk_delay_s=0.0)
+    with fake_providers(behavior, behavior):
+        for _ in range(2):
+            "".join(complete_stream(ENGINE, "sys", "Escena 1", FAKE_SECRETS, validate=lambda text: False))
+            complete(ENGINE, "sys", "Escena 2", FAKE_SECRETS, validate=lambda text: False)
+    assert behavior.calls == 4
+    assert get_response_cache().stats()["entries"] == 0
+
+
+def test_cached_response_failing_validation_is_a_miss():
+    cache = get_response_cache()
+    cache.put(ENGINE, _cache_model(ENGINE, None), "sys", "Escena 1", "sin momentos")
+    behavior = FakeBehavior(latency_s=0.0, chunk_delay_s=0.0)
+    with fake_providers(behavior, behavior):
+        text = "".join(complete_stream(ENGINE, "sys", "Escena 1", FAKE_SECRETS, validate=has_moments))
+    assert behavior.calls == 1 and has_moments(text)
+    # La respuesta válida sustituye a la entrada descartada
+    assert cache.get(ENGINE, _cache_model(ENGINE, None), "sys", "Escena 1") == text
+
+
+def test_race_cache_lookup_counts_once():
+    behavior = FakeBehavior(latency_s=0.0, chunk_delay_s=0.0)
+    pool = ["GPT-4o-mini (Fast)", "Gemini Flash (Free)"]
+    with fake_providers(behavior, behavior):
+        first = complete(FASTEST_ENGINE, "sys", "Escena 1", FAKE_SECRETS, race_pool=pool, hedge_delay=0)
+        second = complete(FASTEST_ENGINE, "sys", "Escena 1", FAKE_SECRETS, race_pool=pool, hedge_delay=0)
+    assert first == second
+    stats = get_response_cache().stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+@pytest.mark.parametrize("message, fallback", [
+    ("Invalid parameter: 'response_format' of type 'json_schema' is not supported with this model.", True),
+    ("This model's maximum context length is 128000 tokens.", False),
+])
+def test_only_schema_errors_fall_back_to_text(monkeypatch, message, fallback):
+    behavior = FakeBehavior(latency_s=0.0, chunk_delay_s=0.0)
+    with fake_providers(behavior, behavior) as (openai, _):
+        create = openai.chat.completions.create
+        requests = []
+
+        def _create(**kwargs):
+            requests.append("response_format" in kwargs)
+            if "response_format" in kwargs:
+                raise FakeProviderError(message, status_code=400)
+            return create(**kwargs)
+
+        monkeypatch.setattr(openai.chat.completions, "create", _create)
+        if fallback:
+            assert has_moments(call_engine(ENGINE, "sys", "Escena 1", FAKE_SECRETS, schema=MOMENTS_SCHEMA))
+        else:
+            with pytest.raises(FakeProviderError, match="context length"):
+                call_engine(ENGINE, "sys", "Escena 1", FAKE_SECRETS, schema=MOMENTS_SCHEMA)
+    assert requests == ([True, False] if fallback else [True])
+
+
+def _slot_free_while(target, wait_s):
+    # Lanza `target` en un hilo y devuelve si el semáforo de OpenAI estaba libre a los `wait_s`
+    worker = threading.Thread(target=target)
+    worker.start()
+    time.sleep(wait_s)
+    free = _provider_slots["openai"]._value == PROVIDER_CONCURRENCY["openai"]
+    worker.join()
+    return free
+
+
+def test_backoff_does_not_hold_the_provider_slot(monkeypatch):
+    behavior = FakeBehavior(latency_s=0.0, chunk_delay_s=0.0, failure_rate=1.0)
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt, error=None: 0.3)
+    errors = []
+
+    def _call():
+        try:
+            complete(ENGINE, "sys", "Escena 1", FAKE_SECRETS, use_cache=False)
+        except FakeProviderError as e:
+            errors.append(e)
+
+    with fake_providers(behavior, behavior):
+        assert _slot_free_while(_call, 0.15)
+    assert errors and behavior.calls == resilience.PROVIDER_GUARD.max_attempts
+
+
+def test_rate_limit_wait_does_not_hold_the_provider_slot():
+    behavior = FakeBehavior(latency_s=0.0, chunk_delay_s=0.0)
+    limits = {"openai": {"rpm": 120, "burst": 1}, "gemini": {"rpm": 120, "burst": 1}}
+    runs = []
+
+    def _call():
+        with trace("test") as run:
+            "".join(complete_stream(ENGINE, "sys", "Escena 2", FAKE_SECRETS, use_cache=False))
+        runs.append(run)
+
+    with fake_providers(behavior, behavior, rate_limits=limits):
+        "".join(complete_stream(ENGINE, "sys", "Escena 1", FAKE_SECRETS, use_cache=False))
+        # El segundo turno llega a los 0.5 s: mientras tanto el hueco sigue libre
+        assert _slot_free_while(_call, 0.25)
+    waits = {span["name"]: span["duration_s"] for span in runs[0].spans}
+    assert waits["provider.wait"] > 0.2 and waits["provider.slot"] < 0.1
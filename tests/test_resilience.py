@@ -0,0 +1,47 @@
+import pytest
+
+from llm_engines import EngineUnavailable, call_engine
+from resilience import CircuitOpen, ProviderGuard
+
+
+class _HttpError(RuntimeError):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+def _open_breaker(guard):
+    breaker = guard.breaker("gemini")
+    breaker.reset_seconds = 0.0
+    for _ in range(breaker.threshold):
+        guard.settle("gemini", "m", _HttpError(503))
+    return breaker
+
+
+def test_local_error_does_not_close_half_open_breaker():
+    guard = ProviderGuard()
+    breaker = _open_breaker(guard)
+    with pytest.raises(ValueError):
+        guard.call("gemini", "m", lambda: (_ for _ in ()).throw(ValueError("JSON inválido")))
+    # Sin veredicto: sigue sin cerrarse y la siguiente petición vuelve a ser de prueba
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+
+
+def test_non_retryable_provider_response_closes_breaker():
+    guard = ProviderGuard()
+    breaker = _open_breaker(guard)
+    with pytest.raises(_HttpError):
+        guard.call("gemini", "m", lambda: (_ for _ in ()).throw(_HttpError(400)))
+    assert breaker.state == "closed"
+
+
+def test_missing_key_fails_before_taking_a_token(monkeypatch):
+    from resilience import PROVIDER_GUARD
+
+    def _no_turn(*args):
+        raise CircuitOpen("gemini", 1.0)
+
+    monkeypatch.setattr(PROVIDER_GUARD, "acquire", _no_turn)
+    with pytest.raises(EngineUnavailable):
+        call_engine("Gemini Flash (Free)", "sys", "texto", {})
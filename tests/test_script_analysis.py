@@ -0,0 +1,31 @@
+from fake_llm import FAKE_SECRETS, FakeBehavior, fake_providers
+from script_analysis import analyze_scenes, split_scenes
+
+SCRIPT = "INT. HANGAR DE CARGA - NOCHE\nMax avanza hacia la compuerta mientras la alarma parpadea sin parar."
+
+
+def test_scene_failing_mid_stream_keeps_delivered_moments():
+    # Cinco momentos en JSON (~25 fragmentos de 24 caracteres): el stream se corta tras 12
+    behavior = FakeBehavior(latency_s=0.0, chunk_delay_s=0.0, fail_after_chunks=12)
+    delivered = []
+    with fake_providers(behavior, behavior):
+        moments, errors = analyze_scenes(split_scenes(SCRIPT), "sys", "GPT-4o-mini (Fast)", FAKE_SECRETS,
+                                         "Veterano", "Traje", use_cache=False,
+                                         on_moment=lambda scene, moment: delivered.append(moment))
+    assert list(errors) == [0]
+    assert 0 < len(delivered) < 5
+    # Sin momentos de fallback añadidos a los parciales ni duplicados
+    assert moments == delivered
+    assert all("esclusa" in m["action"] for m in moments)
+
+
+def test_scene_failing_before_any_moment_uses_fallback():
+    behavior = FakeBehavior(latency_s=0.0, chunk_delay_s=0.0, fail_after_chunks=0)
+    delivered = []
+    with fake_providers(behavior, behavior):
+        moments, errors = analyze_scenes(split_scenes(SCRIPT), "sys", "GPT-4o-mini (Fast)", FAKE_SECRETS,
+                                         "Veterano", "Traje", use_cache=False,
+                                         on_moment=lambda scene, moment: delivered.append(moment))
+    assert list(errors) == [0]
+    assert moments == delivered
+    assert moments and "compuerta" in moments[0]["action"]
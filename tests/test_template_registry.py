@@ -0,0 +1,25 @@
+import template_registry
+from template_registry import get_registry
+
+
+def test_free_inputs_do_not_grow_the_registry():
+    registry = get_registry()
+    lenses, lighting = dict(registry.lenses), dict(registry.lighting)
+    director = next(iter(registry.templates["director_styles"].values()))
+    stock = registry.templates["film_stocks"][0]
+    total = template_registry.STYLE_CACHE_SIZE + 100
+    for i in range(total):
+        registry.style(f"{director} #{i}", f"Lente libre {i}mm", stock, f"Motor {i}")
+    # Las tablas del catálogo no cambian; lo libre vive en memos acotadas
+    assert registry.lenses == lenses and registry.lighting == lighting
+    assert template_registry._compiled_style.cache_info().currsize <= template_registry.STYLE_CACHE_SIZE
+    assert template_registry._free_lens.cache_info().currsize <= template_registry.FREE_CACHE_SIZE
+    assert template_registry._lens_tail.cache_info().currsize <= template_registry.STYLE_CACHE_SIZE
+
+
+def test_free_lens_matches_catalogue_compilation():
+    registry = get_registry()
+    aspect, block, rig = registry.style("Dirección Naturalista", "Panavision Anamorphic libre", "Kodak", "Midjourney")
+    assert aspect == template_registry.ANAMORPHIC_ASPECT
+    assert block.endswith("--ar 2.76:1 --v 6 --stylize 250")
+    assert rig == template_registry.LIGHTING_RIGS["natural"]